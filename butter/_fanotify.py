@@ -4,13 +4,22 @@
 from .utils import PermissionError, UnknownError, CLOEXEC_DEFAULT
 from collections import namedtuple
 from os import O_RDONLY, O_WRONLY, O_RDWR
-from os import getpid, readlink
+from os import readlink
 from os import close
-from os.path import join
 from cffi import FFI
+import struct
+import array
 import errno
 
-READ_EVENTS_MAX = 10
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+READ_EVENTS_MAX = 1024 # events (and so fds) handed to us by a single read()
+
+# our own fd table, avoids a getpid() and path join per event
+PROC_FD_PATH = '/proc/self/fd/{}'
 
 ffi = FFI()
 ffi.cdef("""
@@ -30,6 +39,7 @@ ffi.cdef("""
 #define FAN_MARK_IGNORED_MASK ...
 #define FAN_MARK_IGNORED_SURV_MODIFY ...
 #define FAN_MARK_FLUSH ...
+#define FAN_MARK_FILESYSTEM ...
 
 #define FAN_ALL_MARK_FLAGS ...
 
@@ -44,8 +54,33 @@ ffi.cdef("""
 #define FAN_ONDIR ...
 #define FAN_EVENT_ON_CHILD ...
 
+// Directory entry events, only avalible with FAN_REPORT_FID or FAN_REPORT_DIR_FID
+#define FAN_ATTRIB ...
+#define FAN_MOVED_FROM ...
+#define FAN_MOVED_TO ...
+#define FAN_CREATE ...
+#define FAN_DELETE ...
+#define FAN_DELETE_SELF ...
+#define FAN_MOVE_SELF ...
+
 // FAN_CLOSE_WRITE|FAN_CLOSE_NOWRITE
 #define FAN_CLOSE ...
+// FAN_MOVED_FROM|FAN_MOVED_TO
+#define FAN_MOVE ...
+
+// Report file handles instead of fds (fanotify_init flags)
+#define FAN_REPORT_FID ...
+#define FAN_REPORT_DIR_FID ...
+#define FAN_REPORT_NAME ...
+#define FAN_REPORT_DFID_NAME ...
+
+// Info record types following the event metadata
+#define FAN_EVENT_INFO_TYPE_FID ...
+#define FAN_EVENT_INFO_TYPE_DFID_NAME ...
+#define FAN_EVENT_INFO_TYPE_DFID ...
+
+// fd of an event that reports a file handle instead
+#define FAN_NOFD ...
 
 // Access control flags
 #define FAN_ALLOW ...
@@ -74,13 +109,81 @@ struct fanotify_event_metadata {
 
 int fanotify_init(unsigned int flags, unsigned int event_f_flags);
 int fanotify_mark (int fanotify_fd, unsigned int flags, uint64_t mask, int dfd, const char *pathname);
+
+int butter_fsid(int fd, int32_t *fsid);
+int butter_open_by_handle_at(int mount_fd, const char *handle, int flags);
 """)
 
 C = ffi.verify("""
-#include <linux/fcntl.h>
+#ifndef _GNU_SOURCE
+#define _GNU_SOURCE /* open_by_handle_at */
+#endif
+#include <fcntl.h>
+#include <string.h>
+#include <stdint.h>
+#include <sys/vfs.h>
 #include <sys/fanotify.h>
+
+/* Older headers predate the FID reporting modes, the values are fixed by the kernel ABI */
+#ifndef FAN_ATTRIB
+#define FAN_ATTRIB 0x00000004
+#endif
+#ifndef FAN_MOVED_FROM
+#define FAN_MOVED_FROM 0x00000040
+#define FAN_MOVED_TO 0x00000080
+#define FAN_MOVE (FAN_MOVED_FROM | FAN_MOVED_TO)
+#endif
+#ifndef FAN_CREATE
+#define FAN_CREATE 0x00000100
+#define FAN_DELETE 0x00000200
+#define FAN_DELETE_SELF 0x00000400
+#define FAN_MOVE_SELF 0x00000800
+#endif
+#ifndef FAN_MARK_FILESYSTEM
+#define FAN_MARK_FILESYSTEM 0x00000100
+#endif
+#ifndef FAN_REPORT_FID
+#define FAN_REPORT_FID 0x00000200
+#endif
+#ifndef FAN_REPORT_DIR_FID
+#define FAN_REPORT_DIR_FID 0x00000400
+#define FAN_REPORT_NAME 0x00000800
+#define FAN_REPORT_DFID_NAME (FAN_REPORT_DIR_FID | FAN_REPORT_NAME)
+#endif
+#ifndef FAN_EVENT_INFO_TYPE_FID
+#define FAN_EVENT_INFO_TYPE_FID 1
+#endif
+#ifndef FAN_EVENT_INFO_TYPE_DFID_NAME
+#define FAN_EVENT_INFO_TYPE_DFID_NAME 2
+#define FAN_EVENT_INFO_TYPE_DFID 3
+#endif
+#ifndef FAN_NOFD
+#define FAN_NOFD -1
+#endif
+
+/* the fsid reported in fid info records is the f_fsid of statfs */
+int butter_fsid(int fd, int32_t *fsid){
+    struct statfs buf;
+    if (fstatfs(fd, &buf) < 0)
+        return -1;
+    memcpy(fsid, &buf.f_fsid, 2 * sizeof(int32_t));
+    return 0;
+};
+
+/* handle is a raw 'struct file_handle' copied straight out of an info record */
+int butter_open_by_handle_at(int mount_fd, const char *handle, int flags){
+    return open_by_handle_at(mount_fd, (struct file_handle *)handle, flags);
+};
 """, libraries=[], ext_package="butter")
 
+# Import the constants into the local namespace, the event properties and
+# info record parsing below refer to them directly
+_l = locals()
+for key in dir(C):
+    if key.startswith('FAN_'):
+        _l[key] = getattr(C, key)
+del key, _l
+
 def fanotify_init(flags=0, event_flags=O_RDONLY, closefd=CLOEXEC_DEFAULT):
     """Create a fanotify handle
     """
@@ -147,21 +250,37 @@ def fanotify_mark(fd, path, mask, flags, dfd=0):
             # If you are here, its a bug. send us the traceback
             raise UnknownError(err)
 
+class FdGauge(object):
+    """Count of the event fds handed out by a Fanotify object that are still open"""
+    __slots__ = ['opened', 'closed']
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+
+    @property
+    def live(self):
+        return self.opened - self.closed
+
+
 class FanotifyEvent(object):
-    __slots__ = ['_filename', 'version', 'mask', 'fd', 'pid']
-    def __init__(self, version, mask, fd, pid):
+    __slots__ = ['_filename', 'version', 'mask', 'fd', 'pid', 'fids', '_gauge']
+    def __init__(self, version, mask, fd, pid, fids=(), gauge=None):
         self.version = version
         self.mask = mask
         self.fd = fd
         self.pid = pid
+        self.fids = fids
 
         self._filename = None
+        self._gauge = gauge
+        if gauge is not None and fd >= 0:
+            gauge.opened += 1
                 
     @property
     def filename(self):
         if not self._filename:
             try:
-                name = readlink(join('/proc', str(getpid()), 'fd', str(self.fd)))
+                name = readlink(PROC_FD_PATH.format(self.fd))
                 self._filename = name
             except OSError:
                 self._filename = "<Unknown>"
@@ -169,8 +288,23 @@ class FanotifyEvent(object):
         return self._filename
         
     def close(self):
-        close(self.fd)
+        fd = self.detach()
+        if fd is not None and fd >= 0: # FAN_NOFD events do not carry an fd
+            close(fd)
+
+    def detach(self):
+        """Take ownership of the event's fd, the caller becomes responsible for closing it"""
+        fd = self.fd
         self.fd = None
+        if self._gauge is not None and fd is not None and fd >= 0:
+            self._gauge.closed += 1
+        return fd
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def __repr__(self):
         return "<FanotifyEvent filename={}, version={}, mask=0x{:X}, fd={}, pid={}>".format(
@@ -220,8 +354,150 @@ class FanotifyEvent(object):
     def on_child_event(self):
         return True if self.mask & FAN_EVENT_ON_CHILD else False
 
+    @property
+    def attrib_event(self):
+        return True if self.mask & FAN_ATTRIB else False
+
+    @property
+    def create_event(self):
+        return True if self.mask & FAN_CREATE else False
+
+    @property
+    def delete_event(self):
+        return True if self.mask & FAN_DELETE else False
+
+    @property
+    def delete_self_event(self):
+        return True if self.mask & FAN_DELETE_SELF else False
+
+    @property
+    def moved_from_event(self):
+        return True if self.mask & FAN_MOVED_FROM else False
+
+    @property
+    def moved_to_event(self):
+        return True if self.mask & FAN_MOVED_TO else False
+
+    @property
+    def move_self_event(self):
+        return True if self.mask & FAN_MOVE_SELF else False
+
+
+FanotifyFid = namedtuple('FanotifyFid', 'info_type fsid handle name')
+FanotifyFid.__doc__ = """File identifier reported in place of an fd by the FAN_REPORT_*FID modes
+
+info_type: FAN_EVENT_INFO_TYPE_FID, FAN_EVENT_INFO_TYPE_DFID or FAN_EVENT_INFO_TYPE_DFID_NAME
+fsid: (int, int) tuple identifying the filesystem, as returned by get_fsid()
+handle: raw struct file_handle suitable for open_by_handle_at()
+name: the name of the entry inside the directory for DFID_NAME records, otherwise None
+"""
+
+# struct fanotify_event_info_header + __kernel_fsid_t
+_info_header = struct.Struct('=BBHii')
+# struct file_handle without the trailing f_handle
+_file_handle = struct.Struct('=Ii')
+
+def str_to_fids(str, start, end):
+    """Decode the info records between start and end of a single event"""
+    fids = []
+    i = start
+    while i < end:
+        info_type, _, length, fsid0, fsid1 = _info_header.unpack_from(str, i)
+        if length == 0:
+            break
+        if info_type in (FAN_EVENT_INFO_TYPE_FID, FAN_EVENT_INFO_TYPE_DFID, FAN_EVENT_INFO_TYPE_DFID_NAME):
+            handle_start = i + _info_header.size
+            handle_bytes, _ = _file_handle.unpack_from(str, handle_start)
+            handle_end = handle_start + _file_handle.size + handle_bytes
+            handle = bytes(str[handle_start:handle_end])
+
+            name = None
+            if info_type == FAN_EVENT_INFO_TYPE_DFID_NAME:
+                name = bytes(str[handle_end:i + length]).split(b'\0', 1)[0]
+
+            fids.append(FanotifyFid(info_type, (fsid0, fsid1), handle, name))
+        i += length
+
+    return tuple(fids)
+
+
+def get_fsid(fd):
+    """Return the fsid of the filesystem fd is on as reported in FanotifyFid.fsid"""
+    if hasattr(fd, 'fileno'):
+        fd = fd.fileno()
+
+    assert isinstance(fd, int), 'FD must be an integer'
+
+    fsid = ffi.new('int32_t[2]')
+    if C.butter_fsid(fd, fsid) < 0:
+        err = ffi.errno
+        if err == errno.EBADF:
+            raise ValueError("fd is not a valid file descriptor")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+    return (fsid[0], fsid[1])
+
 
-def str_to_events(str):
+def open_by_handle_at(mount_fd, handle, flags=O_RDONLY):
+    """Open the file refered to by a file handle (see FanotifyFid.handle)
+
+    Arguments
+    ----------
+    :param int mount_fd: Any fd on the filesystem the handle belongs to
+    :param bytes handle: A raw struct file_handle
+    :param int flags: Flags to open the file with as per os.open
+
+    Returns
+    --------
+    :return: An open fd for the file
+    :rtype: int
+
+    Exceptions
+    -----------
+    :raises PermissionError: CAP_DAC_READ_SEARCH is required
+    :raises ValueError: mount_fd or handle is invalid
+    :raises ValueError: The file no longer exists (stale handle)
+    :raises OSError: Max per process FD limit reached
+    """
+    if hasattr(mount_fd, 'fileno'):
+        mount_fd = mount_fd.fileno()
+
+    assert isinstance(mount_fd, int), 'Mount FD must be an integer'
+    assert isinstance(handle, bytes), 'Handle must be a bytes object'
+
+    fd = C.butter_open_by_handle_at(mount_fd, handle, flags)
+    if fd < 0:
+        err = ffi.errno
+        if err == errno.EPERM:
+            raise PermissionError("CAP_DAC_READ_SEARCH is required to open file handles")
+        elif err == errno.EBADF:
+            raise ValueError("mount_fd is not a valid file descriptor")
+        elif err == errno.EINVAL:
+            raise ValueError("Invalid file handle or flags")
+        elif err == errno.ESTALE:
+            raise ValueError("File handle no longer refers to a file")
+        elif err in (errno.ELOOP, errno.ENOENT):
+            raise ValueError("Handle refers to a file that can not be opened with these flags")
+        elif err == errno.EMFILE:
+            raise OSError("Max per process FD limit reached")
+        elif err == errno.ENFILE:
+            raise OSError("Max system FD limit reached")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+    return fd
+
+
+def close_all(events):
+    """Close the fd of every event, events that are already closed are skipped"""
+    for event in events:
+        event.close()
+
+
+def str_to_events(str, gauge=None):
     event_struct_size = ffi.sizeof('struct fanotify_event_metadata')
 
     events = []
@@ -232,8 +508,95 @@ def str_to_events(str):
     i = 0
     while i < len(str_buf):
         event = ffi.cast('struct fanotify_event_metadata *', str_buf[i:i+event_struct_size])
-        events.append(FanotifyEvent(event.vers, event.mask, event.fd, event.pid))
+        fids = ()
+        if event.event_len > event.metadata_len:
+            fids = str_to_fids(str, i + event.metadata_len, i + event.event_len)
+        events.append(FanotifyEvent(event.vers, event.mask, event.fd, event.pid, fids, gauge))
 
         i += event.event_len
 
     return events
+
+
+RESPONSE_LEN = ffi.sizeof('struct fanotify_response')
+
+def response_to_str(fd, response):
+    """Pack a fanotify_response ready to be written to the fanotify fd"""
+    response = ffi.new('struct fanotify_response *', (fd, response))
+    return ffi.buffer(response)[:]
+
+
+# struct fanotify_event_metadata, used to decode whole buffers at once
+_metadata = struct.Struct('=IBBHQii')
+METADATA_LEN = _metadata.size
+BATCH_FIELDS = ('event_len', 'vers', 'reserved', 'metadata_len', 'mask', 'fd', 'pid')
+
+if np is not None:
+    EVENT_DTYPE = np.dtype([('event_len', np.uint32),
+                            ('vers', np.uint8),
+                            ('reserved', np.uint8),
+                            ('metadata_len', np.uint16),
+                            ('mask', np.uint64),
+                            ('fd', np.int32),
+                            ('pid', np.int32),
+                            ])
+    assert EVENT_DTYPE.itemsize == METADATA_LEN, 'numpy layout does not match fanotify_event_metadata'
+else:
+    EVENT_DTYPE = None
+
+
+FanotifyBatch = namedtuple('FanotifyBatch', BATCH_FIELDS)
+class FanotifyBatch(FanotifyBatch):
+    """Column per field of fanotify_event_metadata, each column is an array.array
+
+    Used in place of a numpy structured array when numpy is not installed and
+    supports the same batch['field'] style of access
+    """
+    __slots__ = []
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return super(FanotifyBatch, self).__getitem__(key)
+
+    def __len__(self):
+        return len(self.mask)
+
+
+def _metadata_only(str):
+    """Strip any info records trailing the metadata so every record is METADATA_LEN
+    bytes long, returns the buffer untouched if there are none
+    """
+    records = []
+    i = 0
+    stripped = False
+    while i < len(str):
+        event_len = _metadata.unpack_from(str, i)[0]
+        records.append(str[i:i+METADATA_LEN])
+        stripped |= event_len != METADATA_LEN
+        i += event_len
+
+    return b''.join(records) if stripped else str
+
+
+def str_to_batch(str, info_records=False):
+    """Decode a buffer of events into columns without creating per event objects
+
+    Returns a numpy structured array (dtype EVENT_DTYPE) that is a view on the
+    buffer when numpy is available, otherwise a FanotifyBatch of array.array
+    columns. Either can be indexed by field name, eg batch['pid']
+
+    Set 'info_records' when the buffer was read in a FAN_REPORT_*FID mode, the
+    records trailing each event are then stripped (at the cost of a copy)
+    """
+    if info_records:
+        str = _metadata_only(str)
+
+    if np is not None:
+        return np.frombuffer(str, dtype=EVENT_DTYPE)
+
+    columns = [array.array(code) for code in 'IBBHQii']
+    if str:
+        for column, values in zip(columns, zip(*_metadata.iter_unpack(str))):
+            column.extend(values)
+
+    return FanotifyBatch(*columns)
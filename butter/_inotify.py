@@ -311,6 +311,19 @@ class InotifyEvent(InotifyEvent):
     def is_dir_event(self):
         return True if self.mask & IN_ISDIR else False
 
+
+InotifyMoveEvent = namedtuple("InotifyMoveEvent", "mask cookie old_wd old_path new_wd new_path")
+class InotifyMoveEvent(InotifyMoveEvent):
+    """A matched IN_MOVED_FROM/IN_MOVED_TO pair describing a single rename
+
+    mask is the IN_MOVED_FROM|IN_MOVED_TO mask of the pair and will include
+    IN_ISDIR if a directory was moved
+    """
+    __slots__ = []
+    @property
+    def is_dir_event(self):
+        return True if self.mask & IN_ISDIR else False
+
 # update the local namespace with flags and provide
 # a handy dict for reversable lookups
 event_name = {}
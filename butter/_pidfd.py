@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""pidfd: refer to a process by file descriptor rather than pid"""
+from .utils import UnknownError, PermissionError
+from cffi import FFI
+import errno
+
+ffi = FFI()
+ffi.cdef("""
+#define PIDFD_NONBLOCK ...
+
+int butter_pidfd_open(int pid, unsigned int flags);
+int butter_pidfd_send_signal(int pidfd, int sig, void *info, unsigned int flags);
+int butter_pidfd_getfd(int pidfd, int targetfd, unsigned int flags);
+""")
+
+C = ffi.verify("""
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/syscall.h>
+
+/* glibc only gained wrappers (and the headers only gained the numbers) for
+   these recently, the numbers are the same on every architecture
+*/
+#ifndef SYS_pidfd_open
+#define SYS_pidfd_open 434
+#endif
+#ifndef SYS_pidfd_send_signal
+#define SYS_pidfd_send_signal 424
+#endif
+#ifndef SYS_pidfd_getfd
+#define SYS_pidfd_getfd 438
+#endif
+#ifndef PIDFD_NONBLOCK
+#define PIDFD_NONBLOCK O_NONBLOCK
+#endif
+
+int butter_pidfd_open(int pid, unsigned int flags){
+    return syscall(SYS_pidfd_open, pid, flags);
+};
+
+int butter_pidfd_send_signal(int pidfd, int sig, void *info, unsigned int flags){
+    return syscall(SYS_pidfd_send_signal, pidfd, sig, info, flags);
+};
+
+int butter_pidfd_getfd(int pidfd, int targetfd, unsigned int flags){
+    return syscall(SYS_pidfd_getfd, pidfd, targetfd, flags);
+};
+""", libraries=[], ext_package="butter")
+
+PIDFD_NONBLOCK = C.PIDFD_NONBLOCK
+
+
+def pidfd_open(pid, flags=0):
+    """Obtain a file descriptor that refers to a process
+
+    The fd is always close on exec and becomes readable when the process
+    exits. Unlike the pid it can not be reused to refer to a different
+    process
+
+    Arguments
+    ----------
+    :param int pid: The process to refer to
+    :param int flags: Flags to specify extra options
+
+    Flags
+    ------
+    PIDFD_NONBLOCK: waitid() on the fd returns immediately if the process is still running (5.10+)
+
+    Returns
+    --------
+    :return: The file descriptor representing the process
+    :rtype: int
+
+    Exceptions
+    -----------
+    :raises ValueError: Invalid value in flags or pid
+    :raises ValueError: The process does not exist
+    :raises OSError: Max per process FD limit reached
+    :raises OSError: Max system FD limit reached
+    :raises OSError: Could not mount (internal) anonymous inode device
+    :raises OSError: pidfd_open is not supported by this kernel (5.3+)
+    :raises MemoryError: Insufficient kernel memory
+    """
+    assert isinstance(pid, int), 'PID must be an integer'
+    assert isinstance(flags, int), 'Flags must be an integer'
+
+    fd = C.butter_pidfd_open(pid, flags)
+
+    if fd < 0:
+        err = ffi.errno
+        if err == errno.EINVAL:
+            raise ValueError("Invalid value in flags or pid")
+        elif err == errno.ESRCH:
+            raise ValueError("Process does not exist")
+        elif err == errno.EMFILE:
+            raise OSError("Max per process FD limit reached")
+        elif err == errno.ENFILE:
+            raise OSError("Max system FD limit reached")
+        elif err == errno.ENODEV:
+            raise OSError("Could not mount (internal) anonymous inode device")
+        elif err == errno.ENOSYS:
+            raise OSError("pidfd_open is not supported by this kernel")
+        elif err == errno.ENOMEM:
+            raise MemoryError("Insufficent kernel memory available")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+    return fd
+
+
+def pidfd_send_signal(pidfd, signal, flags=0):
+    """Send a signal to the process referred to by pidfd
+
+    Arguments
+    ----------
+    :param int pidfd: The pidfd of the process to signal
+    :param int signal: The signal to send, 0 checks the process can be signaled
+    :param int flags: Reserved, must be 0
+
+    Exceptions
+    -----------
+    :raises ValueError: pidfd is not a valid pidfd
+    :raises ValueError: Invalid signal or flags
+    :raises ValueError: The process has exited
+    :raises PermissionError: Not permitted to signal the process
+    :raises OSError: pidfd_send_signal is not supported by this kernel (5.1+)
+    """
+    if hasattr(pidfd, 'fileno'):
+        pidfd = pidfd.fileno()
+
+    assert isinstance(pidfd, int), 'pidfd must be an integer'
+    assert isinstance(signal, int), 'Signal must be an integer'
+
+    ret = C.butter_pidfd_send_signal(pidfd, signal, ffi.NULL, flags)
+
+    if ret < 0:
+        err = ffi.errno
+        if err == errno.EBADF:
+            raise ValueError("pidfd is not a valid file descriptor")
+        elif err == errno.EINVAL:
+            raise ValueError("Invalid signal or flags or fd is not a pidfd")
+        elif err == errno.ESRCH:
+            raise ValueError("Process has exited")
+        elif err == errno.EPERM:
+            raise PermissionError("Not permitted to signal the process")
+        elif err == errno.ENOSYS:
+            raise OSError("pidfd_send_signal is not supported by this kernel")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+
+def pidfd_getfd(pidfd, targetfd, flags=0):
+    """Duplicate a file descriptor of another process into this one
+
+    Requires PTRACE_MODE_ATTACH_REALCREDS permission over the process, the
+    new fd is close on exec
+
+    Arguments
+    ----------
+    :param int pidfd: The pidfd of the process to take the fd from
+    :param int targetfd: The fd number in the other process
+    :param int flags: Reserved, must be 0
+
+    Returns
+    --------
+    :return: The new file descriptor
+    :rtype: int
+
+    Exceptions
+    -----------
+    :raises ValueError: pidfd is not a valid pidfd or targetfd is not open in the process
+    :raises ValueError: Invalid flags
+    :raises ValueError: The process has exited
+    :raises PermissionError: Not permitted to access the process's fds
+    :raises OSError: Max per process FD limit reached
+    :raises OSError: Max system FD limit reached
+    :raises OSError: pidfd_getfd is not supported by this kernel (5.6+)
+    """
+    if hasattr(pidfd, 'fileno'):
+        pidfd = pidfd.fileno()
+
+    assert isinstance(pidfd, int), 'pidfd must be an integer'
+    assert isinstance(targetfd, int), 'targetfd must be an integer'
+
+    fd = C.butter_pidfd_getfd(pidfd, targetfd, flags)
+
+    if fd < 0:
+        err = ffi.errno
+        if err == errno.EBADF:
+            raise ValueError("pidfd or targetfd is not a valid file descriptor")
+        elif err == errno.EINVAL:
+            raise ValueError("Invalid flags or fd is not a pidfd")
+        elif err == errno.ESRCH:
+            raise ValueError("Process has exited")
+        elif err == errno.EPERM:
+            raise PermissionError("Not permitted to access the process's file descriptors")
+        elif err == errno.EMFILE:
+            raise OSError("Max per process FD limit reached")
+        elif err == errno.ENFILE:
+            raise OSError("Max system FD limit reached")
+        elif err == errno.ENOSYS:
+            raise OSError("pidfd_getfd is not supported by this kernel")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+    return fd
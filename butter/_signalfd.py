@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 """signalfd: Recive signals over a file descriptor"""
 
-from .utils import UnknownError, CLOEXEC_DEFAULT
+from .utils import UnknownError, PermissionError, CLOEXEC_DEFAULT
 from cffi import FFI
 import platform
 import signal
+import struct
 import errno
 
 ffi = FFI()
@@ -19,7 +20,7 @@ struct signalfd_siginfo {
     uint32_t ssi_pid; /* PID of sender */
     uint32_t ssi_uid; /* Real UID of sender */
     int32_t ssi_fd; /* File descriptor (SIGIO) */
-    uint32_t ssi_tid; /* Kernel timer ID (POSIX timers)
+    uint32_t ssi_tid; /* Kernel timer ID (POSIX timers) */
     uint32_t ssi_band; /* Band event (SIGIO) */
     uint32_t ssi_overrun; /* POSIX timer overrun count */
     uint32_t ssi_trapno; /* Trap number that caused signal */
@@ -56,6 +57,10 @@ int sigismember(const sigset_t *set, int signum);
 #define SIG_SETMASK ...
 
 int pthread_sigmask(int how, const sigset_t *set, sigset_t *oldset);
+
+int butter_sigqueue(int pid, int sig, uint64_t value);
+int butter_sigrtmin(void);
+int butter_sigrtmax(void);
 """ % (16 if platform.architecture()[0] == "64bit" else 32))
 # define _SIGSET_NWORDS     (1024 / (8 * sizeof (unsigned long int)))
 # 32bits: 1024 / 8 / 4  = 32
@@ -65,6 +70,24 @@ C = ffi.verify("""
 #include <sys/signalfd.h>
 #include <stdint.h> /* Definition of uint64_t */
 #include <signal.h>
+
+/* sigval is a union, fill the whole of it so the receiver sees the full
+   value in ssi_ptr and its low 32 bits in ssi_int
+*/
+int butter_sigqueue(int pid, int sig, uint64_t value){
+    union sigval val;
+    val.sival_ptr = (void *)(uintptr_t)value;
+    return sigqueue(pid, sig, val);
+};
+
+/* not constants, glibc reserves some real time signals for itself */
+int butter_sigrtmin(void){
+    return SIGRTMIN;
+};
+
+int butter_sigrtmax(void){
+    return SIGRTMAX;
+};
 """, libraries=[], ext_package="butter")
 
 SFD_CLOEXEC = C.SFD_CLOEXEC
@@ -74,6 +97,9 @@ SIG_BLOCK = C.SIG_BLOCK
 SIG_UNBLOCK = C.SIG_UNBLOCK
 SIG_SETMASK = C.SIG_SETMASK
 
+SIGRTMIN = C.butter_sigrtmin() # first real time signal available to applications
+SIGRTMAX = C.butter_sigrtmax()
+
 NEW_SIGNALFD = -1 # Create a new signal rather than modify an exsisting one
 
 
@@ -211,6 +237,46 @@ def pthread_sigmask(action, signals):
             raise UnknownError(err)
 
 
+def sigqueue(pid, signal, value=0):
+    """Send a signal with a value attached to a process
+
+    Unlike standard signals, real time signals (SIGRTMIN to SIGRTMAX) are
+    queued rather than merged so every value sent is recived
+
+    Arguments
+    ----------
+    :param int pid: The process to send the signal to
+    :param int signal: The signal to send
+    :param int value: Up to 64 bits of data, recived as Signal.ptr (and the low 32 bits
+                      as Signal.value)
+
+    Exceptions
+    -----------
+    :raises ValueError: Invalid signal
+    :raises ValueError: The process does not exist
+    :raises PermissionError: Not permitted to signal the process
+    :raises OSError: The limit of queued signals (RLIMIT_SIGPENDING) has been reached
+    """
+    assert isinstance(pid, int), 'PID must be an integer'
+    assert isinstance(signal, int), 'Signal must be an integer'
+
+    ret = C.butter_sigqueue(pid, signal, value & 0xffffffffffffffff)
+
+    if ret < 0:
+        err = ffi.errno
+        if err == errno.EINVAL:
+            raise ValueError("Signal is not a valid signal number")
+        elif err == errno.ESRCH:
+            raise ValueError("Process does not exist")
+        elif err == errno.EPERM:
+            raise PermissionError("Not permitted to signal the process")
+        elif err == errno.EAGAIN:
+            raise OSError("Limit of queued signals reached")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+
 signum_to_signame = {val:key for key, val in signal.__dict__.items()
                      if isinstance(val, int) and "_" not in key}
 
@@ -218,3 +284,7 @@ signum_to_signame = {val:key for key, val in signal.__dict__.items()
 #SIGINFO_LENGTH = 128 # Bytes
 SIGINFO_LENGTH = ffi.sizeof('struct signalfd_siginfo')
 
+# The fields of signalfd_siginfo up to ssi_addr, the rest is padding
+SIGINFO_STRUCT = struct.Struct('=IiiIIiIIIIiiQQQQ')
+assert SIGINFO_STRUCT.size <= SIGINFO_LENGTH, 'signalfd_siginfo is smaller than expected'
+
@@ -20,6 +20,7 @@ ffi.cdef("""
 #define TFD_NONBLOCK ...
 
 #define TFD_TIMER_ABSTIME ...
+#define TFD_TIMER_CANCEL_ON_SET ...
 
 #define CLOCK_REALTIME ...
 #define CLOCK_MONOTONIC ...
@@ -49,12 +50,18 @@ C = ffi.verify("""
 #include <sys/timerfd.h>
 #include <stdint.h> /* Definition of uint64_t */
 #include <time.h>
+
+/* Added in 2.6.36, older headers may not have it */
+#ifndef TFD_TIMER_CANCEL_ON_SET
+#define TFD_TIMER_CANCEL_ON_SET (1 << 1)
+#endif
 """, libraries=[], ext_package="butter")
 
 
 TFD_CLOEXEC = C.TFD_CLOEXEC
 TFD_NONBLOCK = C.TFD_NONBLOCK
 TFD_TIMER_ABSTIME = C.TFD_TIMER_ABSTIME
+TFD_TIMER_CANCEL_ON_SET = C.TFD_TIMER_CANCEL_ON_SET
 
 CLOCK_REALTIME = C.CLOCK_REALTIME
 CLOCK_MONOTONIC = C.CLOCK_MONOTONIC
@@ -263,6 +270,8 @@ def timerfd_settime(fd, timer_spec, flags=0):
     Flags
     ------
     TFD_TIMER_ABSTIMER: The specified time is an absolute value rather than relative to now
+    TFD_TIMER_CANCEL_ON_SET: With TFD_TIMER_ABSTIME on CLOCK_REALTIME, reads fail with ECANCELED
+                             if the clock is changed discontinuously
         
     Returns
     --------
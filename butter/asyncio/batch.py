@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+from ..batch import BatchFlusher as _BatchFlusher
+from ..batch import BATCH_SIZE as _BATCH_SIZE
+from ..batch import BATCH_LATENCY as _BATCH_LATENCY
+from collections import deque as _deque
+from .utils import coroutine as _coroutine
+import asyncio as _asyncio
+
+
+class BatchFlusher_async:
+    """Batches of records delivered to coroutines, see butter.batch.BatchFlusher
+
+    Records may still be added from other threads, the eventfd wakes the
+    loop when a batch fills up
+
+    >>> flusher = BatchFlusher_async(size=500, latency=0.05)
+    >>> flusher.add(record)
+    >>> batch = yield from flusher.get()
+    """
+    def __init__(self, size=_BATCH_SIZE, latency=_BATCH_LATENCY, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._flusher = _BatchFlusher(size, latency)
+        self._batches = _deque()
+        self._getters = _deque()
+        for fd in self._flusher.filenos():
+            self._loop.add_reader(fd, self._ready)
+
+        self.add = self._flusher.add
+        self.extend = self._flusher.extend
+
+    @property
+    def stats(self):
+        """The FlushStats for batches taken so far"""
+        return self._flusher.stats
+
+    def _ready(self):
+        batch = self._flusher.take()
+        if batch:
+            self._put(batch)
+
+    def _put(self, batch):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(batch)
+                return
+        self._batches.append(batch)
+
+    @_coroutine
+    def get(self):
+        """Wait for the next batch
+
+        Returns
+        --------
+        :return: The records in the order they were added
+        :rtype: list
+        """
+        if self._batches:
+            return self._batches.popleft()
+
+        waiter = _asyncio.Future(loop=self._loop)
+        self._getters.append(waiter)
+        return (yield from waiter)
+
+    def flush(self):
+        """Take whatever is buffered now, regardless of size or age"""
+        return self._flusher.flush()
+
+    def __len__(self):
+        return len(self._flusher)
+
+    def close(self):
+        for fd in self._flusher.filenos():
+            self._loop.remove_reader(fd)
+        self._flusher.close()
+
+    def __repr__(self):
+        return "<{} buffered={} batches={}>".format(self.__class__.__name__, len(self._flusher), len(self._batches))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+from ..channel import Channel as _Channel
+from collections import deque as _deque
+from .utils import coroutine as _coroutine
+import asyncio as _asyncio
+
+
+class Channel_async:
+    """Items from producer threads delivered to coroutines, see butter.channel.Channel
+
+    The eventfd stays registered with the loop and every wakeup drains all
+    the items that have been put since the last one
+
+    >>> channel = Channel_async()
+    >>> channel.put(item)        # from any thread
+    >>> item = yield from channel.get()
+    >>> items = yield from channel.get_batch()
+    """
+    def __init__(self, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._channel = _Channel()
+        # drained from the channel but not yet handed out
+        self._buffer = _deque()
+        self._getters = _deque()
+        self._loop.add_reader(self._channel.fileno(), self._ready)
+
+        self.put = self._channel.put
+        self.put_many = self._channel.put_many
+
+    @property
+    def wakeups(self):
+        """How many times producers have woken the loop"""
+        return self._channel.wakeups
+
+    def _ready(self):
+        self._buffer.extend(self._channel.drain())
+        while self._buffer and self._getters:
+            getter, batch = self._getters.popleft()
+            if getter.done():
+                continue
+            if batch:
+                items = list(self._buffer)
+                self._buffer.clear()
+                getter.set_result(items)
+            else:
+                getter.set_result(self._buffer.popleft())
+
+    @_coroutine
+    def _wait(self, batch):
+        waiter = _asyncio.Future(loop=self._loop)
+        self._getters.append((waiter, batch))
+        return (yield from waiter)
+
+    @_coroutine
+    def get(self):
+        """Wait for the next item"""
+        if self._buffer and not self._getters:
+            return self._buffer.popleft()
+        return (yield from self._wait(False))
+
+    @_coroutine
+    def get_batch(self):
+        """Wait for items and take every one available
+
+        Returns
+        --------
+        :return: The items in the order they were put
+        :rtype: list
+        """
+        if self._buffer and not self._getters:
+            items = list(self._buffer)
+            self._buffer.clear()
+            return items
+        return (yield from self._wait(True))
+
+    def __len__(self):
+        return len(self._buffer) + len(self._channel)
+
+    def close(self):
+        self._loop.remove_reader(self._channel.fileno())
+        self._channel.close()
+
+    def __repr__(self):
+        return "<{} items={} wakeups={}>".format(self.__class__.__name__, len(self), self._channel.wakeups)
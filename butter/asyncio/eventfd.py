@@ -1,6 +1,9 @@
 #!/usr/bih/env python
 from ..eventfd import Eventfd as _Eventfd
+from ..eventfd import EventfdSemaphore as _EventfdSemaphore
+from ..eventfd import SEMAPHORE_BACKOFF_MAX as _SEMAPHORE_BACKOFF_MAX
 from collections import deque as _deque
+from .utils import coroutine as _coroutine
 import asyncio as _asyncio
 
 
@@ -18,7 +21,7 @@ class Eventfd_async:
         """
         self._eventfd.increment(value)
 
-    @_asyncio.coroutine
+    @_coroutine
     def wait(self):
         """Read the current value of the counter and zero the counter
 
@@ -68,6 +71,75 @@ class Eventfd_async:
         fd = self._eventfd._fd or 'closed'
         return "<{} fd={} value={}>".format(self.__class__.__name__, fd, self._value)
 
+class EventfdSemaphore_async:
+    """Acquire tokens from a cross process semaphore on the event loop, see
+    butter.eventfd.EventfdSemaphore
+
+    >>> sem = EventfdSemaphore_async(semaphore=shared)
+    >>> yield from sem.acquire()
+    >>> try:
+    ...     yield from query()
+    ... finally:
+    ...     sem.release()
+    """
+    def __init__(self, value=0, *, semaphore=None, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._semaphore = semaphore if semaphore is not None else _EventfdSemaphore(value)
+        self._waiters = _deque()
+
+        self.release = self._semaphore.release
+        self.try_acquire = self._semaphore.try_acquire
+        self.send = self._semaphore.send
+
+    @property
+    def value(self):
+        return self._semaphore.value
+
+    @_coroutine
+    def acquire(self, n=1):
+        """Take 'n' tokens, waiting until they are available"""
+        backoff = 0.001
+        while True:
+            taken = self._semaphore.take(n)
+            if taken == n:
+                return True
+            if taken:
+                # readable but too few tokens, poll rather than spin on the fd
+                yield from _asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _SEMAPHORE_BACKOFF_MAX)
+            else:
+                yield from self._readable()
+
+    @_coroutine
+    def _readable(self):
+        waiter = _asyncio.Future(loop=self._loop)
+        if not self._waiters:
+            self._loop.add_reader(self._semaphore.fileno(), self._wake)
+        self._waiters.append(waiter)
+        try:
+            yield from waiter
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                if not self._waiters:
+                    self._loop.remove_reader(self._semaphore.fileno())
+
+    def _wake(self):
+        # every waiter retries, those that lose the race wait again
+        self._loop.remove_reader(self._semaphore.fileno())
+        waiters, self._waiters = self._waiters, _deque()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def close(self):
+        if self._waiters:
+            self._loop.remove_reader(self._semaphore.fileno())
+        self._semaphore.close()
+
+    def __repr__(self):
+        return "<{} waiting={}>".format(self.__class__.__name__, len(self._waiters))
+
 def _watcher(loop):
     ev = Eventfd_async(10)
     print(ev)
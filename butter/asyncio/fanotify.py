@@ -1,8 +1,10 @@
 #!/usr/bih/env python
 from ..fanotify import FAN_CLASS_NOTIF as _FAN_CLASS_NOTIF
 from ..fanotify import Fanotify as _Fanotify
+from ..fanotify import ContentHasher as _ContentHasher
 from collections import deque as _deque
 from os import O_RDONLY as _O_RDONLY
+from .utils import coroutine as _coroutine
 import asyncio as _asyncio
 
 class Fanotify_async:
@@ -16,12 +18,12 @@ class Fanotify_async:
         self._events = _deque()
         
     def watch(self, path, event_mask, flags=0, dfd=0):
-        self._fanotify.watch(flags, event_mask, path, dfd)
+        self._fanotify.watch(path, event_mask, flags, dfd)
 
     def ignore(self, path, event_mask, flags=0, dfd=0):
-        self._fanotify.ignore(flags, event_mask, path, dfd)
+        self._fanotify.ignore(path, event_mask, flags, dfd)
          
-    @_asyncio.coroutine
+    @_coroutine
     def get_event(self):
         """Remove and return an item from the queue.
 
@@ -113,6 +115,37 @@ class Fanotify_async:
         fd = self._fanotify._fd or "closed"
         return "<{} fd={}>".format(self.__class__.__name__, fd)
 
+class ContentHasher_async:
+    """Hash files from FAN_CLOSE_WRITE events without blocking the event loop
+
+    A thin wrapper around ContentHasher, the hashing happens in its worker
+    processes and the result is delivered back to the loop
+
+    >>> hasher = ContentHasher_async()
+    >>> event = yield from fanotify.get_event()
+    >>> record = yield from hasher.hash_event(event)
+    """
+    def __init__(self, hasher=None, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._hasher = hasher or _ContentHasher()
+
+    @_coroutine
+    def hash_event(self, event):
+        """Hash the file an event refers to, the event's fd is closed for you
+
+        Returns
+        --------
+        HashRecord: path, digest, size and mtime of the file or None if it is not a regular file
+        """
+        future = self._hasher.hash_event(event)
+        return (yield from _asyncio.wrap_future(future, loop=self._loop))
+
+    def close(self):
+        self._hasher.close()
+
+    def __repr__(self):
+        return "<{} cached={}>".format(self.__class__.__name__, len(self._hasher))
+
 def _watcher(loop):
     from ..fanotify import FAN_MODIFY, FAN_ONDIR, FAN_ACCESS, FAN_EVENT_ON_CHILD, FAN_OPEN, FAN_CLOSE
     
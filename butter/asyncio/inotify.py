@@ -1,6 +1,7 @@
 #!/usr/bih/env python
 from ..inotify import Inotify as _Inotify
 from collections import deque as _deque
+from .utils import coroutine as _coroutine
 import asyncio as _asyncio
 
 
@@ -20,7 +21,7 @@ class Inotify_async:
     def ignore(self, wd):
         self._inotify.ignore(wd)
          
-    @_asyncio.coroutine
+    @_coroutine
     def get_event(self):
         """Remove and return an item from the queue.
 
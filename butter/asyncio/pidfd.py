@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+from ..pidfd import Pidfd as _Pidfd
+from .utils import coroutine as _coroutine
+import asyncio as _asyncio
+
+
+class Pidfd_async:
+    """Wait for a process to exit on the event loop, see butter.pidfd.Pidfd
+
+    >>> proc = Pidfd_async(pid)
+    >>> returncode = yield from proc.wait()
+    """
+    def __init__(self, pid, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._pidfd = _Pidfd(pid)
+        self._waiter = None
+
+        self.send_signal = self._pidfd.send_signal
+        self.terminate = self._pidfd.terminate
+        self.kill = self._pidfd.kill
+        self.getfd = self._pidfd.getfd
+
+    @property
+    def pid(self):
+        return self._pidfd.pid
+
+    @property
+    def returncode(self):
+        return self._pidfd.returncode
+
+    @_coroutine
+    def wait(self):
+        """Wait for the process to exit
+
+        Returns
+        --------
+        :return: The exit code (-N if killed by signal N) for children, otherwise None
+        :rtype: int
+        """
+        if self._waiter is None:
+            self._waiter = _asyncio.Future(loop=self._loop)
+            self._loop.add_reader(self._pidfd.fileno(), self._exited)
+        return (yield from _asyncio.shield(self._waiter))
+
+    def _exited(self):
+        self._loop.remove_reader(self._pidfd.fileno())
+        if not self._waiter.done():
+            self._waiter.set_result(self._pidfd.read_event())
+
+    def close(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._loop.remove_reader(self._pidfd.fileno())
+            self._waiter.cancel()
+        self._pidfd.close()
+
+    def __repr__(self):
+        return "<{} pid={} returncode={}>".format(self.__class__.__name__, self.pid, self.returncode)
@@ -1,64 +1,244 @@
 #!/usr/bih/env python
 from ..signalfd import Signalfd as _Signalfd
+from ..signalfd import SIG_BLOCK as _SIG_BLOCK
+from ..signalfd import pthread_sigmask as _pthread_sigmask
+from ..signalfd import RtSignalChannel as _RtSignalChannel
 from collections import deque as _deque
+from .utils import coroutine as _coroutine
+from .utils import iscoroutinefunction as _iscoroutinefunction
 import asyncio as _asyncio
 
 class Signalfd_async:
+    """Recive signals on the event loop
+
+    Signals can be waited for one at a time with wait() or dispatched to
+    handlers registered per signal with add_handler(). Either way one
+    reader is kept on the signalfd while there is something to deliver to
+    and every wakeup drains all the queued signals
+
+    >>> sfd = Signalfd_async()
+    >>> sfd.add_handler(signal.SIGHUP, reload_config)     # plain callable
+    >>> sfd.add_handler(signal.SIGCHLD, reap_children)    # coroutine function
+    """
     def __init__(self, signals=[], flags=0, *, loop=None):
         self._loop = loop or _asyncio.get_event_loop()
         self._signalfd = _Signalfd(signals, flags)
         self._getters = _deque()
+        # signals with no handler waiting for wait()
+        self._queue = _deque()
+        # signum -> [handler, ...]
+        self._handlers = {}
+        # (signum, handler) -> Signal to run a busy coroutine handler with when it finishes
+        self._running = {}
+        self._reading = False
+        self.coalesced = 0
+
         self.enable = self._signalfd.enable
         self.enable_all = self._signalfd.enable_all
         self.disable = self._signalfd.disable
         self.disable_all = self._signalfd.disable_all
             
-    @_asyncio.coroutine
+    @_coroutine
     def wait(self):
-        """Wait for the timer to expire, returning how many events have 
-        elappsed since the last call to wait()
+        """Wait for a signal that has no handler
 
         Returns
         --------
-        :return: The current count of the timer
-        :rtype: int
+        :return: The next signal recived
+        :rtype: Signal
         """
-        self._loop.add_reader(self._signalfd.fileno(), self._read_event)
+        if self._queue:
+            return self._queue.popleft()
 
         waiter = _asyncio.Future(loop=self._loop)
-
         self._getters.append(waiter)
+        self._start_reading()
 
         return (yield from waiter)
 
+    def add_handler(self, signum, handler):
+        """Call handler(Signal) every time 'signum' is recived
+
+        The signal is blocked (so it is only delivered via the signalfd) and
+        enabled on the signalfd. If handler is a coroutine function it is run
+        as a task, while it is running further occurrences of the signal are
+        coalesced into a single rerun with the latest Signal once it finishes
+        """
+        handlers = self._handlers.setdefault(signum, [])
+        if not handlers:
+            _pthread_sigmask(_SIG_BLOCK, signum)
+            self._signalfd.enable(signum)
+        handlers.append(handler)
+        self._start_reading()
+
+    def remove_handler(self, signum, handler=None):
+        """Remove 'handler' (or all handlers) for 'signum'
+
+        The signal stays blocked and enabled, further occurrences are handed
+        to wait()
+        """
+        handlers = self._handlers.get(signum, [])
+        if handler is None:
+            del handlers[:]
+        elif handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self._handlers.pop(signum, None)
+        self._maybe_stop_reading()
+
+    def _start_reading(self):
+        if not self._reading:
+            self._loop.add_reader(self._signalfd.fileno(), self._dispatch)
+            self._reading = True
+
+    def _maybe_stop_reading(self):
+        self._consume_done_getters()
+        if self._reading and not self._handlers and not self._getters:
+            self._loop.remove_reader(self._signalfd.fileno())
+            self._reading = False
+
     def _consume_done_getters(self):
         # Delete waiters at the head of the get() queue who've timed out.
         while self._getters and self._getters[0].done():
             self._getters.popleft()
 
-    def _read_event(self):
-        value = self._signalfd.read_event()
-        self._put_event(value)
-    
-    def _put_event(self, value):
-        """Put an item into the queue without blocking.
+    def _dispatch(self):
+        for info in self._signalfd.read_events():
+            handlers = self._handlers.get(info.signal)
+            if not handlers:
+                self._put_event(info)
+                continue
+            for handler in list(handlers):
+                self._call(info, handler)
 
-        If no free slot is immediately available, raise QueueFull.
-        """
-        self._loop.remove_reader(self._signalfd.fileno())
+        self._maybe_stop_reading()
 
+    def _put_event(self, value):
+        """Hand a signal to the first waiter, or queue it for the next wait()"""
         self._consume_done_getters()
+        if self._getters:
+            self._getters.popleft().set_result(value)
+        else:
+            self._queue.append(value)
+
+    def _call(self, info, handler):
+        if not _iscoroutinefunction(handler):
+            try:
+                handler(info)
+            except Exception as err:
+                self._loop.call_exception_handler({'message': 'Signal handler raised an exception',
+                                                   'exception': err,
+                                                   'handler': handler,
+                                                   })
+            return
+
+        key = (info.signal, handler)
+        if key in self._running:
+            # already running, run once more with the latest signal when done
+            if self._running[key] is not None:
+                self.coalesced += 1
+            self._running[key] = info
+            return
 
-        for getter in self._getters:
-            getter.set_result(value)
+        self._running[key] = None
+        task = _asyncio.ensure_future(handler(info), loop=self._loop)
+        task.add_done_callback(lambda task: self._handler_done(key, task))
+
+    def _handler_done(self, key, task):
+        if not task.cancelled() and task.exception() is not None:
+            self._loop.call_exception_handler({'message': 'Signal handler raised an exception',
+                                               'exception': task.exception(),
+                                               'handler': key[1],
+                                               })
+        info = self._running.pop(key)
+        signum, handler = key
+        if info is not None and handler in self._handlers.get(signum, ()):
+            self._call(info, handler)
 
     def close(self):
+        if self._reading:
+            self._loop.remove_reader(self._signalfd.fileno())
+            self._reading = False
         self._signalfd.close()
 
     def __repr__(self):
         fd = self._signalfd._fd or "closed"
         return "<{} fd={}>".format(self.__class__.__name__, fd)
  
+class RtSignalChannel_async:
+    """Recive messages on a real time signal channel, see butter.signalfd.RtSignalChannel
+
+    >>> channel = RtSignalChannel_async(1)
+    >>> for message in (yield from channel.receive()):
+    ...     print(message.pid, message.value)
+    """
+    def __init__(self, channel=0, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._channel = _RtSignalChannel(channel)
+        self._getters = _deque()
+        # messages read with no receive() waiting for them
+        self._queue = []
+        self._reading = False
+
+        self.send = self._channel.send
+
+    @property
+    def signal(self):
+        return self._channel.signal
+
+    @_coroutine
+    def receive(self):
+        """Wait for messages
+
+        Each read from the channel goes to one caller, concurrent callers
+        are served in turn by later reads
+
+        Returns
+        --------
+        :return: Every message queued when the channel became readable
+        :rtype: list of RtMessage
+        """
+        if self._queue:
+            messages, self._queue = self._queue, []
+            return messages
+
+        waiter = _asyncio.Future(loop=self._loop)
+        self._getters.append(waiter)
+        if not self._reading:
+            self._loop.add_reader(self._channel.fileno(), self._ready)
+            self._reading = True
+
+        return (yield from waiter)
+
+    def _consume_done_getters(self):
+        # Delete waiters at the head of the receive() queue who've timed out.
+        while self._getters and self._getters[0].done():
+            self._getters.popleft()
+
+    def _ready(self):
+        messages = self._channel.read_events()
+        self._consume_done_getters()
+        if self._getters:
+            self._getters.popleft().set_result(messages)
+        else:
+            self._queue.extend(messages)
+
+        self._consume_done_getters()
+        if not self._getters:
+            self._loop.remove_reader(self._channel.fileno())
+            self._reading = False
+
+    def close(self):
+        if self._reading:
+            self._loop.remove_reader(self._channel.fileno())
+            self._reading = False
+        while self._getters:
+            self._getters.popleft().cancel()
+        self._channel.close()
+
+    def __repr__(self):
+        return "<{} signal={}>".format(self.__class__.__name__, self._channel.signal)
+
 def watcher(loop):
     from asyncio import sleep
     from ..signalfd import pthread_sigmask, SIG_BLOCK
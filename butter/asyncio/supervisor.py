@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+from ..supervisor import Supervisor as _Supervisor
+from .utils import coroutine as _coroutine
+import asyncio as _asyncio
+
+
+class Supervisor_async:
+    """Reap children from the event loop, see butter.supervisor.Supervisor
+
+    spawn() and watch() return futures that resolve to the ChildExit of the
+    child. As every child is reaped, do not mix with asyncio's own
+    subprocess support (create_subprocess_exec()) which waits for its children
+
+    >>> supervisor = Supervisor_async()
+    >>> proc, exited = supervisor.spawn(['sleep', '1'])
+    >>> child = yield from exited
+    >>> child.returncode
+    0
+    """
+    def __init__(self, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._supervisor = _Supervisor()
+        self._loop.add_reader(self._supervisor.fileno(), self._supervisor.reap)
+
+    def spawn(self, args, **kwargs):
+        """Start a child with subprocess.Popen
+
+        Returns
+        --------
+        :return: The Popen object and a future for its ChildExit
+        :rtype: tuple
+        """
+        future = _asyncio.Future(loop=self._loop)
+        proc = self._supervisor.spawn(args, self._callback(future), **kwargs)
+        return proc, future
+
+    def watch(self, pid):
+        """A future for the ChildExit of a child started by other means"""
+        future = _asyncio.Future(loop=self._loop)
+        self._supervisor.watch(pid, self._callback(future))
+        return future
+
+    @staticmethod
+    def _callback(future):
+        def done(child):
+            if not future.done():
+                future.set_result(child)
+        return done
+
+    @_coroutine
+    def wait(self, pid):
+        """Wait for the child 'pid' to exit, returning its ChildExit"""
+        return (yield from self.watch(pid))
+
+    def __len__(self):
+        return len(self._supervisor)
+
+    def close(self):
+        self._loop.remove_reader(self._supervisor.fileno())
+        self._supervisor.close()
+
+    def __repr__(self):
+        return "<{} children={}>".format(self.__class__.__name__, len(self._supervisor))
@@ -1,33 +1,67 @@
 #!/usr/bih/env python
 from ..timerfd import CLOCK_REALTIME as _CLOCK_REALTIME
+from ..timerfd import CLOCK_MONOTONIC as _CLOCK_MONOTONIC
 from ..timerfd import Timer as _Timer
+from ..timerfd import TimerWheel as _TimerWheel
+from ..timerfd import WHEEL_TICK as _WHEEL_TICK
+from ..timerfd import _monotonic_ns
+from ..timerfd import RateLimiter as _RateLimiter
+from ..timerfd import RATE_TICK as _RATE_TICK
+from ..timerfd import DeadlineScheduler as _DeadlineScheduler
 from collections import deque as _deque
+from .utils import coroutine as _coroutine
 import asyncio as _asyncio
+import sys as _sys
 
 class Timerfd_async:
-    def __init__(self, clock_type=_CLOCK_REALTIME, flags=0, *, loop=None):
+    def __init__(self, clock_type=_CLOCK_MONOTONIC, flags=0, *, loop=None):
         self._loop = loop or _asyncio.get_event_loop()
         self._timerfd = _Timer(clock_type, flags)
         self._getters = _deque()
+        # expirations read from the fd that no one has waited for yet
+        self._pending = 0
+        self._reading = False
+        self._persistent = False
         
-        self.set_one_off = self._timerfd.set_one_off
-        self.set_reoccuring = self._timerfd.set_reoccuring
-        self.enabled = self._timerfd.__class__.__dict__['enabled']
-        self.disabled = self._timerfd.__class__.__dict__['disabled']
+        self.every = self._timerfd.every
+        self.after = self._timerfd.after
         self.disable = self._timerfd.disable
+        self.update = self._timerfd.update
         self.get_current = self._timerfd.get_current
+        self.enable_stats = self._timerfd.enable_stats
+        self.disable_stats = self._timerfd.disable_stats
+
+    @property
+    def enabled(self):
+        return self._timerfd.enabled
+
+    @property
+    def stats(self):
+        """The TimerStats being recorded or None, see Timer.enable_stats()"""
+        return self._timerfd.stats
         
-    @_asyncio.coroutine
+    @_coroutine
     def wait(self):
         """Wait for the timer to expire, returning how many events have 
         elappsed since the last call to wait()
 
         Returns
         --------
-        :return: The current count of the timer
+        :return: The current count of the timer, None if the timer was closed while waiting
         :rtype: int
         """
-        self._loop.add_reader(self._timerfd.fileno(), self._read_event)
+        stats = self._timerfd.stats
+        if stats is not None:
+            # the handler for the last expiry has finished
+            stats.handler_done(_monotonic_ns())
+
+        if self._pending and not self._getters:
+            value, self._pending = self._pending, 0
+            return value
+
+        if not self._reading:
+            self._loop.add_reader(self._timerfd.fileno(), self._read_event)
+            self._reading = True
 
         waiter = _asyncio.Future(loop=self._loop)
 
@@ -35,6 +69,29 @@ class Timerfd_async:
 
         return (yield from waiter)
 
+    def ticks(self, interval):
+        """Repeat every 'interval' seconds, returns a TimerTicks reporting the
+        expirations since the last call to its next()
+
+        The fd stays registered with the loop between calls so when the loop
+        (or the caller) stalls the ticks that were missed are reported rather
+        than lost, letting periodic work catch up instead of drifting
+
+        >>> ticks = timer.ticks(10)
+        >>> while True:
+        ...     count = yield from ticks.next()
+        ...     if count is None:
+        ...         break # the timer was closed
+        ...     collect_metrics(elapsed=count * 10)
+
+        On python 3.5+ the TimerTicks can also be used with 'async for'
+        """
+        interval = int(round(interval * 1000000000))
+        seconds, nano_seconds = divmod(interval, 1000000000)
+        self._timerfd.every(seconds, nano_seconds).after(seconds, nano_seconds).update()
+        self._persistent = True
+        return TimerTicks(self)
+
     def _consume_done_getters(self):
         # Delete waiters at the head of the get() queue who've timed out.
         while self._getters and self._getters[0].done():
@@ -45,24 +102,251 @@ class Timerfd_async:
         self._put_event(value)
     
     def _put_event(self, value):
-        """Put an item into the queue without blocking.
-
-        If no free slot is immediately available, raise QueueFull.
-        """
-        self._loop.remove_reader(self._timerfd.fileno())
+        """Hand the expirations to the first waiter, keeping them for the next
+        call to wait() if there is none"""
+        self._pending += value
 
         self._consume_done_getters()
 
-        for getter in self._getters:
-            getter.set_result(value)
+        if self._getters:
+            self._getters.popleft().set_result(self._pending)
+            self._pending = 0
+
+        if not self._getters and not self._persistent:
+            self._loop.remove_reader(self._timerfd.fileno())
+            self._reading = False
 
     def close(self):
+        if self._reading:
+            self._loop.remove_reader(self._timerfd.fileno())
+            self._reading = False
         self._timerfd.close()
+        # the timer will never expire again, release anyone still waiting
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
 
     def __repr__(self):
         fd = self._timerfd._fd or "closed"
         return "<{} fd={}>".format(self.__class__.__name__, fd)
 
+class TimerTicks:
+    """Expirations of a repeating Timerfd_async, see Timerfd_async.ticks()"""
+    def __init__(self, timer):
+        self._timer = timer
+
+    @_coroutine
+    def next(self):
+        """Wait for the timer to expire
+
+        Returns
+        --------
+        :return: The expirations since the last call, None once the timer is closed
+        :rtype: int
+        """
+        if self._timer._timerfd.closed():
+            return None
+        return (yield from self._timer.wait())
+
+    if _sys.version_info >= (3, 5):
+        def __aiter__(self):
+            return self
+
+        @_coroutine
+        def __anext__(self):
+            count = yield from self.next()
+            if count is None:
+                raise StopAsyncIteration
+            return count
+
+class TimerWheel_async:
+    """Many timers on the event loop sharing a single timerfd
+
+    Callbacks are run on the loop when they fall due, sleep() suspends a
+    coroutine without creating a timerfd (or loop.call_later() heap entry)
+    per call
+
+    >>> wheel = TimerWheel_async(tick=0.01)
+    >>> handle = wheel.schedule(30, connection.close)
+    >>> wheel.reschedule(handle, 30) # activity, push the timeout back
+    >>> yield from wheel.sleep(0.5)
+    """
+    def __init__(self, tick=_WHEEL_TICK, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._wheel = _TimerWheel(tick)
+        self._loop.add_reader(self._wheel.fileno(), self._wheel.expire)
+
+        self.schedule = self._wheel.schedule
+        self.cancel = self._wheel.cancel
+        self.reschedule = self._wheel.reschedule
+
+    @property
+    def overruns(self):
+        """Ticks that passed before the loop got around to servicing the wheel"""
+        return self._wheel.overruns
+
+    @_coroutine
+    def sleep(self, delay, result=None):
+        """Suspend the calling coroutine for 'delay' seconds, rounded up to the next tick"""
+        waiter = _asyncio.Future(loop=self._loop)
+        handle = self._wheel.schedule(delay, self._wake, waiter, result)
+        try:
+            return (yield from waiter)
+        finally:
+            self._wheel.cancel(handle)
+
+    @staticmethod
+    def _wake(waiter, result):
+        if not waiter.done():
+            waiter.set_result(result)
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def close(self):
+        self._loop.remove_reader(self._wheel.fileno())
+        self._wheel.close()
+
+    def __repr__(self):
+        return "<{} tick={}s timers={}>".format(self.__class__.__name__, self._wheel.tick, len(self._wheel))
+
+class RateLimiter_async:
+    """Token buckets refilled by a single timerfd, see butter.timerfd.RateLimiter
+
+    Coroutines waiting in acquire() are served in order per key, the timerfd
+    is only watched while something is waiting
+
+    >>> limiter = RateLimiter_async(rate=100, capacity=20)
+    >>> yield from limiter.acquire('tenant-a')
+    """
+    def __init__(self, rate, capacity, period=_RATE_TICK, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._limiter = _RateLimiter(rate, capacity, period)
+        # key -> deque of (n, future)
+        self._waiters = {}
+        self._reading = False
+
+        self.configure = self._limiter.configure
+        self.remove = self._limiter.remove
+        self.tokens = self._limiter.tokens
+        self.try_acquire = self._limiter.try_acquire
+
+    @_coroutine
+    def acquire(self, key, n=1):
+        """Take 'n' tokens from the bucket for 'key', waiting until they are available
+
+        Exceptions
+        -----------
+        :raises ValueError: n is larger than the bucket can ever hold
+        """
+        waiters = self._waiters.get(key)
+        if not waiters:
+            if self._limiter.try_acquire(key, n):
+                return True
+            waiters = self._waiters[key] = _deque()
+
+        waiter = _asyncio.Future(loop=self._loop)
+        entry = (n, waiter)
+        waiters.append(entry)
+        if not self._reading:
+            self._loop.add_reader(self._limiter.fileno(), self._refill)
+            self._reading = True
+
+        try:
+            return (yield from waiter)
+        except _asyncio.CancelledError:
+            if entry in waiters:
+                waiters.remove(entry)
+            if not waiters and self._waiters.get(key) is waiters:
+                del self._waiters[key]
+                if not self._waiters and self._reading:
+                    self._loop.remove_reader(self._limiter.fileno())
+                    self._reading = False
+            raise
+
+    def _refill(self):
+        self._limiter.poll()
+        for key in list(self._waiters):
+            waiters = self._waiters[key]
+            while waiters:
+                n, waiter = waiters[0]
+                if waiter.done():
+                    waiters.popleft()
+                    continue
+                try:
+                    if not self._limiter.try_acquire(key, n, poll=False):
+                        break
+                except ValueError as err:
+                    waiters.popleft()
+                    waiter.set_exception(err)
+                    continue
+                waiters.popleft()
+                waiter.set_result(True)
+            if not waiters:
+                del self._waiters[key]
+
+        if not self._waiters:
+            self._loop.remove_reader(self._limiter.fileno())
+            self._reading = False
+
+    def close(self):
+        if self._reading:
+            self._loop.remove_reader(self._limiter.fileno())
+            self._reading = False
+        self._limiter.close()
+
+    def __repr__(self):
+        return "<{} waiting={}>".format(self.__class__.__name__, sum(len(w) for w in self._waiters.values()))
+
+class DeadlineScheduler_async:
+    """Absolute time jobs run on the event loop from one timerfd, see butter.timerfd.DeadlineScheduler
+
+    >>> scheduler = DeadlineScheduler_async()
+    >>> scheduler.every(60, rotate_logs)
+    >>> yield from scheduler.sleep_until(time.time() + 3600)
+    """
+    def __init__(self, clock_type=_CLOCK_REALTIME, *, loop=None):
+        self._loop = loop or _asyncio.get_event_loop()
+        self._scheduler = _DeadlineScheduler(clock_type)
+        self._loop.add_reader(self._scheduler.fileno(), self._scheduler.expire)
+
+        self.at = self._scheduler.at
+        self.every = self._scheduler.every
+        self.cancel = self._scheduler.cancel
+        self.time = self._scheduler.time
+        self.next_deadline = self._scheduler.next_deadline
+
+    @property
+    def clock_jumps(self):
+        """How many times the wall clock was set while jobs were scheduled"""
+        return self._scheduler.clock_jumps
+
+    @_coroutine
+    def sleep_until(self, when, result=None):
+        """Suspend the calling coroutine until 'when' seconds on the scheduler's clock"""
+        waiter = _asyncio.Future(loop=self._loop)
+        job = self._scheduler.at(when, self._wake, waiter, result)
+        try:
+            return (yield from waiter)
+        finally:
+            self._scheduler.cancel(job)
+
+    @staticmethod
+    def _wake(waiter, result):
+        if not waiter.done():
+            waiter.set_result(result)
+
+    def __len__(self):
+        return len(self._scheduler)
+
+    def close(self):
+        self._loop.remove_reader(self._scheduler.fileno())
+        self._scheduler.close()
+
+    def __repr__(self):
+        return "<{} jobs={}>".format(self.__class__.__name__, len(self._scheduler))
+
 def watcher(loop):
     from asyncio import sleep
     from time import time
@@ -71,7 +355,7 @@ def watcher(loop):
     print(t)
     
     time_val = 0.5
-    t.set_reoccuring(time_val)
+    t.every(nano_seconds=int(time_val * 1000000000)).update()
     print("Setting time interval to {:.2f} seconds".format(time_val))
 
     for i in range(5):
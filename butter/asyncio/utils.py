@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""utils: helpers shared by the asyncio front ends"""
+import asyncio as _asyncio
+
+try:
+    coroutine = _asyncio.coroutine
+except AttributeError:
+    # removed in python 3.11, the event loop still runs generator based
+    # coroutines marked with types.coroutine
+    from types import coroutine
+    from inspect import CO_ITERABLE_COROUTINE as _CO_ITERABLE_COROUTINE
+
+    def iscoroutinefunction(func):
+        """True for 'async def' functions and generators decorated with coroutine"""
+        if _asyncio.iscoroutinefunction(func):
+            return True
+        code = getattr(func, '__code__', None)
+        return code is not None and bool(code.co_flags & _CO_ITERABLE_COROUTINE)
+else:
+    iscoroutinefunction = _asyncio.iscoroutinefunction
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""batch: flush buffered records when enough have built up or they have waited long enough
+
+Producers (on any thread) add() records to a BatchFlusher, the consumer
+gets them back in batches. Crossing the size threshold increments an
+Eventfd and the first record of each batch arms a one shot Timer for the
+latency deadline, so the consumer wakes once per batch rather than once
+per record
+
+>>> flusher = BatchFlusher(size=500, latency=0.05)
+>>> flusher.add(record)        # from any thread
+>>> for batch in flusher:      # in the consumer
+...     db.insert_many(batch)
+"""
+
+from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
+from .eventfd import Eventfd as _Eventfd
+from .eventfd import EFD_NONBLOCK as _EFD_NONBLOCK
+from .timerfd import Timer as _Timer
+from .timerfd import Histogram as _Histogram
+from .timerfd import CLOCK_MONOTONIC as _CLOCK_MONOTONIC
+from .timerfd import TFD_NONBLOCK as _TFD_NONBLOCK
+from .timerfd import _monotonic_ns
+from select import select as _select
+from errno import EAGAIN as _EAGAIN
+from threading import Lock as _Lock
+
+BATCH_SIZE = 1000 # records that trigger a flush
+BATCH_LATENCY = 0.1 # seconds the oldest record may wait before a flush
+
+SIZE = 'size' # the batch reached the size threshold
+DEADLINE = 'deadline' # the oldest record reached the latency deadline
+MANUAL = 'manual' # flush() was called
+
+
+class FlushStats(object):
+    """Measurements of the batches handed to the consumer
+
+    sizes: Histogram of the records in each batch
+    latency: Histogram of the ns between the first record of a batch being
+             added and the batch being taken
+    reasons: Flushes by reason (SIZE, DEADLINE, MANUAL)
+    """
+    def __init__(self):
+        self.sizes = _Histogram()
+        self.latency = _Histogram()
+        self.reasons = {SIZE: 0, DEADLINE: 0, MANUAL: 0}
+        self.flushes = 0
+        self.records = 0
+
+    def flushed(self, size, latency, reason):
+        self.sizes.record(size)
+        self.latency.record(latency)
+        self.reasons[reason] += 1
+        self.flushes += 1
+        self.records += size
+
+    def summary(self, percentiles=(50, 99)):
+        """Return a dict of the size and latency (ns) percentiles and counters"""
+        result = {'flushes': self.flushes, 'records': self.records}
+        result.update(self.reasons)
+        for percent in percentiles:
+            result['size_p{}'.format(percent)] = self.sizes.percentile(percent)
+            result['latency_p{}'.format(percent)] = self.latency.percentile(percent)
+        return result
+
+    def clear(self):
+        self.sizes.clear()
+        self.latency.clear()
+        self.reasons = dict.fromkeys(self.reasons, 0)
+        self.flushes = 0
+        self.records = 0
+
+
+class BatchFlusher(object):
+    def __init__(self, size=BATCH_SIZE, latency=BATCH_LATENCY, closefd=_CLOEXEC_DEFAULT):
+        """Buffer records and hand them out 'size' at a time or after 'latency' seconds
+
+        Arguments
+        ----------
+        :param int size: Flush once this many records are buffered
+        :param float latency: Flush once the oldest buffered record is this many seconds old
+        :param bool closefd: Close the eventfd and timerfd on exec
+        """
+        assert size > 0, "size must be at least 1"
+        self.size = size
+        self.latency = latency
+        self._latency_ns = int(round(latency * 1000000000))
+        # a zero it_value would disarm the timer rather than fire immediately
+        self._deadline = divmod(max(self._latency_ns, 1), 1000000000)
+
+        self._lock = _Lock()
+        self._records = []
+        self._first = None
+        self._signalled = False
+        self.stats = FlushStats()
+
+        self._eventfd = _Eventfd(0, _EFD_NONBLOCK, closefd=closefd)
+        try:
+            self._timer = _Timer(_CLOCK_MONOTONIC, _TFD_NONBLOCK, closefd=closefd)
+        except:
+            self._eventfd.close()
+            raise
+        self._timer.every(0, 0).after(*self._deadline)
+
+    def filenos(self):
+        """The eventfd (size) and timerfd (deadline) to wait on, either becoming
+        readable means take() will return a batch"""
+        return [self._eventfd.fileno(), self._timer.fileno()]
+
+    def add(self, record):
+        """Buffer a record, safe to call from any thread"""
+        with self._lock:
+            records = self._records
+            records.append(record)
+            if len(records) == 1:
+                self._started()
+            if len(records) >= self.size:
+                self._full()
+
+    def extend(self, records):
+        """Buffer several records, safe to call from any thread"""
+        if not records:
+            return
+        with self._lock:
+            empty = not self._records
+            self._records.extend(records)
+            if empty:
+                self._started()
+            if len(self._records) >= self.size:
+                self._full()
+
+    # both called with the lock held
+    def _started(self):
+        self._first = _monotonic_ns()
+        self._timer.update()
+
+    def _full(self):
+        if not self._signalled:
+            self._signalled = True
+            self._eventfd.increment()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _drain(self, event):
+        try:
+            event.read_event()
+        except OSError as err:
+            if err.errno != _EAGAIN:
+                raise
+
+    def take(self, reason=None):
+        """Take the buffered records if a batch is due (or unconditionally if
+        'reason' is given) and reset the eventfd and timer for the next batch
+
+        Returns
+        --------
+        :return: The records in the order they were added, empty if no batch is due
+        :rtype: list
+        """
+        with self._lock:
+            records = self._records
+            if not records:
+                return []
+
+            now = _monotonic_ns()
+            if reason is None:
+                if len(records) >= self.size:
+                    reason = SIZE
+                elif now - self._first >= self._latency_ns:
+                    reason = DEADLINE
+                else:
+                    return []
+
+            if self._signalled:
+                self._drain(self._eventfd)
+            # rearming also resets any expiration count
+            self._timer.disable().update()
+            self._timer.after(*self._deadline)
+
+            self.stats.flushed(len(records), now - self._first, reason)
+            self._records = []
+            self._first = None
+            self._signalled = False
+        return records
+
+    def flush(self):
+        """Take whatever is buffered now, regardless of size or age"""
+        return self.take(MANUAL)
+
+    def wait(self, timeout=None):
+        """Wait up to 'timeout' seconds for a batch
+
+        Returns
+        --------
+        :return: The batch, empty if the timeout expired first
+        :rtype: list
+        """
+        fds = self.filenos()
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            rd, _, _ = _select(fds, [], [], timeout)
+            if rd:
+                batch = self.take()
+                if batch:
+                    return batch
+            if deadline is not None:
+                timeout = deadline - _monotonic()
+                if timeout <= 0:
+                    return []
+
+    def __iter__(self):
+        while True:
+            yield self.wait()
+
+    def close(self):
+        self._eventfd.close()
+        self._timer.close()
+
+    def __repr__(self):
+        return "<{} size={} latency={}s buffered={}>".format(self.__class__.__name__,
+                                                            self.size,
+                                                            self.latency,
+                                                            len(self._records))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""channel: hand items from producer threads to a consumer with one wakeup per batch
+
+A Channel is a deque paired with an Eventfd. Producers append to the deque
+and only increment the eventfd when the consumer has drained everything and
+may be going to sleep, while the consumer is busy items are appended with no
+syscall at all. The consumer takes everything that has built up on each
+wakeup, so a burst of puts costs one wakeup rather than one per item (as
+loop.call_soon_threadsafe() does)
+
+>>> channel = Channel()
+>>> channel.put(item)        # from any thread
+>>> for item in channel.get_batch():
+...     handle(item)
+"""
+
+from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
+from .eventfd import Eventfd as _Eventfd
+from .eventfd import EFD_NONBLOCK as _EFD_NONBLOCK
+from collections import deque as _deque
+from select import select as _select
+from errno import EAGAIN as _EAGAIN
+
+
+class Channel(object):
+    def __init__(self, closefd=_CLOEXEC_DEFAULT):
+        """Create a new Channel
+
+        Arguments
+        ----------
+        :param bool closefd: Close the eventfd on exec
+        """
+        # deque.append()/popleft() are atomic, no lock is needed
+        self._items = _deque()
+        self._eventfd = _Eventfd(0, _EFD_NONBLOCK, closefd=closefd)
+        # True once the consumer has drained the channel, the next put signals
+        self._idle = True
+        self.wakeups = 0
+
+    def fileno(self):
+        """The eventfd, readable when items have been put since the last drain()"""
+        return self._eventfd.fileno()
+
+    def put(self, item):
+        """Add an item, safe to call from any thread"""
+        self._items.append(item)
+        if self._idle:
+            # several producers may get here at once, their increments are
+            # merged by the eventfd into one wakeup
+            self._idle = False
+            self.wakeups += 1
+            self._eventfd.increment()
+
+    def put_many(self, items):
+        """Add several items with at most one wakeup, safe to call from any thread"""
+        self._items.extend(items)
+        if self._idle and self._items:
+            self._idle = False
+            self.wakeups += 1
+            self._eventfd.increment()
+
+    def _pop_all(self, items):
+        popleft = self._items.popleft
+        try:
+            while True:
+                items.append(popleft())
+        except IndexError:
+            pass
+
+    def drain(self):
+        """Take every item in the channel without blocking
+
+        Returns
+        --------
+        :return: The items in the order they were put
+        :rtype: list
+        """
+        try:
+            self._eventfd.read_event()
+        except OSError as err:
+            if err.errno != _EAGAIN:
+                raise
+
+        items = []
+        self._pop_all(items)
+        self._idle = True
+        # a producer may have appended after the first pass but seen _idle
+        # as False, pick those up here, later ones will signal
+        self._pop_all(items)
+        return items
+
+    def get_batch(self, timeout=None):
+        """Wait up to 'timeout' seconds for items and take all of them
+
+        Returns
+        --------
+        :return: The items in the order they were put, empty on timeout
+        :rtype: list
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        while True:
+            items = self.drain()
+            if items:
+                return items
+
+            if deadline is not None:
+                timeout = deadline - _monotonic()
+                if timeout <= 0:
+                    return []
+            _select([self._eventfd], [], [], timeout)
+
+    def __iter__(self):
+        while True:
+            for item in self.get_batch():
+                yield item
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        self._eventfd.close()
+
+    def __repr__(self):
+        fd = "closed" if self._eventfd.closed() else self._eventfd.fileno()
+        return "<{} fd={} items={} wakeups={}>".format(self.__class__.__name__, fd, len(self._items), self.wakeups)
@@ -7,6 +7,13 @@ from ._eventfd import EFD_CLOEXEC, EFD_NONBLOCK, EFD_SEMAPHORE
 from ._eventfd import str_to_events, event_to_str
 from ._eventfd import eventfd
 from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
+from select import select as _select
+from time import sleep as _sleep
+import socket as _socket
+import array as _array
+import errno as _errno
+import fcntl as _fcntl
 import os as _os
 
 class Eventfd(_Eventlike):
@@ -53,3 +60,177 @@ class Eventfd(_Eventlike):
 
     def __int__(self):
         return self.read_event()
+
+
+SEMAPHORE_BACKOFF_MAX = 0.05 # seconds, longest wait between retries of a multi token acquire
+
+
+class EventfdSemaphore(_Eventlike):
+    """A counting semaphore shared between processes, backed by an EFD_SEMAPHORE eventfd
+
+    Each read of a semaphore eventfd takes a single token (blocking, or failing
+    with EAGAIN, at 0) and writes add tokens, the kernel does the counting so
+    any process holding the fd takes part without a broker. The fd is
+    inherited by children on fork (and exec unless closefd is set) and can be
+    sent to unrelated processes over a unix socket with send()/recv()
+
+    >>> db_slots = EventfdSemaphore(10)   # before forking the workers
+    >>> with db_slots:
+    ...     query()
+
+    acquire(n) for n > 1 is all or nothing, tokens taken before the
+    semaphore ran out are given back and the acquire retried so two
+    processes can not each hold part of what the other needs
+    """
+    def __init__(self, value=0, closefd=_CLOEXEC_DEFAULT, fd=None):
+        """Create a new semaphore holding 'value' tokens
+
+        Arguments
+        ----------
+        :param int value: The tokens initially available
+        :param bool closefd: Close the eventfd when a new program is exec'd
+        :param int fd: Use an existing semaphore eventfd (see from_fd()) rather than creating one
+        """
+        super(EventfdSemaphore, self).__init__()
+        if fd is None:
+            fd = eventfd(value, EFD_SEMAPHORE|EFD_NONBLOCK, closefd=closefd)
+        self._fd = fd
+
+    @classmethod
+    def from_fd(cls, fd):
+        """Wrap a semaphore eventfd inherited or recived from another process
+
+        Exceptions
+        -----------
+        :raises ValueError: fd is an eventfd without EFD_SEMAPHORE
+        """
+        if hasattr(fd, 'fileno'):
+            fd = fd.fileno()
+        # older kernels do not report the mode
+        if _fdinfo(fd).get('eventfd-semaphore', '1') != '1':
+            raise ValueError("fd is not an EFD_SEMAPHORE eventfd")
+        flags = _fcntl.fcntl(fd, _fcntl.F_GETFL)
+        if not flags & _os.O_NONBLOCK:
+            _fcntl.fcntl(fd, _fcntl.F_SETFL, flags | _os.O_NONBLOCK)
+        return cls(fd=fd)
+
+    @property
+    def value(self):
+        """The tokens currently available (racy, for monitoring only)"""
+        return int(_fdinfo(self.fileno())['eventfd-count'], 16)
+
+    def take(self, n=1):
+        """Take 'n' tokens if they are all available without blocking, any
+        taken along the way are given back otherwise
+
+        Unlike try_acquire() this tells a caller that is about to wait
+        whether the semaphore was empty (wait for it to become readable) or
+        held too few tokens (readable already, poll instead)
+
+        :return: How many tokens were available (n on success)
+        :rtype: int
+        """
+        fd = self.fileno()
+        taken = 0
+        try:
+            while taken < n:
+                _os.read(fd, 8)
+                taken += 1
+        except OSError as err:
+            if err.errno != _errno.EAGAIN:
+                self.release(taken)
+                raise
+            self.release(taken)
+        return taken
+
+    def try_acquire(self, n=1):
+        """Take 'n' tokens if they are available without blocking
+
+        :return: True if the tokens were taken
+        :rtype: bool
+        """
+        return self.take(n) == n
+
+    def acquire(self, n=1, timeout=None):
+        """Take 'n' tokens, blocking until they are available
+
+        Arguments
+        ----------
+        :param int n: The tokens to take
+        :param float timeout: Give up after this many seconds, None waits forever
+
+        Returns
+        --------
+        :return: True if the tokens were taken, False on timeout
+        :rtype: bool
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        backoff = 0.001
+        while True:
+            taken = self.take(n)
+            if taken == n:
+                return True
+
+            wait = None
+            if deadline is not None:
+                wait = deadline - _monotonic()
+                if wait <= 0:
+                    return False
+            if taken:
+                # the fd is readable but holds too few tokens, it would not
+                # tell us when more are released
+                _sleep(backoff if wait is None else min(backoff, wait))
+                backoff = min(backoff * 2, SEMAPHORE_BACKOFF_MAX)
+            else:
+                _select([self], [], [], wait)
+
+    def release(self, n=1):
+        """Return 'n' tokens to the semaphore"""
+        if n:
+            _os.write(self.fileno(), event_to_str(n))
+
+    def _read_events(self):
+        # acquire a single token, for use with select()/wait()
+        _os.read(self.fileno(), 8)
+        return [1]
+
+    def send(self, sock):
+        """Send the semaphore to another process over a connected AF_UNIX socket"""
+        sock.sendmsg([b'S'], [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, _array.array('i', [self.fileno()]))])
+
+    @classmethod
+    def recv(cls, sock):
+        """Recive a semaphore sent with send() over an AF_UNIX socket
+
+        Exceptions
+        -----------
+        :raises ValueError: The message did not carry a file descriptor
+        """
+        fds = _array.array('i')
+        msg, ancdata, flags, addr = sock.recvmsg(1, _socket.CMSG_LEN(fds.itemsize))
+        for level, kind, data in ancdata:
+            if level == _socket.SOL_SOCKET and kind == _socket.SCM_RIGHTS:
+                fds.frombytes(data[:fds.itemsize])
+        if not fds:
+            raise ValueError("No file descriptor recived")
+        return cls.from_fd(fds[0])
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __repr__(self):
+        fd = "closed" if self.closed() else self.fileno()
+        return "<{} fd={}>".format(self.__class__.__name__, fd)
+
+
+def _fdinfo(fd):
+    info = {}
+    with open('/proc/self/fdinfo/{}'.format(fd)) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            info[key.strip()] = value.strip()
+    return info
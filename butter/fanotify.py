@@ -4,11 +4,35 @@
 from .utils import get_buffered_length as _get_buffered_length
 from .utils import Eventlike as _Eventlike
 from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
+from .eventfd import Eventfd as _Eventfd, EFD_NONBLOCK as _EFD_NONBLOCK
 
 from os import O_RDONLY, O_WRONLY, O_RDWR
 from os import read as _read
+from os import write as _write, writev as _writev, sysconf as _sysconf
+from os import open as _open, close as _close
+from os.path import join as _join
+from os import fsdecode as _fsdecode
+from os import fstat as _fstat, readlink as _readlink
+from os import dup as _dup
+from os import getpid as _getpid
+from stat import S_ISREG as _S_ISREG
+from collections import OrderedDict as _OrderedDict
+from collections import deque as _deque
+from collections import namedtuple as _namedtuple
+from heapq import heappush as _heappush, heappop as _heappop, heapreplace as _heapreplace
+from select import select as _select
+from itertools import count as _count
+from errno import EAGAIN as _EAGAIN, ENOENT as _ENOENT
+from threading import Lock as _Lock
+import logging as _logging
 
-from ._fanotify import fanotify_init, fanotify_mark, str_to_events
+from ._fanotify import fanotify_init, fanotify_mark, str_to_events, str_to_batch
+from ._fanotify import FanotifyBatch, EVENT_DTYPE, METADATA_LEN
+from ._fanotify import PROC_FD_PATH as _PROC_FD_PATH
+from ._fanotify import response_to_str, RESPONSE_LEN
+from ._fanotify import FanotifyFid, get_fsid, open_by_handle_at
+from ._fanotify import FdGauge, close_all, READ_EVENTS_MAX
 
 # Import all the constants
 from ._fanotify import C as _C
@@ -18,17 +42,70 @@ for key in dir(_C):
         _l[key] = getattr(_C, key)
 del key, _C, _l
 
+RESOLVER_CACHE_SIZE = 4096 # paths remembered by a PathResolver
+PERM_WORKERS = 4 # threads used by a PermissionResponder to make decisions
+PERM_TIMEOUT = 1.0 # seconds before a PermissionResponder gives the default verdict
+LATENCY_SAMPLES = 1024 # recent decision latencies kept by a PermissionResponder
+IGNORE_THRESHOLD = 100 # events per window before an AdaptiveIgnore silences a file
+IGNORE_WINDOW = 1.0 # seconds, the sliding window events are counted over
+IGNORE_EXPIRY = 30.0 # seconds an AdaptiveIgnore keeps a file silenced
+SKETCH_WIDTH = 4096 # counters per row of a CountMinSketch
+SKETCH_DEPTH = 4 # rows (independent hashes) of a CountMinSketch
+TOP_K = 100 # (pid, file, mask) combinations reported by an AccessAggregator
+SNAPSHOT_INTERVAL = 10.0 # seconds between AccessAggregator snapshots
+HASH_WORKERS = 4 # processes used by a ContentHasher
+HASH_CACHE_SIZE = 65536 # digests remembered by a ContentHasher
+HASH_ALGORITHM = 'sha256'
+# metadata plus a dir fid with name and a file fid, each fid being a header,
+# a file_handle of up to MAX_HANDLE_SZ (128) bytes and a name of up to NAME_MAX
+FID_EVENT_LEN_MAX = METADATA_LEN + 2 * (12 + 8 + 128 + 256)
+
+try:
+    IOV_MAX = _sysconf('SC_IOV_MAX')
+except (ValueError, OSError):
+    IOV_MAX = 1024
+
+_log = _logging.getLogger(__name__)
+
 class Fanotify(_Eventlike):
     blocking = True
+    _flags = 0
+    _reads = 0
+    _events_read = 0
     
-    def __init__(self, flags, event_flags=O_RDONLY, closefd=_CLOEXEC_DEFAULT):
+    _read_events_max = READ_EVENTS_MAX
+    _auto_close = False
+    
+    def __init__(self, flags, event_flags=O_RDONLY, closefd=_CLOEXEC_DEFAULT,
+                 read_events_max=READ_EVENTS_MAX, auto_close=False):
+        """Create a new fanotify object
+
+        Arguments
+        ----------
+        :param int flags: Flags passed to fanotify_init (FAN_CLASS_*, FAN_NONBLOCK, FAN_REPORT_*)
+        :param int event_flags: Flags the event fds are opened with (O_RDONLY, O_RDWR, ...)
+        :param bool closefd: Close the fanotify fd on exec
+        :param int read_events_max: Most events (and so fds) to accept from one read()
+        :param bool auto_close: Resolve each event's filename then close its fd as soon
+                                as it is read, events are metadata only and can
+                                not leak fds
+        """
         super(self.__class__, self).__init__()
         self._fd = fanotify_init(flags, event_flags, closefd=closefd)
 
         self._events = []
+        self._flags = flags
+        # fsid -> fd on that filesystem, needed to open the file handles
+        # reported in FAN_REPORT_*FID modes
+        self._mount_fds = {}
+        self._read_events_max = read_events_max
+        self._auto_close = auto_close
+        self._gauge = FdGauge()
+        self._reads = 0
+        self._events_read = 0
 
         if flags & FAN_NONBLOCK:
-            self.blocking = false
+            self.blocking = False
         
         if event_flags & O_RDWR|O_WRONLY:
             self._mode = 'w+'
@@ -39,7 +116,69 @@ class Fanotify(_Eventlike):
 
     def watch(self, path, mask, flags=0, dfd=0):
         flags |= FAN_MARK_ADD
-        fanotify_mark(self.fileno(), path, mask, flags, dfd)
+        if not self.reports_fid:
+            fanotify_mark(self.fileno(), path, mask, flags, dfd)
+            return
+
+        # open the path before marking it so a failure here does not leave
+        # behind a mark whose events can never be resolved
+        fd = _open(path, O_RDONLY)
+        try:
+            fsid = get_fsid(fd)
+            fanotify_mark(self.fileno(), path, mask, flags, dfd)
+        except:
+            _close(fd)
+            raise
+
+        if fsid in self._mount_fds:
+            _close(fd)
+        else:
+            self._mount_fds[fsid] = fd
+
+    @property
+    def reports_fid(self):
+        """True if events identify files with FanotifyFid records instead of an fd"""
+        return bool(self._flags & (FAN_REPORT_FID|FAN_REPORT_DIR_FID))
+
+    def resolve_fid(self, event, flags=O_RDONLY):
+        """Return the path of an event reported in a FAN_REPORT_*FID mode
+
+        The file handle is only opened (with open_by_handle_at) when this is
+        called so events that are never looked at cost no fds. For
+        FAN_REPORT_DFID_NAME events this is the path of the directory joined
+        with the name of the entry. The path is also stored on the event so
+        event.filename returns it afterwards
+
+        Returns None if the file no longer exists or is on a filesystem that
+        was not passed to watch()
+        """
+        for fid in event.fids:
+            mount_fd = self._mount_fds.get(fid.fsid)
+            if mount_fd is None:
+                continue
+            try:
+                fd = open_by_handle_at(mount_fd, fid.handle, flags)
+            except ValueError:
+                continue
+            try:
+                path = _readlink(_PROC_FD_PATH.format(fd))
+            finally:
+                _close(fd)
+
+            if fid.name is not None and fid.name != b'.':
+                path = _join(path, _fsdecode(fid.name))
+            event._filename = path
+
+            return path
+
+        return None
+
+    def close(self):
+        # not set if __init__ never ran
+        for fd in getattr(self, '_mount_fds', {}).values():
+            _close(fd)
+        self._mount_fds = {}
+        super(Fanotify, self).close()
 
     def del_watch(self, path, mask, flags=0, dfd=0):
         self.ignore(path, mask, flags, dfd)
@@ -48,12 +187,952 @@ class Fanotify(_Eventlike):
         flags |= FAN_MARK_REMOVE
         fanotify_mark(self.fileno(), path, mask, flags, dfd)
 
-    def _read_events(self):
+    def add_ignore_mask(self, path, mask, flags=0, dfd=0):
+        """Stop the kernel generating the events in mask for path
+
+        The ignore mask is cleared the next time the file is modified unless
+        FAN_MARK_IGNORED_SURV_MODIFY is passed in flags
+        """
+        flags |= FAN_MARK_ADD|FAN_MARK_IGNORED_MASK
+        fanotify_mark(self.fileno(), path, mask, flags, dfd)
+
+    def remove_ignore_mask(self, path, mask, flags=0, dfd=0):
+        """Undo add_ignore_mask(), events in mask are reported again"""
+        flags |= FAN_MARK_REMOVE|FAN_MARK_IGNORED_MASK
+        fanotify_mark(self.fileno(), path, mask, flags, dfd)
+
+    def respond(self, fd, response):
+        """Allow or deny a FAN_OPEN_PERM/FAN_ACCESS_PERM event
+
+        :param int fd: The fd of the permission event being answered
+        :param int response: FAN_ALLOW or FAN_DENY
+        """
+        if hasattr(fd, 'fd'):
+            fd = fd.fd
+        _write(self.fileno(), response_to_str(fd, response))
+
+    def _read(self):
         fd = self.fileno()
 
-        buf_len = _get_buffered_length(fd)
-        raw_events = _read(fd, buf_len)
+        # FIONREAD only counts the metadata of each event, in FID modes leave
+        # room for the info records that follow it. Only read what is already
+        # queued so callers that select() first (or time out) never block here
+        event_len = FID_EVENT_LEN_MAX if self.reports_fid else METADATA_LEN
+        pending = _get_buffered_length(fd) // METADATA_LEN
+        if pending == 0:
+            return b''
+        if pending > self._read_events_max:
+            pending = self._read_events_max
+        self._reads += 1
+        return _read(fd, pending * event_len)
+
+    def _read_events(self):
+        raw_events = self._read()
+
+        events = str_to_events(raw_events, self._gauge)
+        self._events_read += len(events)
 
-        events = str_to_events(raw_events)
+        if self._auto_close:
+            for event in events:
+                if event.fd is not None and event.fd >= 0:
+                    event.filename
+                    event.close()
 
         return events
+
+    @property
+    def live_fds(self):
+        """Number of event fds read from this object that have not been closed"""
+        return self._gauge.live
+
+    @property
+    def stats(self):
+        """Counters for this object
+
+        reads: read() calls made on the fanotify fd
+        events: events read (not counting read_batch())
+        live_fds: event fds still open, a steady climb means events are not being closed
+        closed_fds: event fds closed so far
+        """
+        return {'reads': self._reads,
+                'events': self._events_read,
+                'live_fds': self._gauge.live,
+                'closed_fds': self._gauge.closed,
+                }
+
+    def read_batch(self):
+        """Read all pending events from the kernel as columns rather than objects
+
+        Returns a numpy structured array viewing the raw buffer read from the
+        kernel (fields: event_len, vers, reserved, metadata_len, mask, fd, pid)
+        or a FanotifyBatch of array.array columns if numpy is not installed. This
+        avoids creating a FanotifyEvent per event and lets statistics be
+        calculated in bulk, eg numpy.unique(batch['pid'], return_counts=True)
+
+        Events already cached by read_event() are not included and every fd in
+        batch['fd'] is open and must be closed by the caller
+        """
+        return str_to_batch(self._read(), self.reports_fid)
+
+
+
+class PathResolver(object):
+    """Cache of file paths keyed by (st_dev, st_ino)
+
+    FanotifyEvent.filename has to readlink() the event's fd for every event.
+    A PathResolver fstat()s the fd instead and only falls back to readlink()
+    the first time an inode is seen, on a busy file this turns the path lookup
+    into a dictionary hit
+
+    >>> resolver = PathResolver()
+    >>> for event in fanotify.read_events():
+    ...     print(resolver.resolve(event))
+    ...     event.close()
+
+    Entries are dropped when the file is seen with no links left (unlinked) and
+    can be dropped by path via invalidate_path() when a rename is observed. A
+    file with multiple hard links will always resolve to the first path seen
+    """
+    def __init__(self, maxsize=RESOLVER_CACHE_SIZE):
+        """Create a new PathResolver
+
+        :param int maxsize: Maximum number of paths to remember, least recently
+                            used paths are discarded first
+        """
+        self._maxsize = maxsize
+        self._cache = _OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_fd(self, fd):
+        """Return the path of an open fd, using the cache where possible"""
+        try:
+            st = _fstat(fd)
+        except OSError:
+            return "<Unknown>"
+
+        key = (st.st_dev, st.st_ino)
+        if st.st_nlink == 0:
+            # unlinked, whatever path we had is no longer valid
+            self._cache.pop(key, None)
+            return self._readlink(fd) or "<Unknown>"
+
+        try:
+            path = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            path = self._readlink(fd)
+            if path is None:
+                # may be transient (eg EMFILE), try again next time
+                return "<Unknown>"
+            self._cache[key] = path
+            if len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+
+        return path
+
+    def resolve(self, event):
+        """Return the path of a FanotifyEvent, the path is also stored on the
+        event so event.filename does not need to look it up again
+        """
+        path = self.resolve_fd(event.fd)
+        event._filename = path
+
+        return path
+
+    def resolve_all(self, events):
+        """Resolve a list of FanotifyEvents, returns a list of paths"""
+        return [self.resolve(event) for event in events]
+
+    def resolve_fds(self, fds):
+        """Resolve an iterable of fds such as the 'fd' column returned by
+        Fanotify.read_batch(), returns a list of paths
+        """
+        return [self.resolve_fd(int(fd)) for fd in fds]
+
+    def invalidate(self, dev, ino):
+        """Forget the path of a single inode"""
+        self._cache.pop((dev, ino), None)
+
+    def invalidate_path(self, path):
+        """Forget path and, if it is a directory, every path beneath it
+
+        Call this when a file or directory is renamed or deleted
+        """
+        prefix = path.rstrip('/') + '/'
+        stale = [key for key, cached in self._cache.items()
+                 if cached == path or cached.startswith(prefix)]
+        for key in stale:
+            del self._cache[key]
+
+    def observe(self, event, path=None):
+        """Invalidate cached paths made stale by a FAN_REPORT_*FID event
+
+        Only marks created in one of the FID reporting modes can receive
+        FAN_MOVED_FROM, FAN_DELETE, FAN_MOVE_SELF and FAN_DELETE_SELF events,
+        pass each event along with its path from Fanotify.resolve_fid() to
+        keep the cache accurate
+        """
+        if event.mask & (FAN_MOVED_FROM|FAN_DELETE|FAN_MOVE_SELF|FAN_DELETE_SELF):
+            path = path or event._filename
+            if path:
+                self.invalidate_path(path)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def _readlink(fd):
+        try:
+            return _readlink(_PROC_FD_PATH.format(fd))
+        except OSError:
+            return None
+
+
+
+class PermissionResponder(object):
+    """Answer fanotify permission events from a pool of worker threads
+
+    The process that triggered a FAN_OPEN_PERM or FAN_ACCESS_PERM event is
+    blocked until we reply so replies need to be fast. Events are handed to
+    'decide' on a thread pool, finished decisions are collected and written
+    back to the kernel with a single writev() (the kernel only accepts one
+    response per write() but handles a writev() one iovec at a time). Events
+    that are not decided within 'timeout' seconds are answered with 'default'
+
+    >>> def decide(event):
+    ...     return not event.filename.endswith('.secret')
+    >>> fanotify = Fanotify(FAN_CLASS_CONTENT)
+    >>> fanotify.watch('/srv', FAN_OPEN_PERM)
+    >>> responder = PermissionResponder(fanotify, decide)
+    >>> responder.run()
+
+    Event fds are closed once the event has been answered and the worker is
+    done with it, 'decide' must not close them itself
+    """
+    def __init__(self, fanotify, decide, workers=PERM_WORKERS, timeout=PERM_TIMEOUT, default=FAN_ALLOW):
+        """Create a new PermissionResponder
+
+        Arguments
+        ----------
+        :param Fanotify fanotify: The fanotify object to read events from and answer on
+        :param callable decide: Called with each FanotifyEvent, returns a bool or FAN_ALLOW/FAN_DENY
+        :param int workers: Number of threads to make decisions on
+        :param float timeout: Seconds to wait for a decision before answering with 'default'
+        :param int default: Verdict used on timeout or if 'decide' raises
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._fanotify = fanotify
+        self._decide = decide
+        self._timeout = timeout
+        self._default = default
+        self._pool = ThreadPoolExecutor(workers)
+
+        # key -> [deadline, start, event, answered, worker_done]
+        self._pending = _OrderedDict()
+        self._ids = _count()
+        # decisions are handed back from the workers via a deque and the
+        # eventfd wakes up whoever is selecting on fileno()
+        self._done = _deque()
+        self._wakeup = _Eventfd(flags=_EFD_NONBLOCK)
+
+        self.decisions = 0
+        self.timeouts = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies = _deque(maxlen=LATENCY_SAMPLES)
+
+    def fileno(self):
+        """The fd that becomes readable when a decision has been made"""
+        return self._wakeup.fileno()
+
+    def submit(self, events, now=None):
+        """Dispatch the permission events in 'events' to the worker pool
+
+        :return: The events that were not permission events
+        :rtype: list
+        """
+        now = _monotonic() if now is None else now
+
+        others = []
+        for event in events:
+            if not event.mask & (FAN_OPEN_PERM|FAN_ACCESS_PERM):
+                others.append(event)
+                continue
+            key = next(self._ids)
+            self._pending[key] = [now + self._timeout, now, event, False, False]
+            self._pool.submit(self._run_decision, key, event)
+
+        return others
+
+    def _run_decision(self, key, event):
+        try:
+            verdict = self._decide(event)
+        except Exception:
+            _log.exception("Permission decision failed, using the default verdict")
+            verdict = self._default
+        if verdict is True:
+            verdict = FAN_ALLOW
+        elif verdict is False:
+            verdict = FAN_DENY
+        self._done.append((key, verdict))
+        self._wakeup.increment()
+
+    def flush(self, now=None):
+        """Write all finished and timed out decisions to the kernel
+
+        :return: The number of events answered
+        :rtype: int
+        """
+        now = _monotonic() if now is None else now
+        try:
+            self._wakeup.read_events()
+        except OSError as err:
+            if err.errno != _EAGAIN:
+                raise
+
+        responses = []
+        while self._done:
+            key, verdict = self._done.popleft()
+            entry = self._pending[key]
+            entry[4] = True
+            if not entry[3]:
+                entry[3] = True
+                responses.append((entry, verdict))
+
+        for entry in self._pending.values():
+            if entry[0] > now:
+                break
+            if not entry[3]:
+                entry[3] = True
+                self.timeouts += 1
+                responses.append((entry, self._default))
+
+        self._write([response_to_str(entry[2].fd, verdict) for entry, verdict in responses])
+
+        for entry, verdict in responses:
+            latency = now - entry[1]
+            self.decisions += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latencies.append(latency)
+
+        # the fd can only be closed once it is both answered and the worker
+        # has stopped using it
+        for key in [key for key, entry in self._pending.items() if entry[3] and entry[4]]:
+            self._pending.pop(key)[2].close()
+
+        return len(responses)
+
+    def _write(self, buffers):
+        fd = self._fanotify.fileno()
+        while buffers:
+            try:
+                written = _writev(fd, buffers[:IOV_MAX]) // RESPONSE_LEN
+            except OSError as err:
+                # the kernel has already forgotten this event, skip it
+                if err.errno != _ENOENT:
+                    raise
+                written = 1
+            buffers = buffers[written:]
+
+    def next_timeout(self, now=None):
+        """Seconds until the oldest undecided event times out or None"""
+        for entry in self._pending.values():
+            if not entry[3]:
+                now = _monotonic() if now is None else now
+                return max(entry[0] - now, 0)
+        return None
+
+    def run_once(self, timeout=None):
+        """Wait for events or decisions, dispatch and answer them
+
+        :param float timeout: Maximum seconds to wait, None waits forever
+        :return: Any events read that were not permission events
+        :rtype: list
+        """
+        next_timeout = self.next_timeout()
+        if next_timeout is not None:
+            timeout = next_timeout if timeout is None else min(timeout, next_timeout)
+
+        rd, _, _ = _select([self._fanotify, self._wakeup], [], [], timeout)
+        others = []
+        if self._fanotify in rd:
+            others = self.submit(self._fanotify.read_events())
+        self.flush()
+
+        return others
+
+    def run(self):
+        """Answer permission events forever, other events are closed and dropped"""
+        while True:
+            for event in self.run_once():
+                event.close()
+
+    @property
+    def latency_mean(self):
+        return self.latency_total / self.decisions if self.decisions else 0.0
+
+    def close(self):
+        """Stop the workers and answer anything still outstanding with the default verdict"""
+        self._pool.shutdown(wait=True)
+        for entry in self._pending.values():
+            entry[0] = 0
+        self.flush()
+        self._wakeup.close()
+
+
+class AdaptiveIgnore(object):
+    """Silence files that generate too many events by moving the filter into the kernel
+
+    Events are counted per (st_dev, st_ino) over a sliding window made from
+    two fixed buckets, the estimate being the current bucket plus the share
+    of the previous bucket that still overlaps the window. Once a file goes
+    over 'threshold' events per 'window' seconds an ignore mask for the
+    events it produced is installed with FAN_MARK_IGNORED_MASK and the kernel
+    stops queuing them. After 'expiry' seconds expire() removes the ignore
+    mask and the file is counted afresh
+
+    >>> fanotify = Fanotify(FAN_CLASS_NOTIF)
+    >>> fanotify.watch('/', FAN_MODIFY|FAN_CLOSE_WRITE, FAN_MARK_MOUNT)
+    >>> suppressor = AdaptiveIgnore(fanotify)
+    >>> while True:
+    ...     for event in suppressor.observe(fanotify.read_events()):
+    ...         handle(event)
+    ...     suppressor.expire()
+
+    A duplicate of the event fd is held for each silenced file so the ignore
+    mask can be removed even if the file was renamed. Permission events are
+    never ignored and FID mode events (which carry no fd) are passed through
+    untouched
+    """
+    def __init__(self, fanotify, threshold=IGNORE_THRESHOLD, window=IGNORE_WINDOW,
+                 expiry=IGNORE_EXPIRY, survive_modify=True):
+        """Create a new AdaptiveIgnore
+
+        Arguments
+        ----------
+        :param Fanotify fanotify: The fanotify object to install ignore masks on
+        :param int threshold: Events per window above which a file is silenced
+        :param float window: Length of the sliding window in seconds
+        :param float expiry: Seconds before a silenced file is reported again
+        :param bool survive_modify: Pass FAN_MARK_IGNORED_SURV_MODIFY, without it the
+                                    kernel drops the ignore mask on the next write
+        """
+        self._fanotify = fanotify
+        self.threshold = threshold
+        self.window = window
+        self.expiry = expiry
+        self._flags = FAN_MARK_IGNORED_SURV_MODIFY if survive_modify else 0
+
+        # (dev, ino) -> [bucket start, previous count, current count, mask]
+        self._counters = {}
+        # (dev, ino) -> [expires, fd, mask], oldest first
+        self._ignored = _OrderedDict()
+
+        self.ignores = 0
+        self.dropped = 0
+
+    def _rate(self, counter, now):
+        elapsed = now - counter[0]
+        if elapsed >= 2 * self.window:
+            counter[:3] = [now, 0, 0]
+        elif elapsed >= self.window:
+            counter[:3] = [counter[0] + self.window, counter[2], 0]
+            elapsed -= self.window
+        return counter[1] * (1 - elapsed / self.window) + counter[2]
+
+    def observe(self, events, now=None):
+        """Count events and silence files that go over the threshold
+
+        Events for files that are already silenced (queued before the ignore
+        mask was installed) are closed and dropped
+
+        :param list events: FanotifyEvents as returned by Fanotify.read_events()
+        :return: The events that were not dropped
+        :rtype: list
+        """
+        now = _monotonic() if now is None else now
+        passed = []
+        for event in events:
+            mask = event.mask & ~(FAN_ONDIR|FAN_Q_OVERFLOW|FAN_OPEN_PERM|FAN_ACCESS_PERM)
+            if event.fd is None or event.fd < 0 or not mask:
+                passed.append(event)
+                continue
+
+            st = _fstat(event.fd)
+            key = (st.st_dev, st.st_ino)
+            if key in self._ignored:
+                self.dropped += 1
+                event.close()
+                continue
+
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = [now, 0, 0, 0]
+            self._rate(counter, now)
+            counter[2] += 1
+            counter[3] |= mask
+            passed.append(event)
+
+            if self._rate(counter, now) > self.threshold:
+                self._silence(key, event.fd, counter[3], now)
+
+        return passed
+
+    def _silence(self, key, fd, mask, now):
+        fd = _dup(fd)
+        try:
+            self._fanotify.add_ignore_mask(_PROC_FD_PATH.format(fd), mask, self._flags)
+        except:
+            _close(fd)
+            raise
+        del self._counters[key]
+        self._ignored[key] = [now + self.expiry, fd, mask]
+        self.ignores += 1
+
+    def expire(self, now=None):
+        """Remove ignore masks that have expired and forget idle counters
+
+        :return: The number of files that are reported again
+        :rtype: int
+        """
+        now = _monotonic() if now is None else now
+        expired = 0
+        while self._ignored:
+            key, (expires, fd, mask) = next(iter(self._ignored.items()))
+            if expires > now:
+                break
+            del self._ignored[key]
+            try:
+                self._fanotify.remove_ignore_mask(_PROC_FD_PATH.format(fd), mask)
+            except ValueError:
+                # the mark went away with the file
+                pass
+            finally:
+                _close(fd)
+            expired += 1
+
+        idle = [key for key, counter in self._counters.items() if now - counter[0] >= 2 * self.window]
+        for key in idle:
+            del self._counters[key]
+
+        return expired
+
+    def next_expiry(self, now=None):
+        """Seconds until the next ignore mask expires or None"""
+        for expires, _, _ in self._ignored.values():
+            now = _monotonic() if now is None else now
+            return max(expires - now, 0)
+        return None
+
+    def ignored(self):
+        """The (st_dev, st_ino) of every file currently silenced"""
+        return list(self._ignored)
+
+    def __len__(self):
+        return len(self._ignored)
+
+    def close(self):
+        """Remove all ignore masks"""
+        self.expire(float('inf'))
+
+
+class CountMinSketch(object):
+    """Approximate counts for an unbounded number of keys in fixed memory
+
+    Counts are never underestimated and overestimated by at most
+    e/width * total with probability 1 - exp(-depth)
+    """
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self._counters = [0] * (width * depth)
+
+    def _indexes(self, key):
+        # double hashing, row i uses h1 + i*h2
+        h1 = hash(key)
+        h2 = hash((h1, 0x9e3779b9)) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Add count to key and return the new estimate for key"""
+        counters = self._counters
+        estimate = None
+        for i in self._indexes(key):
+            value = counters[i] + count
+            counters[i] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def __getitem__(self, key):
+        counters = self._counters
+        return min(counters[i] for i in self._indexes(key))
+
+    def clear(self):
+        self._counters = [0] * (self.width * self.depth)
+
+
+AccessCount = _namedtuple('AccessCount', 'pid path mask count')
+
+class AccessAggregator(object):
+    """Continuously profile which processes touch which files
+
+    Each event is counted against (pid, st_dev, st_ino, mask) in a
+    CountMinSketch and the 'k' heaviest keys are kept in a min heap, so memory
+    does not grow with the number of distinct files. The fd of each event is
+    closed straight after fstat(), only keys entering the top-k pay for a
+    readlink() to find their path. Every 'interval' seconds 'callback' is
+    handed a list of AccessCounts, busiest first
+
+    >>> fanotify = Fanotify(FAN_CLASS_NOTIF)
+    >>> fanotify.watch('/', FAN_OPEN|FAN_ACCESS, FAN_MARK_MOUNT)
+    >>> aggregator = AccessAggregator(fanotify, print)
+    >>> aggregator.run()
+
+    Counts are per interval unless 'reset' is False in which case they
+    accumulate for the life of the aggregator
+    """
+    def __init__(self, fanotify, callback, k=TOP_K, interval=SNAPSHOT_INTERVAL, reset=True,
+                 width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        """Create a new AccessAggregator
+
+        Arguments
+        ----------
+        :param Fanotify fanotify: The fanotify object to read events from
+        :param callable callback: Called with a list of AccessCounts every interval
+        :param int k: The number of (pid, file, mask) combinations to report
+        :param float interval: Seconds between snapshots
+        :param bool reset: Start counting from zero after each snapshot
+        :param int width: Counters per row of the sketch
+        :param int depth: Rows of the sketch
+        """
+        self._fanotify = fanotify
+        self._callback = callback
+        self.k = k
+        self.interval = interval
+        self.reset = reset
+
+        self._sketch = CountMinSketch(width, depth)
+        # key -> [count, path], with a (count, key) heap entry per key that
+        # may lag behind the real count
+        self._top = {}
+        self._heap = []
+
+        self.events = 0
+        self._next_snapshot = _monotonic() + interval
+
+    def observe(self, events):
+        """Count FanotifyEvents as returned by Fanotify.read_events(), closing their fds"""
+        for event in events:
+            if event.fd is not None and event.fd >= 0:
+                try:
+                    self._count(event.pid, event.fd, event.mask)
+                finally:
+                    event.close()
+
+    def observe_batch(self, batch):
+        """Count events as returned by Fanotify.read_batch(), closing their fds
+
+        This is the fast path as no FanotifyEvent is created per event
+        """
+        pids, fds, masks = batch['pid'], batch['fd'], batch['mask']
+        if hasattr(pids, 'tolist'):
+            pids, fds, masks = pids.tolist(), fds.tolist(), masks.tolist()
+
+        count = self._count
+        for pid, fd, mask in zip(pids, fds, masks):
+            if fd >= 0:
+                try:
+                    count(pid, fd, mask)
+                finally:
+                    _close(fd)
+
+    def _count(self, pid, fd, mask):
+        st = _fstat(fd)
+        key = (pid, st.st_dev, st.st_ino, mask)
+        self._offer(key, self._sketch.add(key), fd)
+        self.events += 1
+
+    def _offer(self, key, count, fd):
+        top = self._top
+        entry = top.get(key)
+        if entry is not None:
+            entry[0] = count
+            return
+
+        heap = self._heap
+        if len(top) >= self.k:
+            # bring the stale minimum up to date before comparing against it
+            while True:
+                low, low_key = heap[0]
+                current = top[low_key][0]
+                if current == low:
+                    break
+                _heapreplace(heap, (current, low_key))
+            if count <= low:
+                return
+            _heappop(heap)
+            del top[low_key]
+
+        try:
+            path = _readlink(_PROC_FD_PATH.format(fd))
+        except OSError:
+            path = None
+        top[key] = [count, path]
+        _heappush(heap, (count, key))
+
+    def snapshot(self):
+        """Return the current top-k as a list of AccessCounts, busiest first"""
+        counts = [AccessCount(key[0], path, key[3], count)
+                  for key, (count, path) in self._top.items()]
+        counts.sort(key=lambda access: access.count, reverse=True)
+        return counts
+
+    def maybe_snapshot(self, now=None):
+        """Hand a snapshot to the callback if the interval has passed
+
+        :return: True if the callback was called
+        :rtype: bool
+        """
+        now = _monotonic() if now is None else now
+        if now < self._next_snapshot:
+            return False
+
+        self._next_snapshot = now + self.interval
+        self._callback(self.snapshot())
+        if self.reset:
+            self.clear()
+        return True
+
+    def clear(self):
+        self._sketch.clear()
+        self._top = {}
+        self._heap = []
+
+    def run_once(self, timeout=None):
+        """Wait for events until the next snapshot is due, then count them"""
+        wait = max(self._next_snapshot - _monotonic(), 0)
+        if timeout is not None:
+            wait = min(wait, timeout)
+
+        rd, _, _ = _select([self._fanotify], [], [], wait)
+        if rd:
+            self.observe_batch(self._fanotify.read_batch())
+        self.maybe_snapshot()
+
+    def run(self):
+        """Count events and emit snapshots forever"""
+        while True:
+            self.run_once()
+
+
+HashRecord = _namedtuple('HashRecord', 'path digest size mtime')
+
+def _hash_path(path, algorithm):
+    """Hash a file with mmap, run in a ContentHasher worker process"""
+    import hashlib
+    import mmap
+
+    digest = hashlib.new(algorithm)
+    fd = _open(path, O_RDONLY)
+    try:
+        size = _fstat(fd).st_size
+        if size > 0:
+            data = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            try:
+                digest.update(data)
+            finally:
+                data.close()
+    finally:
+        _close(fd)
+    return digest.hexdigest()
+
+
+class ContentHasher(object):
+    """Hash files as they are written, off the thread draining the fanotify queue
+
+    FAN_CLOSE_WRITE events are handed to a pool of worker processes which
+    open the file through /proc/<pid>/fd/<event fd> and hash it with mmap, so
+    hashing large files does not hold up reading events (and risk
+    FAN_Q_OVERFLOW). Digests are cached by (st_dev, st_ino, mtime, size) and
+    files that have not changed since they were last hashed are never read
+
+    >>> fanotify = Fanotify(FAN_CLASS_NOTIF)
+    >>> fanotify.watch('/srv', FAN_CLOSE_WRITE, FAN_MARK_MOUNT)
+    >>> hasher = ContentHasher()
+    >>> for event in fanotify:
+    ...     hasher.hash_event(event).add_done_callback(lambda f: index(f.result()))
+
+    Workers run as separate processes so the event fd is opened via /proc,
+    this requires the workers to have the same credentials as this process
+    """
+    def __init__(self, algorithm=HASH_ALGORITHM, workers=HASH_WORKERS, cache_size=HASH_CACHE_SIZE):
+        """Create a new ContentHasher
+
+        Arguments
+        ----------
+        :param str algorithm: Any algorithm supported by hashlib.new()
+        :param int workers: Number of worker processes
+        :param int cache_size: Number of digests to remember
+        """
+        self.algorithm = algorithm
+        self.workers = workers
+        self.cache_size = cache_size
+        self._pool = None
+        self._pid = _getpid()
+
+        # results are handled on the pool's thread, guard the shared state
+        self._lock = _Lock()
+        # (dev, ino, mtime, size) -> digest
+        self._cache = _OrderedDict()
+        # (dev, ino, mtime, size) -> Future, files being hashed right now
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _executor(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(self.workers)
+        return self._pool
+
+    def hash_event(self, event):
+        """Hash the file an event refers to
+
+        The event's fd is taken over and closed once the file has been
+        hashed, the caller must not close it
+
+        :param FanotifyEvent event: A FAN_CLOSE_WRITE (or other fd carrying) event
+        :return: Resolves to a HashRecord, or None if the event is not for a regular file
+        :rtype: concurrent.futures.Future
+        """
+        from concurrent.futures import Future
+
+        fd = event.detach()
+        try:
+            st = _fstat(fd)
+            path = _readlink(_PROC_FD_PATH.format(fd))
+        except:
+            _close(fd)
+            raise
+
+        mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+        key = (st.st_dev, st.st_ino, mtime, st.st_size)
+        record = HashRecord(path, None, st.st_size, mtime)
+
+        future = Future()
+        if not _S_ISREG(st.st_mode):
+            _close(fd)
+            future.set_result(None)
+            return future
+
+        with self._lock:
+            digest = self._cache.get(key)
+            if digest is not None:
+                self._cache.move_to_end(key)
+            inflight = self._inflight.get(key)
+            if digest is None and inflight is None:
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if digest is not None:
+            _close(fd)
+            future.set_result(record._replace(digest=digest))
+            return future
+
+        if inflight is not None:
+            # the same contents are already being hashed under another event
+            _close(fd)
+            inflight.add_done_callback(lambda done: self._chain(done, future, record))
+            return future
+
+        proc_path = '/proc/{}/fd/{}'.format(self._pid, fd)
+        try:
+            pool = self._executor()
+            work = pool.submit(_hash_path, proc_path, self.algorithm)
+        except:
+            with self._lock:
+                del self._inflight[key]
+            _close(fd)
+            raise
+        work.add_done_callback(lambda done: self._finished(done, future, key, fd, record, pool))
+        return future
+
+    def _finished(self, work, future, key, fd, record, pool):
+        from concurrent.futures.process import BrokenProcessPool
+
+        try:
+            digest = work.result()
+            st = _fstat(fd)
+        except Exception as err:
+            broken = None
+            with self._lock:
+                self._inflight.pop(key, None)
+                # every job in flight fails with the pool, only the first one
+                # to get here replaces it
+                if isinstance(err, BrokenProcessPool) and self._pool is pool:
+                    # eg a worker took SIGBUS as the file was truncated under
+                    # the mmap, start again with a fresh pool
+                    broken, self._pool = pool, None
+            if broken is not None:
+                # this may be the pool's own management thread, do not wait on it
+                broken.shutdown(wait=False)
+            _close(fd)
+            future.set_exception(err)
+            return
+        current = (st.st_dev, st.st_ino, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+        _close(fd)
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            # only cache the digest if the file did not change while we hashed it
+            if key == current:
+                self._cache[key] = digest
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        future.set_result(record._replace(digest=digest))
+
+    @staticmethod
+    def _chain(done, future, record):
+        if done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(record._replace(digest=done.result().digest))
+
+    def submit(self, events):
+        """Hash every FAN_CLOSE_WRITE event in events
+
+        :return: A Future per FAN_CLOSE_WRITE event and the events that were not
+                 FAN_CLOSE_WRITE (which the caller still has to close)
+        :rtype: (list, list)
+        """
+        futures = []
+        others = []
+        for event in events:
+            if event.mask & FAN_CLOSE_WRITE and event.fd is not None and event.fd >= 0:
+                futures.append(self.hash_event(event))
+            else:
+                others.append(event)
+        return futures, others
+
+    def __len__(self):
+        return len(self._cache)
+
+    def close(self):
+        """Wait for outstanding work and stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
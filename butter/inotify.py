@@ -4,15 +4,27 @@
 from .utils import get_buffered_length as _get_buffered_length
 from .utils import Eventlike as _Eventlike
 from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
 
 from ._inotify import inotify_init, inotify_add_watch, inotify_rm_watch
 from ._inotify import str_to_events
 from ._inotify import event_name
+from ._inotify import InotifyEvent, InotifyMoveEvent
+
+from collections import OrderedDict as _OrderedDict
 
 from errno import EINVAL as _EINVAL
+from errno import ENOENT as _ENOENT, ENOTDIR as _ENOTDIR
+from stat import S_ISDIR as _S_ISDIR
 
 import os as _os
 
+try:
+    from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+except ImportError:
+    # python 2 without the futures backport, rescan serially
+    _ThreadPoolExecutor = None
+
 # Import all the constants
 from ._inotify import C as _C
 _l = locals()
@@ -21,13 +33,42 @@ for key in dir(_C):
         _l[key] = getattr(_C, key)
 del key, _C, _l
 
+MOVE_TIMEOUT = 0.1 # seconds to hold an IN_MOVED_FROM waiting for its IN_MOVED_TO
+RESCAN_WORKERS = 4 # threads used to rescan directories after a queue overflow
+
+# events that tell us the metadata of a directory entry may have changed
+_ENTRY_UPDATE = IN_CREATE|IN_MOVED_TO|IN_MODIFY|IN_ATTRIB|IN_CLOSE_WRITE
+_ENTRY_REMOVE = IN_DELETE|IN_MOVED_FROM
+# events that can only be recovered by stating every entry in a directory
+_CONTENT_EVENTS = IN_MODIFY|IN_ATTRIB|IN_CLOSE_WRITE
+
 class Inotify(_Eventlike):
-    def __init__(self, flags=0, closefd=_CLOEXEC_DEFAULT):
+    def __init__(self, flags=0, closefd=_CLOEXEC_DEFAULT, recover_overflow=False,
+                 rescan_workers=RESCAN_WORKERS):
+        """Create a new Inotify object
+
+        Arguments
+        ----------
+        :param int flags: Flags to pass to inotify_init
+        :param bool closefd: Close the fd when a new process is exec'd
+        :param bool recover_overflow: Keep a snapshot of each watched directory and
+                                      synthesize the events lost to an IN_Q_OVERFLOW
+        :param int rescan_workers: Threads used to rescan directories after an overflow
+
+        With recover_overflow enabled the IN_Q_OVERFLOW event is still delivered
+        and is immediately followed by the IN_CREATE, IN_DELETE and IN_MODIFY
+        events that were derived by diffing each directory against its snapshot.
+        The snapshots are kept current by stat()ing entries as their events are
+        read so this costs one stat per event with a filename
+        """
         super(self.__class__, self).__init__()
         fd = inotify_init(flags, closefd=closefd)
         self._fd = fd
         
         self._events = []
+        self._watches = {}
+        self._snapshots = {} if recover_overflow else None
+        self._rescan_workers = rescan_workers
 
         if flags & IN_NONBLOCK:
             self._blocking = False
@@ -36,6 +77,12 @@ class Inotify(_Eventlike):
         
     def watch(self, path, events):
         wd = inotify_add_watch(self.fileno(), path, events)
+        self._watches[wd] = path
+
+        if self._snapshots is not None:
+            snapshot = _DirSnapshot(path, events)
+            if snapshot.scan():
+                self._snapshots[wd] = snapshot
         
         return wd
         
@@ -44,6 +91,23 @@ class Inotify(_Eventlike):
 
     def ignore(self, wd):
         inotify_rm_watch(self.fileno(), wd)
+        self._watches.pop(wd, None)
+        if self._snapshots is not None:
+            self._snapshots.pop(wd, None)
+
+    def forget(self, wd):
+        """Drop a wd the kernel has already removed (it was followed by an
+        IN_IGNORED event), unlike ignore() this makes no syscall
+        """
+        self._watches.pop(wd, None)
+        if self._snapshots is not None:
+            self._snapshots.pop(wd, None)
+
+    def watched_path(self, wd):
+        """Return the path that was passed to watch() for a watch descriptor or
+        None if the wd is unknown to this object
+        """
+        return self._watches.get(wd)
         
     def _read_events(self):
         fd = self.fileno()
@@ -68,8 +132,266 @@ class Inotify(_Eventlike):
 
         events = str_to_events(raw_events)
 
+        if self._snapshots is not None:
+            events = self._track(events)
+
         return events
 
+    def _track(self, events):
+        """Keep the directory snapshots in step with the events we have seen and
+        expand any IN_Q_OVERFLOW into the events that were lost
+        """
+        tracked = []
+        for event in events:
+            tracked.append(event)
+
+            if event.mask & IN_Q_OVERFLOW:
+                tracked.extend(self._recover())
+                continue
+
+            snapshot = self._snapshots.get(event.wd)
+            if snapshot is None:
+                continue
+            elif event.mask & IN_IGNORED:
+                del self._snapshots[event.wd]
+            elif not event.filename:
+                continue
+            elif event.mask & _ENTRY_REMOVE:
+                snapshot.entries.pop(event.filename, None)
+            elif event.mask & _ENTRY_UPDATE:
+                snapshot.update(event.filename)
+
+        return tracked
+
+    def _recover(self):
+        """Rescan every watched directory that may have lost events and return
+        the events needed to bring a consumer back in step
+        """
+        # a directory whose mtime has not moved has had nothing added or removed,
+        # unless the watch asked for content changes we can skip rescanning it
+        affected = [(wd, snapshot) for wd, snapshot in self._snapshots.items()
+                    if snapshot.mask & _CONTENT_EVENTS or snapshot.changed()]
+        if not affected:
+            return []
+
+        if _ThreadPoolExecutor is not None and self._rescan_workers > 1 and len(affected) > 1:
+            with _ThreadPoolExecutor(self._rescan_workers) as pool:
+                results = list(pool.map(lambda item: item[1].rescan(item[0]), affected))
+        else:
+            results = [snapshot.rescan(wd) for wd, snapshot in affected]
+
+        events = []
+        for result in results:
+            events.extend(result)
+
+        # the IN_IGNORED for a directory that has gone may have been lost as well
+        for wd, snapshot in affected:
+            if snapshot.mtime is None:
+                self._snapshots.pop(wd, None)
+
+        return events
+
+
+class _DirSnapshot(object):
+    """Compact listing of a watched directory, maps each name to a tuple of
+    (inode, mtime, size, mode)
+    """
+    __slots__ = ['path', 'mask', 'mtime', 'entries']
+    def __init__(self, path, mask):
+        self.path = _os.fsencode(path)
+        self.mask = mask
+        self.mtime = None
+        self.entries = {}
+
+    def _stat(self, name):
+        try:
+            st = _os.lstat(_os.path.join(self.path, name))
+        except OSError as err:
+            if err.errno not in (_ENOENT, _ENOTDIR):
+                raise
+            return None
+        return (st.st_ino, st.st_mtime, st.st_size, st.st_mode)
+
+    def scan(self):
+        """Take a fresh snapshot, returns False if path is not a directory
+
+        A directory that has gone is recorded as empty so a rescan reports
+        everything it used to contain as deleted
+        """
+        try:
+            mtime = _os.stat(self.path).st_mtime
+            names = _os.listdir(self.path)
+        except OSError as err:
+            if err.errno not in (_ENOENT, _ENOTDIR):
+                raise
+            self.mtime = None
+            self.entries = {}
+            return False
+        self.mtime = mtime
+
+        entries = {}
+        for name in names:
+            entry = self._stat(name)
+            if entry is not None:
+                entries[name] = entry
+        self.entries = entries
+
+        return True
+
+    def changed(self):
+        try:
+            return _os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            return True
+
+    def update(self, name):
+        entry = self._stat(name)
+        if entry is None:
+            self.entries.pop(name, None)
+        else:
+            self.entries[name] = entry
+
+    def rescan(self, wd):
+        """Rescan the directory and return the events that explain the
+        difference between the old and new listing
+        """
+        old = self.entries
+        self.scan()
+        new = self.entries
+
+        events = []
+        for name, entry in old.items():
+            if name not in new or new[name][0] != entry[0]:
+                events.append(self._event(wd, IN_DELETE, name, entry))
+        for name, entry in new.items():
+            old_entry = old.get(name)
+            if old_entry is None or old_entry[0] != entry[0]:
+                events.append(self._event(wd, IN_CREATE, name, entry))
+            elif old_entry[1:3] != entry[1:3]:
+                events.append(self._event(wd, IN_MODIFY, name, entry))
+
+        return [event for event in events if event.mask & ~IN_ISDIR & self.mask]
+
+    @staticmethod
+    def _event(wd, mask, name, entry):
+        if _S_ISDIR(entry[3]):
+            mask |= IN_ISDIR
+        return InotifyEvent(wd, mask, 0, name)
+
+
+class MovePairer(object):
+    """Join IN_MOVED_FROM and IN_MOVED_TO events sharing a cookie into a single
+    InotifyMoveEvent
+
+    Without pairing a renamed directory shows up as a delete followed by an
+    unrelated create. Feed the events read from an Inotify object through pair()
+    and matched halves will be returned as one InotifyMoveEvent, all other events
+    are passed through untouched and in order
+
+    >>> pairer = MovePairer(inotify)
+    >>> while True:
+    ...     try:
+    ...         inotify.wait(pairer.next_expiry())
+    ...     except TimeoutError:
+    ...         pass
+    ...     for event in pairer.pair(inotify.read_events()) + pairer.expire():
+    ...         print(event)
+
+    An IN_MOVED_FROM whose partner does not arrive within 'timeout' seconds was
+    moved out of the watched tree and is turned into an IN_DELETE by expire(). The
+    kernel always queues IN_MOVED_FROM before IN_MOVED_TO so an IN_MOVED_TO with
+    no pending partner was moved in from outside and is turned into an IN_CREATE
+    straight away
+    """
+    def __init__(self, inotify=None, timeout=MOVE_TIMEOUT):
+        """Create a new MovePairer
+
+        Arguments
+        ----------
+        :param Inotify inotify: Used to map watch descriptors back to paths
+        :param float timeout: Seconds to wait for the second half of a move
+        """
+        self._inotify = inotify
+        self._timeout = timeout
+        # cookie -> (deadline, event), kept in arrival (and hence deadline) order
+        self._pending = _OrderedDict()
+
+    def _path(self, wd, filename):
+        path = self._inotify.watched_path(wd) if self._inotify else None
+        if path is None:
+            return filename
+        path = _os.fsencode(path)
+        return _os.path.join(path, filename) if filename else path
+
+    def pair(self, events, now=None):
+        """Pair up the move events in 'events'
+
+        Arguments
+        ----------
+        :param list events: InotifyEvents as returned by read_events()
+        :param float now: The current time (monotonic), used for testing
+
+        Returns
+        --------
+        :return: The events with all matched moves replaced by a InotifyMoveEvent
+        :rtype: list
+        """
+        now = _monotonic() if now is None else now
+
+        paired = []
+        for event in events:
+            if event.mask & IN_MOVED_FROM:
+                self._pending[event.cookie] = (now + self._timeout, event)
+            elif event.mask & IN_MOVED_TO:
+                _, src = self._pending.pop(event.cookie, (None, None))
+                if src is None:
+                    paired.append(self._as(event, IN_CREATE))
+                else:
+                    paired.append(InotifyMoveEvent(src.mask | event.mask, event.cookie,
+                                                   src.wd, self._path(src.wd, src.filename),
+                                                   event.wd, self._path(event.wd, event.filename)))
+            else:
+                paired.append(event)
+
+        return paired
+
+    def expire(self, now=None):
+        """Return an IN_DELETE event for every IN_MOVED_FROM that has gone unpaired
+        for longer than the timeout
+
+        :param float now: The current time (monotonic), used for testing
+        """
+        now = _monotonic() if now is None else now
+
+        expired = []
+        while self._pending:
+            cookie = next(iter(self._pending))
+            deadline, event = self._pending[cookie]
+            if deadline > now:
+                break
+            del self._pending[cookie]
+            expired.append(self._as(event, IN_DELETE))
+
+        return expired
+
+    def next_expiry(self, now=None):
+        """Seconds until the next pending half expires, suitable for passing to
+        wait() as a timeout. None is returned if nothing is pending
+        """
+        if not self._pending:
+            return None
+        now = _monotonic() if now is None else now
+        deadline, _ = next(iter(self._pending.values()))
+
+        return max(deadline - now, 0)
+
+    def _as(self, event, mask):
+        return InotifyEvent(event.wd, mask | (event.mask & IN_ISDIR), event.cookie, event.filename)
+
+    def __len__(self):
+        return len(self._pending)
+
+
 def watch(path, events=IN_ALL_EVENTS):
     """Quick Convience function to watch a file or dir for any changes
 
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""pidfd: refer to a process by file descriptor rather than pid
+
+A pidfd always refers to the process it was opened for, even once its pid
+has been reused, and becomes readable when that process exits. Waiting on
+a handful of processes among many children (or on processes that are not
+children at all) costs one fd each and no SIGCHLD handling
+
+>>> proc = Pidfd(pid)
+>>> proc.terminate()
+>>> proc.wait()
+-15
+"""
+
+from .utils import Eventlike as _Eventlike
+from .utils import TimeoutError as _TimeoutError
+from ._pidfd import PIDFD_NONBLOCK
+from ._pidfd import pidfd_open, pidfd_send_signal, pidfd_getfd
+from select import poll as _poll, POLLIN as _POLLIN
+from errno import EAGAIN as _EAGAIN
+from errno import ECHILD as _ECHILD
+import signal as _signal
+import os as _os
+
+# python3.9+ can waitid() on a pidfd to collect the exit status of children
+_P_PIDFD = getattr(_os, 'P_PIDFD', None)
+
+
+class Pidfd(_Eventlike):
+    def __init__(self, pid, flags=0):
+        """Open a pidfd for the process 'pid'
+
+        read()ing and wait()ing block until the process exits and return its
+        exit code (-N if killed by signal N) if it is a child of this process,
+        otherwise None
+
+        Arguments
+        ----------
+        :param int pid: The process to refer to
+        :param int flags: Flags to specify extra options
+
+        Flags
+        ------
+        PIDFD_NONBLOCK: read_event() raises OSError(EAGAIN) rather than blocking while the process runs
+
+        Exceptions
+        -----------
+        :raises ValueError: The process does not exist
+        """
+        super(Pidfd, self).__init__()
+        self.pid = pid
+        self.returncode = None
+        self._flags = flags
+        self._fd = pidfd_open(pid, flags)
+
+    def send_signal(self, signal):
+        """Send 'signal' to the process, there is no risk of signaling a process that reused the pid
+
+        Exceptions
+        -----------
+        :raises ValueError: The process has exited
+        :raises PermissionError: Not permitted to signal the process
+        """
+        pidfd_send_signal(self.fileno(), signal)
+
+    def terminate(self):
+        self.send_signal(_signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(_signal.SIGKILL)
+
+    def getfd(self, targetfd):
+        """Duplicate the fd 'targetfd' of the process into this one, see pidfd_getfd()"""
+        return pidfd_getfd(self.fileno(), targetfd)
+
+    def _readable(self, timeout=None):
+        # poll rather than select, pidfds are often opened by processes
+        # with more than FD_SETSIZE (1024) fds
+        poller = _poll()
+        poller.register(self.fileno(), _POLLIN)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+
+    def exited(self):
+        """True if the process has exited (without blocking)"""
+        return self._readable(0)
+
+    def wait(self, timeout=None):
+        if not self._events and not self._readable(timeout):
+            raise _TimeoutError("No event occured")
+
+        return self.read_event()
+
+    def _reap(self):
+        if _P_PIDFD is None:
+            return None
+        try:
+            result = _os.waitid(_P_PIDFD, self.fileno(), _os.WEXITED|_os.WNOHANG)
+        except OSError as err:
+            # not our child, or already reaped by someone else
+            if err.errno != _ECHILD:
+                raise
+            return None
+        if result is None:
+            return None
+        if result.si_code == _os.CLD_EXITED:
+            return result.si_status
+        return -result.si_status
+
+    def _read_events(self):
+        if not self.exited():
+            if self._flags & PIDFD_NONBLOCK:
+                raise OSError(_EAGAIN, "Process is still running")
+            self._readable()
+
+        if self.returncode is None:
+            self.returncode = self._reap()
+        return [self.returncode]
+
+    def __repr__(self):
+        fd = "closed" if self.closed() else self.fileno()
+        return "<{} fd={} pid={} returncode={}>".format(self.__class__.__name__, fd, self.pid, self.returncode)
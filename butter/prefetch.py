@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+"""prefetch: record the files a program reads at startup and preload them next time
+
+Cold starts are dominated by page cache misses. The recorder uses fanotify to
+log the order in which a program opens files, once it has started the parts
+of each file that ended up in the page cache (found with mincore()) are
+written to a manifest. On the next start replay() issues readahead() for each
+range in manifest order from a pool of threads before the program is run
+
+    python -m butter.prefetch record app.manifest --duration 30 -- /usr/bin/app
+    python -m butter.prefetch replay app.manifest -- /usr/bin/app
+
+Manifests are text, one range per line as '<offset> <length> <path>' in the
+order the files were first opened
+
+Recording requires CAP_SYS_ADMIN (fanotify), replaying does not
+"""
+
+from __future__ import print_function
+
+from .utils import UnknownError
+from .utils import monotonic as _monotonic
+from .fanotify import Fanotify as _Fanotify
+from .fanotify import FAN_CLASS_NOTIF, FAN_OPEN, FAN_ACCESS, FAN_MARK_MOUNT
+from ._fanotify import PROC_FD_PATH as _PROC_FD_PATH
+from cffi import FFI as _FFI
+from select import select as _select
+from stat import S_ISREG as _S_ISREG
+import errno as _errno
+import os as _os
+
+PREFETCH_WORKERS = 8 # threads issuing readahead() during replay
+PREFETCH_GAP = 32 # pages, holes smaller than this between resident pages are read anyway
+MANIFEST_HEADER = '# butter prefetch manifest v1'
+
+_ffi = _FFI()
+_ffi.cdef("""
+ssize_t readahead(int fd, int64_t offset, size_t count);
+
+int butter_resident(int fd, size_t length, unsigned char *vec);
+long butter_page_size(void);
+""")
+
+_C = _ffi.verify("""
+#ifndef _GNU_SOURCE
+#define _GNU_SOURCE
+#endif
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+/* Map the file just long enough to ask which of its pages are in the page
+   cache, mincore() only works on mappings
+*/
+int butter_resident(int fd, size_t length, unsigned char *vec){
+    void *addr;
+    int ret;
+
+    addr = mmap(NULL, length, PROT_NONE, MAP_SHARED, fd, 0);
+    if(addr == MAP_FAILED){
+        return -1;
+    }
+    ret = mincore(addr, length, vec);
+    munmap(addr, length);
+    return ret;
+};
+
+long butter_page_size(void){
+    return sysconf(_SC_PAGESIZE);
+};
+""", libraries=[], ext_package="butter")
+
+PAGE_SIZE = _C.butter_page_size()
+
+
+def readahead(fd, offset=0, count=0):
+    """Read a range of a file into the page cache without copying it to userspace
+
+    Arguments
+    ----------
+    :param int fd: File object or fd of the file to read
+    :param int offset: Offset into the file to start reading from
+    :param int count: Number of bytes to read
+
+    Returns
+    --------
+    No return value
+
+    Exceptions
+    -----------
+    :raises ValueError: fd is not open for reading
+    :raises ValueError: fd does not refer to a file type that supports readahead
+    """
+    if hasattr(fd, 'fileno'):
+        fd = fd.fileno()
+
+    assert isinstance(fd, int), 'FD must be an integer'
+    assert offset >= 0, 'Offset must be positive'
+    assert count >= 0, 'Count must be positive'
+
+    ret = _C.readahead(fd, offset, count)
+    if ret < 0:
+        err = _ffi.errno
+        if err == _errno.EBADF:
+            raise ValueError("fd is not a valid file descriptor or is not open for reading")
+        elif err == _errno.EINVAL:
+            raise ValueError("fd does not refer to a file type that supports readahead")
+        else:
+            # If you are here, its a bug. send us the traceback
+            raise UnknownError(err)
+
+
+def resident_ranges(fd, size, gap=PREFETCH_GAP):
+    """Return the (offset, length) ranges of a file that are in the page cache
+
+    Holes of fewer than 'gap' pages between resident pages are included so a
+    fragmented file becomes a few larger reads rather than many small ones
+
+    Arguments
+    ----------
+    :param int fd: File object or fd of the file to check
+    :param int size: Size of the file in bytes
+    :param int gap: Largest hole in pages to merge over
+
+    Returns
+    --------
+    :return: Ranges in ascending order
+    :rtype: list of (int, int)
+
+    Exceptions
+    -----------
+    :raises OSError: The file could not be mapped
+    """
+    if hasattr(fd, 'fileno'):
+        fd = fd.fileno()
+    if size <= 0:
+        return []
+
+    pages = (size + PAGE_SIZE - 1) // PAGE_SIZE
+    vec = _ffi.new('unsigned char[]', pages)
+    if _C.butter_resident(fd, size, vec) < 0:
+        err = _ffi.errno
+        raise OSError(err, _os.strerror(err))
+
+    ranges = []
+    start = last = None
+    for page in range(pages):
+        if not vec[page] & 1:
+            continue
+        if start is None:
+            start = page
+        elif page - last > gap:
+            ranges.append((start, last))
+            start = page
+        last = page
+    if start is not None:
+        ranges.append((start, last))
+
+    return [(first * PAGE_SIZE, min((end + 1) * PAGE_SIZE, size) - first * PAGE_SIZE)
+            for first, end in ranges]
+
+
+class PrefetchRecorder(object):
+    """Record the order files are opened in with fanotify
+
+    Once follow() has been called only events from the followed processes
+    and their descendants are recorded, otherwise everything on the mount
+    except this process is. Each file is recorded once, on its first open,
+    and the event fd is closed straight away. Ancestry is looked up in /proc
+    when events are read so short lived processes that have already been
+    reaped are not recorded
+
+    >>> recorder = PrefetchRecorder('/')
+    >>> proc = subprocess.Popen(['/usr/bin/app'])
+    >>> recorder.follow(proc.pid)
+    >>> recorder.record(30)
+    >>> recorder.save('app.manifest')
+    """
+    def __init__(self, path='/', mask=FAN_OPEN|FAN_ACCESS, mark_flags=FAN_MARK_MOUNT):
+        """Start recording file accesses
+
+        Arguments
+        ----------
+        :param str path: The mount (or with mark_flags=0, the file/dir) to watch
+        :param int mask: The fanotify events that count as a file being used
+        :param int mark_flags: Flags passed to Fanotify.watch()
+
+        Exceptions
+        -----------
+        :raises PermissionError: The process lacks CAP_SYS_ADMIN
+        """
+        self._fanotify = _Fanotify(FAN_CLASS_NOTIF)
+        try:
+            self._fanotify.watch(path, mask, mark_flags)
+        except:
+            self._fanotify.close()
+            raise
+
+        self._self = _os.getpid()
+        self._roots = set()
+        # pid -> True/False, whether the pid descends from one of the roots
+        self._ancestry = {}
+        # (dev, ino) -> path and the paths in order of first access
+        self._files = {}
+        self._order = []
+
+    def follow(self, pid):
+        """Only record pid and its children from now on"""
+        self._roots.add(pid)
+        self._ancestry = {}
+
+    def _wanted(self, pid):
+        if pid == self._self:
+            return False
+        if not self._roots:
+            return True
+
+        wanted = self._ancestry.get(pid)
+        if wanted is None:
+            seen = []
+            wanted = False
+            current = pid
+            while current > 1:
+                if current in self._roots:
+                    wanted = True
+                    break
+                if current in self._ancestry:
+                    wanted = self._ancestry[current]
+                    break
+                seen.append(current)
+                try:
+                    with open('/proc/{}/stat'.format(current)) as f:
+                        stat = f.read()
+                except (IOError, OSError):
+                    # already gone, we can no longer tell who it belonged to
+                    break
+                # the comm field may contain spaces, ppid is after its ')'
+                current = int(stat.rsplit(')', 1)[1].split()[1])
+            for seen_pid in seen:
+                self._ancestry[seen_pid] = wanted
+            self._ancestry[pid] = wanted
+        return wanted
+
+    def fileno(self):
+        return self._fanotify.fileno()
+
+    def run_once(self, timeout=None):
+        """Record any pending events, waiting up to 'timeout' seconds for them"""
+        rd, _, _ = _select([self._fanotify], [], [], timeout)
+        if not rd:
+            return
+
+        for event in self._fanotify.read_events():
+            try:
+                if not self._wanted(event.pid):
+                    continue
+                st = _os.fstat(event.fd)
+                key = (st.st_dev, st.st_ino)
+                if key in self._files or not _S_ISREG(st.st_mode):
+                    continue
+                path = _os.readlink(_PROC_FD_PATH.format(event.fd))
+                if '\n' in path or path.endswith(' (deleted)'):
+                    continue
+                self._files[key] = path
+                self._order.append(path)
+            finally:
+                event.close()
+
+    def record(self, duration):
+        """Record for 'duration' seconds"""
+        deadline = _monotonic() + duration
+        while True:
+            remaining = deadline - _monotonic()
+            if remaining <= 0:
+                break
+            self.run_once(remaining)
+
+    @property
+    def files(self):
+        """Paths recorded so far in the order they were first used"""
+        return list(self._order)
+
+    def manifest(self, gap=PREFETCH_GAP):
+        """Return the ranges of every recorded file that are in the page cache
+
+        :return: (path, offset, length) in the order the files were first used
+        :rtype: list
+        """
+        entries = []
+        for path in self._order:
+            try:
+                fd = _os.open(path, _os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                size = _os.fstat(fd).st_size
+                for offset, length in resident_ranges(fd, size, gap):
+                    entries.append((path, offset, length))
+            except OSError:
+                pass
+            finally:
+                _os.close(fd)
+        return entries
+
+    def save(self, filename, gap=PREFETCH_GAP):
+        """Write the manifest to 'filename'"""
+        save_manifest(filename, self.manifest(gap))
+
+    def close(self):
+        self._fanotify.close()
+
+
+def save_manifest(filename, entries):
+    """Write (path, offset, length) entries to a manifest file"""
+    with open(filename, 'w') as f:
+        print(MANIFEST_HEADER, file=f)
+        for path, offset, length in entries:
+            print(offset, length, path, file=f)
+
+
+def load_manifest(filename):
+    """Read a manifest file, returning (path, offset, length) entries in order
+
+    Exceptions
+    -----------
+    :raises ValueError: The file is not a prefetch manifest
+    """
+    entries = []
+    with open(filename) as f:
+        if f.readline().rstrip('\n') != MANIFEST_HEADER:
+            raise ValueError("{} is not a prefetch manifest".format(filename))
+        for line in f:
+            offset, length, path = line.rstrip('\n').split(' ', 2)
+            entries.append((path, int(offset), int(length)))
+    return entries
+
+
+def _prefetch_file(path, ranges):
+    try:
+        fd = _os.open(path, _os.O_RDONLY)
+    except OSError:
+        # the file has gone since it was recorded
+        return 0
+    try:
+        for offset, length in ranges:
+            readahead(fd, offset, length)
+    finally:
+        _os.close(fd)
+    return sum(length for offset, length in ranges)
+
+
+def replay(entries, workers=PREFETCH_WORKERS):
+    """Issue readahead() for each entry of a manifest
+
+    Files are handed to the thread pool in manifest order so the ones needed
+    first are read first, readahead() blocks until the read has been
+    submitted so several threads keep the disk queue full. Files that no
+    longer exist are skipped
+
+    Arguments
+    ----------
+    :param entries: A manifest filename or (path, offset, length) entries
+    :param int workers: Number of threads to issue readahead() from
+
+    Returns
+    --------
+    :return: The number of bytes requested
+    :rtype: int
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if isinstance(entries, str):
+        entries = load_manifest(entries)
+
+    # group the ranges of each file together, keeping first use order
+    files = {}
+    order = []
+    for path, offset, length in entries:
+        ranges = files.get(path)
+        if ranges is None:
+            ranges = files[path] = []
+            order.append(path)
+        ranges.append((offset, length))
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(_prefetch_file, path, files[path]) for path in order]
+        return sum(future.result() for future in futures)
+
+
+def main(argv=None):
+    """Command line interface, see the module documentation"""
+    import argparse
+    import subprocess
+    import sys
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = []
+    if '--' in argv:
+        # everything after -- is the command to run
+        command = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(prog='python -m butter.prefetch', usage='%(prog)s {record,replay} manifest [options] [-- command ...]',
+                                     description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='phase')
+    rec = sub.add_parser('record', help='record the files a command uses')
+    rec.add_argument('manifest')
+    rec.add_argument('--duration', type=float, default=30.0, help='seconds to record for')
+    rec.add_argument('--mount', default='/', help='mount to watch')
+    rep = sub.add_parser('replay', help='preload a manifest then optionally exec a command')
+    rep.add_argument('manifest')
+    rep.add_argument('--workers', type=int, default=PREFETCH_WORKERS)
+    args = parser.parse_args(argv)
+
+    if args.phase == 'record':
+        recorder = PrefetchRecorder(args.mount)
+        proc = None
+        if command:
+            proc = subprocess.Popen(command)
+            recorder.follow(proc.pid)
+        recorder.record(args.duration)
+        recorder.save(args.manifest)
+        recorder.close()
+        print("recorded {} files".format(len(recorder.files)), file=sys.stderr)
+        if proc is not None:
+            return proc.wait()
+    elif args.phase == 'replay':
+        replay(args.manifest, args.workers)
+        if command:
+            _os.execvp(command[0], command)
+    else:
+        parser.print_help()
+        return 2
+
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
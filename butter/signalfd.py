@@ -6,20 +6,26 @@ from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
 from ._signalfd import SFD_CLOEXEC, SFD_NONBLOCK, NEW_SIGNALFD
 from ._signalfd import SIG_BLOCK, SIG_UNBLOCK, SIG_SETMASK
 from ._signalfd import SIGINFO_LENGTH as _SIGINFO_LENGTH
-from ._signalfd import signalfd, pthread_sigmask
+from ._signalfd import SIGINFO_STRUCT as _SIGINFO_STRUCT
+from ._signalfd import SIGRTMIN, SIGRTMAX
+from ._signalfd import signalfd, pthread_sigmask, sigqueue
 from ._signalfd import signum_to_signame
 from ._signalfd import ffi as _ffi, C as _C
+from collections import namedtuple as _namedtuple
 import os as _os
 
+SIGNAL_READ_MAX = 64 # signalfd_siginfo records read per syscall
+
 
 class Signalfd(_Eventlike):
-    def __init__(self, sigmask=set(), flags=0, closefd=_CLOEXEC_DEFAULT):
+    def __init__(self, sigmask=set(), flags=0, closefd=_CLOEXEC_DEFAULT, read_max=SIGNAL_READ_MAX):
         """Create a new Signalfd object
 
         Arguments
         ----------
         :param int sigmask: Set of signals to respond on
         :param int flags: Flags to open the signalfd with
+        :param int read_max: The most signals to read (and queue for read_event()) per syscall
         
         Flags
         ------
@@ -29,10 +35,18 @@ class Signalfd(_Eventlike):
         super(self.__class__, self).__init__()
         
         self._flags = flags
+        # reused for every read, records are decoded before the next one
+        self._buf = bytearray(read_max * _SIGINFO_LENGTH)
 
-        self._sigmask = sigmask = _ffi.new('sigset_t[1]')
+        self._sigmask = _ffi.new('sigset_t[1]')
+        try:
+            sigmask = iter(sigmask)
+        except TypeError:
+            sigmask = [sigmask]
+        for signal in sigmask:
+            _C.sigaddset(self._sigmask, signal)
 
-        self._fd = signalfd(sigmask, NEW_SIGNALFD, flags)
+        self._fd = signalfd(self._sigmask, NEW_SIGNALFD, flags)
         
     def __contains__(self, signal):
         val = _C.sigismember(self._sigmask, signal)
@@ -82,85 +96,139 @@ class Signalfd(_Eventlike):
         self._update()
         
     def _read_events(self):
-        buf = _os.read(self.fileno(), _SIGINFO_LENGTH)
-        siginfo = _ffi.new('struct signalfd_siginfo *')
-
-        _ffi.buffer(siginfo)[0:_SIGINFO_LENGTH] = buf
-        
-        return [Signal(siginfo)]
-
-
-class Signal(object):
-    """Proxy object for data returned by signalfd when a signal is recived
-    
-    Maps to most fields in a signalfd_siginfo
-    
-    Ommited mappings are ones that deal with traps and SIGQUEUE
+        buf = self._buf
+        if _readv is not None:
+            length = _readv(self.fileno(), [buf])
+        else:
+            data = _os.read(self.fileno(), len(buf))
+            length = len(data)
+            buf[:length] = data
+
+        unpack_from = _SIGINFO_STRUCT.unpack_from
+        new = tuple.__new__
+        return [new(Signal, unpack_from(buf, offset))
+                for offset in range(0, length, _SIGINFO_LENGTH)]
+
+
+try:
+    _readv = _os.readv
+except AttributeError:
+    # python2.7
+    _readv = None
+
+
+_SignalBase = _namedtuple('Signal', ['signal',            # ssi_signo
+                                     'errno',             # ssi_errno
+                                     'signal_code',       # ssi_code
+                                     'pid',               # ssi_pid
+                                     'uid',               # ssi_uid
+                                     'sigio_fd',          # ssi_fd
+                                     'timer_id',          # ssi_tid
+                                     'sigio_band',        # ssi_band
+                                     'overrun',           # ssi_overrun
+                                     'trapno',            # ssi_trapno
+                                     'child_status',      # ssi_status
+                                     'value',             # ssi_int
+                                     'ptr',               # ssi_ptr
+                                     'child_user_time',   # ssi_utime
+                                     'child_system_time', # ssi_stime
+                                     'addr',              # ssi_addr
+                                     ])
+
+class Signal(_SignalBase):
+    """A signal recived by signalfd, decoded from a signalfd_siginfo
+
+    signal: The number of the signal being sent
+    signal_code: The signal code (si_code)
+    pid: PID of the sender of the signal
+    uid: UID of the sender of the signal
+    sigio_fd: FD that triggered the SIGIO signal
+    timer_id: Kernel timer ID (POSIX Timers)
+    sigio_band: SIGIO Band event
+    overrun: POSIX timer overrun count
+    trapno: Trap number that caused the signal
+    child_status: The return code of the exiting child process
+    value: Integer sent by sigqueue(3)
+    ptr: Pointer sent by sigqueue(3)
+    child_user_time: The ammount of user time used by the exiting child process
+    child_system_time: The ammount of system time used by the exiting child process
+    addr: Address that generated the signal (hardware-generated signals)
     """
-    def __init__(self, siginfo):
-        self._siginfo = siginfo
-
-    @property
-    def signal(self):
-        """The number of the signal being sent"""
-        return self._siginfo.ssi_signo
-
-    @property
-    def signal_code(self):
-        """The signal code"""
-        return self._siginfo.ssi_code
-
-    @property
-    def pid(self):
-        """PID of the sender of the signal"""
-        return self._siginfo.ssi_pid
-
-    @property
-    def uid(self):
-        """UID of the sender of the signal"""
-        return self._siginfo.ssi_uid
-
-    @property
-    def sigio_fd(self):
-        """FD that triggered the SIGIO signal"""
-        return self._siginfo.ssi_fd
-
-    @property
-    def timer_id(self):
-        """Kernel timer ID (POSIX Timers)"""
-        return self._siginfo.ssi_tid
-        
-    @property
-    def sigio_band(self):
-        """SIGIO Band event"""
-        return self._siginfo.ssi_band
-        
-    @property
-    def overrun(self):
-        """POSIX timer overrun count"""
-        return self._siginfo.ssi_overrun
-        
-    @property
-    def trapno(self):
-        """Trap number that caused the signal"""
-        return self._siginfo.trapno
-
-    @property
-    def child_status(self):
-        """The return code of the exiting child process"""
-        return self._siginfo.ssi_status
-        
-    @property
-    def child_user_time(self):
-        """The ammount of user time used by the exiting child process"""
-        return self._siginfo.ssi_utime
-        
-    @property
-    def child_system_time(self):
-        """The ammount of system time used by the exiting child process"""
-        return self._siginfo.ssi_stime
+    __slots__ = ()
 
     def __repr__(self):
         # convert to Alpha name, else just return the int
         signame = signum_to_signame.get(self.signal, self.signal)
         return "<{} signal={} uid={} pid={}>".format(self.__class__.__name__, signame, self.uid, self.pid)
+
+
+RtMessage = _namedtuple('RtMessage', 'pid uid value')
+
+
+class RtSignalChannel(_Eventlike):
+    """Small integer messages between processes carried by a real time signal
+
+    Each channel uses the signal SIGRTMIN+channel. Senders sigqueue() a 64 bit
+    value to the receiving process, the kernel queues every message (up to
+    RLIMIT_SIGPENDING) in order and the receiver reads them in batches from a
+    Signalfd. Useful as a doorbell between cooperating processes without
+    setting up sockets or pipes
+
+    >>> channel = RtSignalChannel(1)            # in the receiver
+    >>> RtSignalChannel.send(receiver_pid, 42, channel=1)  # in the sender
+    >>> channel.read_events()
+    [RtMessage(pid=..., uid=..., value=42)]
+
+    Create the receiving channel before starting threads, the signal is only
+    blocked in the calling thread (and threads started after it)
+    """
+    def __init__(self, channel=0, flags=0, closefd=_CLOEXEC_DEFAULT, read_max=SIGNAL_READ_MAX):
+        """Start reciving messages on 'channel'
+
+        Arguments
+        ----------
+        :param int channel: Offset from SIGRTMIN of the signal to use
+        :param int flags: Flags to open the signalfd with (SFD_NONBLOCK)
+        :param int read_max: The most messages to read per syscall
+
+        Exceptions
+        -----------
+        :raises ValueError: SIGRTMIN+channel is beyond SIGRTMAX
+        """
+        super(RtSignalChannel, self).__init__()
+        self.signal = self.channel_signal(channel)
+        self.channel = channel
+
+        pthread_sigmask(SIG_BLOCK, self.signal)
+        self._signalfd = Signalfd(self.signal, flags, closefd, read_max)
+        self._fd = self._signalfd.fileno()
+
+    @staticmethod
+    def channel_signal(channel):
+        """The signal number used by 'channel'"""
+        signal = SIGRTMIN + channel
+        if channel < 0 or signal > SIGRTMAX:
+            raise ValueError("Channel must be between 0 and {}".format(SIGRTMAX - SIGRTMIN))
+        return signal
+
+    @classmethod
+    def send(cls, pid, value, channel=0):
+        """Send 'value' (up to 64 bits) to the process 'pid' listening on 'channel'
+
+        Exceptions
+        -----------
+        :raises ValueError: The process does not exist
+        :raises OSError: The receiver has too many messages queued (RLIMIT_SIGPENDING)
+        """
+        sigqueue(pid, cls.channel_signal(channel), value)
+
+    def _read_events(self):
+        return [RtMessage(info.pid, info.uid, info.ptr) for info in self._signalfd.read_events()]
+
+    def close(self):
+        self._signalfd.close()
+        self._fd = None
+
+    def __repr__(self):
+        fd = "closed" if self.closed() else self.fileno()
+        return "<{} fd={} channel={} signal={}>".format(self.__class__.__name__, fd, self.channel, self.signal)
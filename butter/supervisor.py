@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""supervisor: reap and report on any number of child processes from one signalfd
+
+Instead of polling every child, SIGCHLD is blocked and delivered through a
+Signalfd. Each wakeup reaps every child that has exited with a
+wait4(WNOHANG) loop and hands the exit status and resource usage to the
+callback registered for that child, so the cost of a wakeup depends on the
+number of children that exited rather than the number running
+
+>>> supervisor = Supervisor()
+>>> supervisor.spawn(['sleep', '1'], lambda child: print(child.pid, child.returncode))
+>>> while len(supervisor):
+...     supervisor.run_once()
+
+As wait4() is called for any child, the supervisor should own every child
+of the process. Create it before starting any threads so they inherit the
+blocked SIGCHLD, a thread that does not block it may consume the signal
+"""
+
+from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .signalfd import Signalfd as _Signalfd
+from .signalfd import SFD_NONBLOCK as _SFD_NONBLOCK
+from .signalfd import SIG_BLOCK as _SIG_BLOCK
+from .signalfd import SIG_UNBLOCK as _SIG_UNBLOCK
+from .signalfd import pthread_sigmask as _pthread_sigmask
+from collections import namedtuple as _namedtuple
+from select import select as _select
+from errno import EAGAIN as _EAGAIN
+from errno import ECHILD as _ECHILD
+from errno import EINTR as _EINTR
+import subprocess as _subprocess
+import signal as _signal
+import os as _os
+
+UNCLAIMED_MAX = 1024 # exits remembered for children that were not registered (yet)
+
+ChildExit = _namedtuple('ChildExit', 'pid status returncode rusage')
+ChildExit.__doc__ = """The result of reaping a child
+
+pid: The pid of the child
+status: The raw status from wait4()
+returncode: The exit code, or -N if the child was killed by signal N (as subprocess)
+rusage: The resource.struct_rusage of the child
+"""
+
+
+def returncode(status):
+    """Convert a status from wait() into an exit code, or -N for signal N"""
+    if _os.WIFSIGNALED(status):
+        return -_os.WTERMSIG(status)
+    return _os.WEXITSTATUS(status)
+
+
+def _unblock_sigchld():
+    # the signal mask survives exec, give the child the usual behaviour back
+    _pthread_sigmask(_SIG_UNBLOCK, _signal.SIGCHLD)
+
+
+class Supervisor(object):
+    def __init__(self, closefd=_CLOEXEC_DEFAULT):
+        """Block SIGCHLD in the calling thread and watch for it on a signalfd
+
+        Arguments
+        ----------
+        :param bool closefd: Close the signalfd on exec
+        """
+        _pthread_sigmask(_SIG_BLOCK, _signal.SIGCHLD)
+        self._signalfd = _Signalfd(flags=_SFD_NONBLOCK, closefd=closefd)
+        self._signalfd.enable(_signal.SIGCHLD)
+
+        # pid -> (callback, Popen or None)
+        self._children = {}
+        # pid -> ChildExit for children that exited before watch() was called
+        self._unclaimed = {}
+        self.reaped = 0
+
+    def fileno(self):
+        return self._signalfd.fileno()
+
+    def __len__(self):
+        return len(self._children)
+
+    def __contains__(self, pid):
+        return pid in self._children
+
+    def spawn(self, args, callback=None, **kwargs):
+        """Start a child with subprocess.Popen and call callback(ChildExit) when it exits
+
+        SIGCHLD is unblocked in the child before exec, any preexec_fn given
+        is run after that. The Popen object has its returncode set when the
+        child is reaped so it will not try to wait() on the child itself
+
+        Returns
+        --------
+        :return: The started child
+        :rtype: subprocess.Popen
+        """
+        preexec_fn = kwargs.pop('preexec_fn', None)
+        if preexec_fn is None:
+            kwargs['preexec_fn'] = _unblock_sigchld
+        else:
+            def both():
+                _unblock_sigchld()
+                preexec_fn()
+            kwargs['preexec_fn'] = both
+
+        proc = _subprocess.Popen(args, **kwargs)
+        self._watch(proc.pid, callback, proc)
+        return proc
+
+    def watch(self, pid, callback=None):
+        """Call callback(ChildExit) when the child 'pid' (started by other means) exits
+
+        If the child was already reaped the callback is called immediately
+        """
+        self._watch(pid, callback, None)
+
+    def _watch(self, pid, callback, proc):
+        child = self._unclaimed.pop(pid, None)
+        if child is not None:
+            self._finish(child, callback, proc)
+        else:
+            self._children[pid] = (callback, proc)
+
+    def forget(self, pid):
+        """Stop tracking 'pid', it will still be reaped but its callback will not be called"""
+        self._children.pop(pid, None)
+
+    def _finish(self, child, callback, proc):
+        if proc is not None:
+            proc.returncode = child.returncode
+        if callback is not None:
+            callback(child)
+
+    def reap(self):
+        """Reap every child that has exited and call their callbacks
+
+        Returns
+        --------
+        :return: The children that were reaped
+        :rtype: list of ChildExit
+        """
+        try:
+            self._signalfd.read_events()
+        except OSError as err:
+            if err.errno != _EAGAIN:
+                raise
+
+        reaped = []
+        while True:
+            try:
+                pid, status, rusage = _os.wait4(-1, _os.WNOHANG)
+            except OSError as err:
+                if err.errno == _EINTR:
+                    continue
+                if err.errno != _ECHILD:
+                    raise
+                break
+            if pid == 0:
+                break
+            reaped.append(ChildExit(pid, status, returncode(status), rusage))
+        self.reaped += len(reaped)
+
+        # wait until everything is reaped before running callbacks so one
+        # that raises does not leave zombies behind
+        for child in reaped:
+            entry = self._children.pop(child.pid, None)
+            if entry is None:
+                if len(self._unclaimed) >= UNCLAIMED_MAX:
+                    self._unclaimed.pop(next(iter(self._unclaimed)))
+                self._unclaimed[child.pid] = child
+                continue
+            callback, proc = entry
+            self._finish(child, callback, proc)
+
+        return reaped
+
+    def run_once(self, timeout=None):
+        """Wait up to 'timeout' seconds for children to exit and reap them"""
+        rd, _, _ = _select([self._signalfd], [], [], timeout)
+        if rd:
+            return self.reap()
+        return []
+
+    def run(self):
+        """Reap children until there are none left to track"""
+        while self._children:
+            self.run_once()
+
+    def close(self):
+        """Close the signalfd, SIGCHLD is left blocked"""
+        self._signalfd.close()
+
+    def __repr__(self):
+        fd = "closed" if self._signalfd.closed() else self._signalfd.fileno()
+        return "<{} fd={} children={} reaped={}>".format(self.__class__.__name__, fd,
+                                                          len(self._children), self.reaped)
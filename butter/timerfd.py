@@ -3,12 +3,25 @@
 
 from .utils import Eventlike as _Eventlike
 from .utils import CLOEXEC_DEFAULT as _CLOEXEC_DEFAULT
+from .utils import monotonic as _monotonic
 from ._timerfd import TimerVal, timerfd, timerfd_gettime, timerfd_settime
-from ._timerfd import TFD_CLOEXEC, TFD_NONBLOCK, TFD_TIMER_ABSTIME
+from ._timerfd import TFD_CLOEXEC, TFD_NONBLOCK, TFD_TIMER_ABSTIME, TFD_TIMER_CANCEL_ON_SET
 from ._timerfd import CLOCK_REALTIME, CLOCK_MONOTONIC
 from ._timerfd import ffi as _ffi
+from select import select as _select
+from errno import EAGAIN as _EAGAIN
+from errno import ECANCELED as _ECANCELED
+from itertools import count as _count
+from time import time as _time
+import heapq as _heapq
 import os as _os
 
+RATE_TICK = 0.01 # seconds between RateLimiter refills
+WHEEL_TICK = 0.01 # seconds, resolution of a TimerWheel
+WHEEL_BITS = 8 # log2 of the slots in each level of a TimerWheel
+WHEEL_LEVELS = 4 # levels of a TimerWheel, covering 2**(WHEEL_BITS*WHEEL_LEVELS) ticks
+HISTOGRAM_SUB_BITS = 4 # each power of 2 is split into 2**(HISTOGRAM_SUB_BITS-1) buckets
+
 class Timer(_Eventlike, TimerVal):
     """Timer is both an event like object providing the file-like/event-like interface as well
     as a TimerVal object to allow setting of the periodicity and offset of the timer in a single
@@ -54,6 +67,31 @@ class Timer(_Eventlike, TimerVal):
         """
         super(Timer, self).__init__()
         self._fd = timerfd(clock_type, flags, closefd=closefd)
+        self._clock_type = clock_type
+        self.stats = None
+
+    def enable_stats(self, stats=None):
+        """Record the accuracy of this timer on every expiry
+
+        The expected time of each expiry is worked out from the values given
+        to update() and compared to when read()/wait() returned, missed
+        expirations (a count above 1) and the time spent between getting an
+        expiry and asking for the next one (the handler) are also recorded.
+        Takes effect from the next call to update()
+
+        Only relative timers, or absolute timers on CLOCK_MONOTONIC, can be
+        recorded as the expected time is calculated on CLOCK_MONOTONIC
+
+        Returns
+        --------
+        :return: The object the measurements are stored in
+        :rtype: TimerStats
+        """
+        self.stats = stats if stats is not None else TimerStats()
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
     
     def get_current(self):
         """Retrives the current values of the timer from the kernel
@@ -65,7 +103,7 @@ class Timer(_Eventlike, TimerVal):
         """
         return timerfd_gettime(self.fileno())
 
-    def update(self, absolute=False):
+    def update(self, absolute=False, cancel_on_set=False):
         """Update the kernel with the current values for the timer
         
         Arguments
@@ -73,22 +111,49 @@ class Timer(_Eventlike, TimerVal):
         :param bool absolute: Determines if the values in the timer should be considered absolute
         (seconds since UNIX epoch) or if they should be added to the current time to determine
         when the next event occurs
+        :param bool cancel_on_set: For absolute CLOCK_REALTIME timers, make reads fail with
+        ECANCELED (OSError) when the clock is set so the caller can recalculate deadlines
         
         Returns
         --------
         :return: The old timer value
         :rtype: TimerVal
         """
+        if self.stats is not None and absolute and self._clock_type != CLOCK_MONOTONIC:
+            # check before arming so a rejected update leaves the timer as it was
+            raise ValueError("Only CLOCK_MONOTONIC timers can be recorded when absolute")
+
         flags = TFD_TIMER_ABSTIME if absolute else 0
+        if cancel_on_set:
+            flags |= TFD_TIMER_CANCEL_ON_SET
         old_timer = timerfd_settime(self.fileno(), self._timerspec, flags)
+
+        if self.stats is not None:
+            spec = self._timerspec
+            value = spec.it_value.tv_sec * 1000000000 + spec.it_value.tv_nsec
+            interval = spec.it_interval.tv_sec * 1000000000 + spec.it_interval.tv_nsec
+            self.stats.armed(value if absolute else _monotonic_ns() + value, interval)
         
         return old_timer
     
+    def wait(self, timeout=None):
+        if self.stats is not None:
+            # the handler for the last expiry has finished
+            self.stats.handler_done(_monotonic_ns())
+        return super(Timer, self).wait(timeout)
+
     def _read_events(self):
+        stats = self.stats
+        if stats is not None:
+            stats.handler_done(_monotonic_ns())
+
         data = _os.read(self.fileno(), 8)
         value = _ffi.new('uint64_t[1]')
         _ffi.buffer(value, 8)[0:8] = data
 
+        if stats is not None:
+            stats.expired(_monotonic_ns(), value[0])
+
         return [value[0]] # value's container is not a list
                           # lets make it one to expose a fammliar
                           # interface
@@ -101,3 +166,792 @@ class Timer(_Eventlike, TimerVal):
                                                                            self._timerspec.it_interval.tv_sec,
                                                                            self._timerspec.it_interval.tv_nsec)
 
+
+
+def _monotonic_ns():
+    return int(_monotonic() * 1000000000)
+
+
+class Histogram(object):
+    """Fixed size log-linear histogram of non-negative integers (eg nanoseconds)
+
+    Values are bucketed by their power of 2, each of which is split into
+    2**(HISTOGRAM_SUB_BITS-1) linear buckets, giving a relative error of at
+    most 1/2**(HISTOGRAM_SUB_BITS-1) over the full 64 bit range in a few
+    hundred counters. Recording is O(1) and memory never grows
+    """
+    def __init__(self, sub_bits=HISTOGRAM_SUB_BITS):
+        self._sub_bits = sub_bits
+        self._half = 1 << (sub_bits - 1)
+        self._counts = [0] * ((64 - sub_bits + 2) * self._half)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        exponent = value.bit_length() - self._sub_bits
+        if exponent <= 0:
+            return value
+        return exponent * self._half + (value >> exponent)
+
+    def _value(self, index):
+        """The midpoint of the values held by bucket 'index'"""
+        if index < 2 * self._half:
+            return index
+        exponent, sub = divmod(index, self._half)
+        exponent -= 1
+        low = (sub + self._half) << exponent
+        return low + (1 << exponent) // 2
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """The value below which 'percent' of the recorded values fall, None if empty"""
+        if not self.count:
+            return None
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else None
+
+    def clear(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<{} count={} p50={} p99={} max={}>".format(self.__class__.__name__,
+                                                           self.count,
+                                                           self.percentile(50),
+                                                           self.percentile(99),
+                                                           self.max)
+
+
+class TimerStats(object):
+    """Accuracy measurements for a Timer, see Timer.enable_stats()
+
+    jitter: Histogram of how late (in ns) each wakeup was compared to the
+            latest expiry it reported
+    runtime: Histogram of the ns between a wakeup and the next read, ie how
+             long the handler ran for
+    expirations: Total expirations reported by the kernel
+    missed: Expirations that were folded into a later read (count > 1)
+    """
+    def __init__(self, sub_bits=HISTOGRAM_SUB_BITS):
+        self.jitter = Histogram(sub_bits)
+        self.runtime = Histogram(sub_bits)
+        self.expirations = 0
+        self.missed = 0
+        self.early = 0
+        self._expected = None
+        self._interval = 0
+        self._woke = None
+
+    def armed(self, expected, interval):
+        """The timer was set to first expire at 'expected' (monotonic ns), then every 'interval' ns"""
+        self._expected = expected if expected or interval else None
+        self._interval = interval
+        self._woke = None
+
+    def handler_done(self, now):
+        if self._woke is not None:
+            self.runtime.record(now - self._woke)
+            self._woke = None
+
+    def expired(self, now, count):
+        self.expirations += count
+        self.missed += count - 1
+        self._woke = now
+        if self._expected is None:
+            return
+
+        # the most recent of the expirations we were told about
+        expected = self._expected + (count - 1) * self._interval
+        lateness = now - expected
+        if lateness < 0:
+            # our view of the clock disagrees with the kernel's, count it
+            # rather than skewing the histogram
+            self.early += 1
+        else:
+            self.jitter.record(lateness)
+        self._expected = expected + self._interval if self._interval else None
+
+    def summary(self, percentiles=(50, 99, 99.9)):
+        """Return a dict of the jitter and runtime percentiles (in ns) and counters"""
+        result = {'expirations': self.expirations, 'missed': self.missed, 'early': self.early}
+        for percent in percentiles:
+            result['jitter_p{}'.format(percent)] = self.jitter.percentile(percent)
+            result['runtime_p{}'.format(percent)] = self.runtime.percentile(percent)
+        result['jitter_max'] = self.jitter.max
+        return result
+
+    def clear(self):
+        self.jitter.clear()
+        self.runtime.clear()
+        self.expirations = 0
+        self.missed = 0
+        self.early = 0
+
+
+class WheelTimer(object):
+    """Handle for a callback scheduled on a TimerWheel"""
+    __slots__ = ['deadline', 'callback', 'args', 'cancelled', '_slot']
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._slot = None
+
+    @property
+    def pending(self):
+        """True if the timer has neither fired nor been cancelled"""
+        return self._slot is not None
+
+    def __repr__(self):
+        return "<{} deadline={} pending={} callback={!r}>".format(self.__class__.__name__,
+                                                                   self.deadline,
+                                                                   self.pending,
+                                                                   self.callback)
+
+
+class TimerWheel(object):
+    """Run any number of timers on a single timerfd
+
+    Timers are kept in a hierarchical timing wheel (as used by the kernel),
+    WHEEL_LEVELS levels of 2**WHEEL_BITS slots each, so scheduling and
+    cancelling are O(1) no matter how many timers there are. The timerfd is
+    armed with an absolute deadline for the next slot that needs attention
+    and an interval of one tick, reading it returns the number of ticks that
+    have passed since that deadline so a count above 1 means the wheel was
+    serviced late (counted in 'overruns') and those ticks are caught up on
+
+    >>> wheel = TimerWheel(tick=0.01)
+    >>> handle = wheel.schedule(5, print, 'timed out')
+    >>> wheel.reschedule(handle, 10)
+    >>> wheel.cancel(handle)
+    >>> wheel.run()
+
+    Timers fire on the first tick at or after their deadline, never early
+    """
+    def __init__(self, tick=WHEEL_TICK, closefd=_CLOEXEC_DEFAULT):
+        """Create a new TimerWheel
+
+        Arguments
+        ----------
+        :param float tick: Resolution of the wheel in seconds
+        :param bool closefd: Close the timerfd on exec
+        """
+        self._tick_ns = int(round(tick * 1000000000))
+        assert self._tick_ns > 0, 'tick must be at least 1ns'
+        self.tick = self._tick_ns / 1000000000.0
+
+        self._size = 1 << WHEEL_BITS
+        self._mask = self._size - 1
+        self._max_ticks = (1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1
+        self._wheels = [[{} for i in range(self._size)] for level in range(WHEEL_LEVELS)]
+
+        # tick 0 is when the wheel was created, _current is the last tick processed
+        self._start_ns = self._now_ns()
+        self._current = 0
+        self._armed = None
+        self._count = 0
+        self.overruns = 0
+
+        # CLOCK_MONOTONIC matches utils.monotonic
+        self._timer = Timer(CLOCK_MONOTONIC, closefd=closefd)
+
+    @staticmethod
+    def _now_ns():
+        return _monotonic_ns()
+
+    def _now_tick(self):
+        return (self._now_ns() - self._start_ns) // self._tick_ns
+
+    def fileno(self):
+        return self._timer.fileno()
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) after 'delay' seconds
+
+        :return: A handle that can be passed to cancel() and reschedule()
+        :rtype: WheelTimer
+        """
+        handle = WheelTimer(0, callback, args)
+        self._schedule(handle, delay)
+        return handle
+
+    def _schedule(self, handle, delay):
+        now = self._now_ns() - self._start_ns
+        if self._count == 0 and self._armed is None:
+            # nothing to catch up on, bring the wheel up to date
+            self._current = max(self._current, now // self._tick_ns)
+
+        # round up so we never fire early
+        deadline = -(-(now + int(delay * 1000000000)) // self._tick_ns)
+        handle.deadline = max(deadline, self._current + 1)
+        handle.cancelled = False
+        self._insert(handle)
+        self._count += 1
+
+        if self._armed is None or handle.deadline < self._armed:
+            self._arm(handle.deadline)
+
+    def cancel(self, handle):
+        """Stop a timer from firing, cancelling a timer that has already fired is a noop"""
+        handle.cancelled = True
+        if handle._slot is not None:
+            del handle._slot[handle]
+            handle._slot = None
+            self._count -= 1
+            # the timerfd is left armed, a wakeup with nothing to do is cheaper
+            # than working out the next deadline on every cancel
+
+    def reschedule(self, handle, delay):
+        """Move a timer to fire 'delay' seconds from now, even if it has already fired"""
+        self.cancel(handle)
+        self._schedule(handle, delay)
+
+    def _insert(self, handle):
+        delta = min(handle.deadline - self._current, self._max_ticks)
+        level = 0
+        while delta >= self._size and level < WHEEL_LEVELS - 1:
+            delta >>= WHEEL_BITS
+            level += 1
+        # timers beyond the last level are parked early and reinserted when reached
+        target = min(handle.deadline, self._current + self._max_ticks)
+        slot = self._wheels[level][(target >> (WHEEL_BITS * level)) & self._mask]
+        slot[handle] = None
+        handle._slot = slot
+
+    def _next_tick(self):
+        """The next tick that has timers to fire or cascade, None if the wheel is empty"""
+        if self._count == 0:
+            return None
+
+        best = None
+        for level, wheel in enumerate(self._wheels):
+            shift = WHEEL_BITS * level
+            base = self._current >> shift
+            if best is not None and (base + 1) << shift >= best:
+                break
+            for k in range(1, self._size + 1):
+                if wheel[(base + k) & self._mask]:
+                    tick = (base + k) << shift
+                    if best is None or tick < best:
+                        best = tick
+                    break
+        return best
+
+    def _cascade(self, tick):
+        for level in range(1, WHEEL_LEVELS):
+            shift = WHEEL_BITS * level
+            if tick & ((1 << shift) - 1):
+                break
+            index = (tick >> shift) & self._mask
+            slot = self._wheels[level][index]
+            if slot:
+                self._wheels[level][index] = {}
+                for handle in slot:
+                    self._insert(handle)
+
+    def _arm(self, tick):
+        deadline = self._start_ns + tick * self._tick_ns
+        seconds, nano_seconds = divmod(deadline, 1000000000)
+        interval_seconds, interval_nano_seconds = divmod(self._tick_ns, 1000000000)
+        self._timer.every(interval_seconds, interval_nano_seconds)
+        self._timer.after(seconds, nano_seconds)
+        self._timer.update(absolute=True)
+        self._armed = tick
+
+    def _disarm(self):
+        self._timer.every(0, 0).disable().update()
+        self._armed = None
+
+    def advance(self, target):
+        """Fire every timer due at or before tick 'target'
+
+        :return: The timers that fired
+        :rtype: list
+        """
+        fired = []
+        while True:
+            tick = self._next_tick()
+            if tick is None or tick > target:
+                self._current = max(self._current, target)
+                break
+
+            self._current = tick
+            self._cascade(tick)
+            index = tick & self._mask
+            slot = self._wheels[0][index]
+            if slot:
+                self._wheels[0][index] = {}
+                for handle in slot:
+                    if handle.deadline > tick:
+                        # parked beyond the range of the wheel
+                        self._insert(handle)
+                    else:
+                        handle._slot = None
+                        self._count -= 1
+                        fired.append(handle)
+
+        for handle in fired:
+            # an earlier callback may have cancelled or rescheduled this one
+            if not handle.cancelled and handle._slot is None:
+                handle.callback(*handle.args)
+
+        return fired
+
+    def expire(self):
+        """Read the timerfd and fire everything that is due, call when the fd is readable
+
+        :return: The timers that fired
+        :rtype: list
+        """
+        count = self._timer.read_event()
+        armed = self._armed
+        if armed is None:
+            return []
+
+        self.overruns += count - 1
+        target = armed + count - 1
+        fired = self.advance(target)
+
+        tick = self._next_tick()
+        if tick is None:
+            self._disarm()
+        elif tick == target + 1:
+            # the interval already fires on the very next tick
+            self._armed = tick
+        else:
+            self._arm(tick)
+        return fired
+
+    def run_once(self, timeout=None):
+        """Wait up to 'timeout' seconds for timers to become due and fire them"""
+        rd, _, _ = _select([self._timer], [], [], timeout)
+        if rd:
+            return self.expire()
+        return []
+
+    def run(self):
+        """Fire timers forever"""
+        while True:
+            self.run_once()
+
+    def close(self):
+        self._timer.close()
+
+    def __repr__(self):
+        fd = "closed" if self._timer.closed() else self._timer.fileno()
+        return "<{} fd={} tick={}s timers={}>".format(self.__class__.__name__, fd, self.tick, self._count)
+
+
+class RateLimiter(object):
+    """Token buckets for any number of keys (eg tenants) refilled by one timerfd
+
+    A repeating Timer ticks every 'period' seconds, the expiration count it
+    returns is added to a tick counter shared by every bucket. Buckets are
+    only brought up to date when they are used, adding 'rate' * period
+    tokens for every tick since they were last looked at, so refills stay
+    exact however long the process stalls and idle buckets cost nothing
+
+    >>> limiter = RateLimiter(rate=100, capacity=20)
+    >>> limiter.configure('bulk-tenant', rate=10, capacity=5)
+    >>> limiter.acquire('tenant-a')      # blocks until a token is available
+    >>> limiter.try_acquire('tenant-b', 3)
+    True
+    """
+    def __init__(self, rate, capacity, period=RATE_TICK, closefd=_CLOEXEC_DEFAULT):
+        """Create a new RateLimiter
+
+        Arguments
+        ----------
+        :param float rate: Default tokens added per second to each bucket
+        :param float capacity: Default maximum tokens a bucket holds (the burst size)
+        :param float period: Seconds between refills
+        :param bool closefd: Close the timerfd on exec
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.period = period
+
+        # key -> [tokens, tick last refilled, tokens per tick, capacity]
+        self._buckets = {}
+        self._ticks = 0
+
+        self._timer = Timer(CLOCK_MONOTONIC, TFD_NONBLOCK, closefd=closefd)
+        seconds, nano_seconds = divmod(int(round(period * 1000000000)), 1000000000)
+        self._timer.every(seconds, nano_seconds).after(seconds, nano_seconds).update()
+
+    def fileno(self):
+        return self._timer.fileno()
+
+    def configure(self, key, rate=None, capacity=None):
+        """Give 'key' its own rate and/or capacity, its bucket starts full"""
+        rate = self.rate if rate is None else rate
+        capacity = self.capacity if capacity is None else capacity
+        self._buckets[key] = [capacity, self._ticks, rate * self.period, capacity]
+
+    def remove(self, key):
+        """Forget the bucket for 'key', it will start full if used again"""
+        self._buckets.pop(key, None)
+
+    def poll(self):
+        """Add any expirations of the timer to the tick counter
+
+        :return: The number of ticks added
+        :rtype: int
+        """
+        try:
+            count = self._timer.read_event()
+        except OSError as err:
+            if err.errno != _EAGAIN:
+                raise
+            return 0
+        self._ticks += count
+        return count
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, self._ticks, self.rate * self.period, self.capacity]
+        elif bucket[1] != self._ticks:
+            bucket[0] = min(bucket[3], bucket[0] + (self._ticks - bucket[1]) * bucket[2])
+            bucket[1] = self._ticks
+        return bucket
+
+    def tokens(self, key):
+        """The number of tokens currently available to 'key'"""
+        self.poll()
+        return self._bucket(key)[0]
+
+    def try_acquire(self, key, n=1, poll=True):
+        """Take 'n' tokens from the bucket for 'key' if they are available
+
+        Pass poll=False when poll() has just been called, eg when serving
+        several keys after a single refill
+
+        :return: True if the tokens were taken
+        :rtype: bool
+        """
+        if poll:
+            self.poll()
+        bucket = self._bucket(key)
+        if n > bucket[3]:
+            raise ValueError("Can not acquire {} tokens from a bucket of {}".format(n, bucket[3]))
+        if bucket[0] >= n:
+            bucket[0] -= n
+            return True
+        return False
+
+    def delay(self, key, n=1):
+        """Seconds until 'n' tokens will be available to 'key', 0 if they are now"""
+        self.poll()
+        bucket = self._bucket(key)
+        if bucket[0] >= n:
+            return 0
+        return -(-(n - bucket[0]) // bucket[2]) * self.period
+
+    def acquire(self, key, n=1, timeout=None):
+        """Take 'n' tokens from the bucket for 'key', blocking until they are available
+
+        Arguments
+        ----------
+        :param key: The bucket to take tokens from
+        :param float n: The number of tokens to take
+        :param float timeout: Give up after this many seconds, None waits forever
+
+        Returns
+        --------
+        :return: True if the tokens were taken, False on timeout
+        :rtype: bool
+
+        Exceptions
+        -----------
+        :raises ValueError: n is larger than the bucket can ever hold
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        while not self.try_acquire(key, n):
+            wait = None
+            if deadline is not None:
+                wait = deadline - _monotonic()
+                if wait <= 0:
+                    return False
+            # wake on the next refill
+            _select([self._timer], [], [], wait)
+        return True
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def close(self):
+        self._timer.close()
+
+    def __repr__(self):
+        fd = "closed" if self._timer.closed() else self._timer.fileno()
+        return "<{} fd={} rate={} capacity={} buckets={}>".format(self.__class__.__name__, fd,
+                                                                   self.rate, self.capacity,
+                                                                   len(self._buckets))
+
+
+class ScheduledJob(object):
+    """Handle for a callback scheduled on a DeadlineScheduler"""
+    __slots__ = ['deadline', 'interval', 'callback', 'args', 'cancelled', 'runs', 'missed']
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline # ns on the scheduler's clock
+        self.interval = interval # ns, 0 for a one shot job
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+
+    @property
+    def when(self):
+        """The next time the job runs, in seconds on the scheduler's clock"""
+        return self.deadline / 1000000000.0
+
+    def __repr__(self):
+        return "<{} when={} interval={}s cancelled={} callback={!r}>".format(self.__class__.__name__,
+                                                                           self.when,
+                                                                           self.interval / 1000000000.0,
+                                                                           self.cancelled,
+                                                                           self.callback)
+
+
+class DeadlineScheduler(object):
+    """Run jobs at absolute times (cron like) from a single timerfd
+
+    Jobs are kept in a heap ordered by deadline and the timerfd is armed with
+    TFD_TIMER_ABSTIME for the earliest one, so any number of jobs costs one
+    fd and scheduling is O(log n). Repeating jobs are aligned to multiples of
+    their interval on the clock (every(60, ...) runs on the minute) and runs
+    missed while the process was stalled are skipped and counted rather than
+    run back to back
+
+    On CLOCK_REALTIME the timer is armed with TFD_TIMER_CANCEL_ON_SET, if the
+    wall clock is stepped (settimeofday, NTP step, resume from suspend) the
+    kernel wakes us with ECANCELED, repeating jobs are realigned to the new
+    time and one shot jobs that are now in the past run immediately
+
+    >>> scheduler = DeadlineScheduler()
+    >>> scheduler.at(time.time() + 3600, print, 'an hour from now')
+    >>> scheduler.every(60, rotate_logs)
+    >>> scheduler.run()
+    """
+    def __init__(self, clock_type=CLOCK_REALTIME, closefd=_CLOEXEC_DEFAULT):
+        """Create a new DeadlineScheduler
+
+        Arguments
+        ----------
+        :param int clock_type: CLOCK_REALTIME to schedule by wall time (time.time()),
+                               CLOCK_MONOTONIC to schedule by utils.monotonic()
+        :param bool closefd: Close the timerfd on exec
+        """
+        if clock_type not in (CLOCK_REALTIME, CLOCK_MONOTONIC):
+            raise ValueError("clock_type must be CLOCK_REALTIME or CLOCK_MONOTONIC")
+
+        self.clock_type = clock_type
+        self._timer = Timer(clock_type, TFD_NONBLOCK, closefd=closefd)
+        self._heap = []
+        self._seq = _count()
+        self._armed = None
+        self._count = 0
+        self._cancelled = 0
+        self.clock_jumps = 0
+
+    def _now_ns(self):
+        if self.clock_type == CLOCK_REALTIME:
+            return int(_time() * 1000000000)
+        return _monotonic_ns()
+
+    def time(self):
+        """The current time on the scheduler's clock in seconds"""
+        return self._now_ns() / 1000000000.0
+
+    def fileno(self):
+        return self._timer.fileno()
+
+    def __len__(self):
+        return self._count
+
+    def at(self, when, callback, *args):
+        """Call callback(*args) once at 'when' seconds on the scheduler's clock
+
+        :return: A handle that can be passed to cancel()
+        :rtype: ScheduledJob
+        """
+        job = ScheduledJob(int(when * 1000000000), 0, callback, args)
+        self._push(job)
+        return job
+
+    def every(self, interval, callback, *args):
+        """Call callback(*args) every 'interval' seconds, on multiples of 'interval'
+
+        :return: A handle that can be passed to cancel()
+        :rtype: ScheduledJob
+        """
+        interval = int(round(interval * 1000000000))
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        job = ScheduledJob(self._align(self._now_ns(), interval), interval, callback, args)
+        self._push(job)
+        return job
+
+    @staticmethod
+    def _align(now, interval):
+        return (now // interval + 1) * interval
+
+    def cancel(self, job):
+        """Stop a job from running, cancelling a job that has already run is a noop"""
+        if job.cancelled:
+            return
+        job.cancelled = True
+        if job.runs and not job.interval:
+            return
+        self._count -= 1
+        self._cancelled += 1
+
+        if self._cancelled > 1024 and self._cancelled > len(self._heap) // 2:
+            # too much dead weight, rebuild without the cancelled jobs
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            _heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def _push(self, job):
+        _heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        self._count += 1
+        if self._armed is None or job.deadline < self._armed:
+            self._arm(job.deadline)
+
+    def next_deadline(self):
+        """Seconds on the scheduler's clock of the next job to run, None if there are none"""
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            _heapq.heappop(heap)
+            self._cancelled -= 1
+        if not heap:
+            return None
+        return heap[0][0] / 1000000000.0
+
+    def _arm(self, deadline):
+        seconds, nano_seconds = divmod(deadline, 1000000000)
+        self._timer.every(0, 0).after(seconds, nano_seconds)
+        self._timer.update(absolute=True, cancel_on_set=self.clock_type == CLOCK_REALTIME)
+        self._armed = deadline
+
+    def _rearm(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            _heapq.heappop(heap)
+            self._cancelled -= 1
+        if heap:
+            self._arm(heap[0][0])
+        elif self._armed is not None:
+            self._timer.every(0, 0).disable().update()
+            self._armed = None
+
+    def _clock_changed(self):
+        """Realign repeating jobs after the clock was set"""
+        self.clock_jumps += 1
+        now = self._now_ns()
+        for deadline, seq, job in self._heap:
+            if job.interval and not job.cancelled:
+                job.deadline = self._align(now, job.interval)
+        self._heap = [(job.deadline, seq, job) for deadline, seq, job in self._heap]
+        _heapq.heapify(self._heap)
+
+    def run_pending(self):
+        """Run every job whose deadline has passed
+
+        :return: The jobs that ran
+        :rtype: list
+        """
+        now = self._now_ns()
+        heap = self._heap
+        due = []
+        while heap and heap[0][0] <= now:
+            deadline, seq, job = _heapq.heappop(heap)
+            if job.cancelled:
+                self._cancelled -= 1
+                continue
+            due.append(job)
+            job.runs += 1
+            if job.interval:
+                missed = (now - deadline) // job.interval
+                job.missed += missed
+                job.deadline = deadline + (missed + 1) * job.interval
+                _heapq.heappush(heap, (job.deadline, seq, job))
+            else:
+                self._count -= 1
+
+        # arm before running anything so an exception in a callback does not
+        # leave the remaining jobs stranded
+        self._rearm()
+
+        for job in due:
+            # an earlier callback may have cancelled this one
+            if not job.cancelled:
+                job.callback(*job.args)
+        return due
+
+    def expire(self):
+        """Read the timerfd and run everything that is due, call when the fd is readable
+
+        :return: The jobs that ran
+        :rtype: list
+        """
+        try:
+            self._timer.read_event()
+        except OSError as err:
+            if err.errno == _ECANCELED:
+                self._clock_changed()
+            elif err.errno != _EAGAIN:
+                raise
+        return self.run_pending()
+
+    def run_once(self, timeout=None):
+        """Wait up to 'timeout' seconds for jobs to become due and run them"""
+        rd, _, _ = _select([self._timer], [], [], timeout)
+        if rd:
+            return self.expire()
+        return []
+
+    def run(self):
+        """Run jobs forever"""
+        while True:
+            self.run_once()
+
+    def close(self):
+        self._timer.close()
+
+    def __repr__(self):
+        fd = "closed" if self._timer.closed() else self._timer.fileno()
+        clock = "realtime" if self.clock_type == CLOCK_REALTIME else "monotonic"
+        return "<{} fd={} clock={} jobs={}>".format(self.__class__.__name__, fd, clock, self._count)
@@ -25,6 +25,12 @@ else:
 PermissionError = PermissionError
 TimeoutError = TimeoutError
 
+try:
+    from time import monotonic
+except ImportError:
+    # python2.7 has no monotonic clock, fall back to wall time
+    from time import time as monotonic
+
 class InternalError(Exception):
     """This Error occured due to an internal bug or OS misconfiguration"""
 
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""watcher: watch an entire directory tree for changes
+
+FileWatcher picks the cheapest way the kernel offers to watch a tree. With
+CAP_SYS_ADMIN a single fanotify FAN_MARK_FILESYSTEM mark covers every file on
+the filesystem and events outside the tree are filtered by path. Without it
+one inotify watch is placed on every directory, which is bounded by
+/proc/sys/fs/inotify/max_user_watches. Both backends produce FileEvents
+
+>>> watcher = FileWatcher('/srv/data')
+>>> for event in watcher:
+...     print(event.action, event.path)
+"""
+
+from .utils import Eventlike as _Eventlike
+from .utils import PermissionError as _PermissionError
+from .utils import TimeoutError as _TimeoutError
+from .utils import monotonic as _monotonic
+from .fanotify import Fanotify as _Fanotify
+from .inotify import Inotify as _Inotify
+from . import fanotify as _fan
+from . import inotify as _in
+
+from collections import namedtuple as _namedtuple
+from collections import OrderedDict as _OrderedDict
+from select import select as _select
+import os as _os
+
+CREATE = 'create'
+DELETE = 'delete'
+MODIFY = 'modify'
+ATTRIB = 'attrib'
+CLOSE_WRITE = 'close_write'
+MOVED_FROM = 'moved_from'
+MOVED_TO = 'moved_to'
+OVERFLOW = 'overflow' # events were lost, path is None
+
+DEFAULT_ACTIONS = (CREATE, DELETE, MODIFY, MOVED_FROM, MOVED_TO)
+DIR_CACHE_SIZE = 4096 # directory handles remembered by the fanotify backend
+
+FileEvent = _namedtuple('FileEvent', 'action path is_dir')
+
+# action -> (inotify mask, fanotify mask), in the order actions are reported
+# when the kernel merges several events into one
+_ACTIONS = _OrderedDict([
+    (CREATE,      (_in.IN_CREATE,      _fan.FAN_CREATE)),
+    (MOVED_TO,    (_in.IN_MOVED_TO,    _fan.FAN_MOVED_TO)),
+    (MODIFY,      (_in.IN_MODIFY,      _fan.FAN_MODIFY)),
+    (ATTRIB,      (_in.IN_ATTRIB,      _fan.FAN_ATTRIB)),
+    (CLOSE_WRITE, (_in.IN_CLOSE_WRITE, _fan.FAN_CLOSE_WRITE)),
+    (MOVED_FROM,  (_in.IN_MOVED_FROM,  _fan.FAN_MOVED_FROM)),
+    (DELETE,      (_in.IN_DELETE,      _fan.FAN_DELETE)),
+    ])
+
+# entry events can only be received from a filesystem mark, mount marks
+# only report access to files
+_FAN_ENTRY_EVENTS = _fan.FAN_CREATE|_fan.FAN_DELETE|_fan.FAN_MOVE|_fan.FAN_ATTRIB
+
+
+class FileWatcher(_Eventlike):
+    def __init__(self, path, actions=DEFAULT_ACTIONS, backend=None):
+        """Watch every file and directory beneath path
+
+        Arguments
+        ----------
+        :param str path: The root of the tree to watch
+        :param list actions: The actions to report (CREATE, DELETE, MODIFY, ATTRIB,
+                             CLOSE_WRITE, MOVED_FROM, MOVED_TO)
+        :param str backend: Force 'fanotify' or 'inotify', by default fanotify is
+                            tried first and inotify used if it is not permitted
+
+        Exceptions
+        -----------
+        :raises PermissionError: backend='fanotify' and the process lacks CAP_SYS_ADMIN
+        :raises ValueError: An unknown action or backend was requested
+        """
+        super(FileWatcher, self).__init__()
+        for action in actions:
+            if action not in _ACTIONS:
+                raise ValueError("Unknown action: {}".format(action))
+
+        self.path = _os.path.abspath(path).rstrip('/') or '/'
+        self._prefix = self.path.rstrip('/') + '/'
+        self._actions = tuple(actions)
+        self._backend = None
+
+        if backend not in (None, 'fanotify', 'inotify'):
+            raise ValueError("backend must be one of 'fanotify' or 'inotify'")
+
+        if backend in (None, 'fanotify'):
+            try:
+                self._backend = _FanotifyBackend(self.path, self._actions)
+            except (_PermissionError, ValueError, OSError):
+                if backend == 'fanotify':
+                    raise
+
+        if self._backend is None:
+            self._backend = _InotifyBackend(self.path, self._actions)
+
+        self._fd = self._backend.fileno()
+
+    @property
+    def backend(self):
+        """'fanotify' or 'inotify' depending on the backend in use"""
+        return self._backend.name
+
+    def wait(self, timeout=None):
+        """Wait for an event inside the tree, raising TimeoutError if none
+        turns up within 'timeout' seconds (forever if None)
+
+        A filesystem mark sees the whole filesystem and some raw events (eg
+        IN_IGNORED) are never reported so the fd becoming readable does not
+        mean an event will be returned, keep waiting on it until one is
+        """
+        deadline = None if timeout is None else _monotonic() + timeout
+        while not self._events:
+            rd, _, _ = _select([self], [], [], timeout)
+            if rd:
+                self._events = self._read_events()
+                if self._events:
+                    break
+
+            if deadline is not None:
+                timeout = deadline - _monotonic()
+                if timeout <= 0:
+                    raise _TimeoutError("No event occured")
+
+        return self._events.pop(0)
+
+    def read_event(self):
+        """Return a single event, blocking until one inside the tree turns up"""
+        return self.wait()
+
+    def _read_events(self):
+        """Filter a single read from the backend down to the events inside the
+        tree, returns [] if nothing is queued or nothing matched
+        """
+        rd, _, _ = _select([self], [], [], 0)
+        if not rd:
+            return []
+
+        return [event for event in self._backend.read_events()
+                if event.path is None or event.path == self.path or event.path.startswith(self._prefix)]
+
+    def close(self):
+        self._backend.close()
+        self._fd = None
+
+
+class _FanotifyBackend(object):
+    """Single FAN_MARK_FILESYSTEM mark reporting directory handles and names"""
+    name = 'fanotify'
+
+    def __init__(self, path, actions):
+        mask = _fan.FAN_ONDIR
+        for action in actions:
+            mask |= _ACTIONS[action][1]
+
+        self._fanotify = _Fanotify(_fan.FAN_CLASS_NOTIF|_fan.FAN_REPORT_DFID_NAME)
+        try:
+            try:
+                self._fanotify.watch(path, mask, _fan.FAN_MARK_FILESYSTEM)
+            except ValueError:
+                # older kernels, fall back to the mount if we can do without
+                # entry events
+                if mask & _FAN_ENTRY_EVENTS:
+                    raise
+                self._fanotify.watch(path, mask, _fan.FAN_MARK_MOUNT)
+        except:
+            self._fanotify.close()
+            raise
+
+        # (fsid, handle) -> directory path, saves opening the handle of busy dirs
+        self._dirs = _OrderedDict()
+
+    def fileno(self):
+        return self._fanotify.fileno()
+
+    def _dir_path(self, fid):
+        key = (fid.fsid, fid.handle)
+        path = self._dirs.get(key)
+        if path is None:
+            dir_fid = fid._replace(name=None)
+            path = self._fanotify.resolve_fid(_DirEvent((dir_fid,)))
+            if path is None:
+                return None
+            self._dirs[key] = path
+            if len(self._dirs) > DIR_CACHE_SIZE:
+                self._dirs.popitem(last=False)
+        return path
+
+    def read_events(self):
+        events = []
+        for event in self._fanotify.read_events():
+            if event.mask & _fan.FAN_Q_OVERFLOW:
+                events.append(FileEvent(OVERFLOW, None, False))
+                continue
+
+            path = None
+            for fid in event.fids:
+                if fid.name is None:
+                    continue
+                path = self._dir_path(fid)
+                if path is not None and fid.name != b'.':
+                    path = _os.path.join(path, _os.fsdecode(fid.name))
+                break
+            if path is None:
+                continue
+
+            is_dir = bool(event.mask & _fan.FAN_ONDIR)
+            if is_dir and event.mask & (_fan.FAN_MOVED_FROM|_fan.FAN_DELETE):
+                # cached paths beneath this directory are now stale
+                self._dirs.clear()
+
+            for action, (_, fan_mask) in _ACTIONS.items():
+                if event.mask & fan_mask:
+                    events.append(FileEvent(action, path, is_dir))
+
+        return events
+
+    def close(self):
+        self._fanotify.close()
+
+
+class _DirEvent(object):
+    """Minimal stand in for a FanotifyEvent when resolving a bare handle"""
+    __slots__ = ['fids', '_filename']
+    def __init__(self, fids):
+        self.fids = fids
+        self._filename = None
+
+
+class _InotifyBackend(object):
+    """One inotify watch per directory, new directories are watched as they appear"""
+    name = 'inotify'
+
+    def __init__(self, path, actions):
+        report = 0
+        for action in actions:
+            report |= _ACTIONS[action][0]
+        # IN_CREATE/IN_MOVED_TO are always watched to follow new directories
+        # and IN_MOVED_FROM to follow renamed ones but are only reported if
+        # they were asked for
+        self._report = report
+        self._mask = report|_in.IN_CREATE|_in.IN_MOVED_FROM|_in.IN_MOVED_TO|_in.IN_ONLYDIR
+
+        # wd -> directory path, kept current as directories are renamed
+        self._paths = {}
+        self._inotify = _Inotify()
+        try:
+            self._watch_tree(path)
+        except:
+            self._inotify.close()
+            raise
+
+    def fileno(self):
+        return self._inotify.fileno()
+
+    def watched_path(self, wd):
+        """The current path of the directory a wd is watching"""
+        return self._paths.get(wd)
+
+    def _watch_tree(self, path, found=None):
+        for dirpath, dirnames, filenames in _os.walk(path):
+            try:
+                wd = self._inotify.watch(dirpath, self._mask)
+            except ValueError:
+                # removed before we got to it
+                dirnames[:] = []
+                continue
+            self._paths[wd] = dirpath
+
+            if found is not None:
+                found.extend(FileEvent(CREATE, _os.path.join(dirpath, name), True) for name in dirnames)
+                found.extend(FileEvent(CREATE, _os.path.join(dirpath, name), False) for name in filenames)
+
+    def _beneath(self, path):
+        prefix = path + '/'
+        return [(wd, watched) for wd, watched in self._paths.items()
+                if watched == path or watched.startswith(prefix)]
+
+    def _renamed(self, old, new):
+        for wd, watched in self._beneath(old):
+            self._paths[wd] = new + watched[len(old):]
+
+    def _removed(self, path):
+        # moved out of the tree, its watches would report events under a
+        # path that no longer exists
+        for wd, _ in self._beneath(path):
+            del self._paths[wd]
+            try:
+                self._inotify.ignore(wd)
+            except ValueError:
+                # already removed by the kernel
+                self._inotify.forget(wd)
+
+    def read_events(self):
+        events = []
+        # cookie -> old path of directories moved in this read
+        moves = {}
+        for event in self._inotify.read_events():
+            if event.mask & _in.IN_Q_OVERFLOW:
+                events.append(FileEvent(OVERFLOW, None, False))
+                continue
+
+            if event.mask & (_in.IN_IGNORED|_in.IN_DELETE_SELF):
+                if event.mask & _in.IN_IGNORED:
+                    self._inotify.forget(event.wd)
+                self._paths.pop(event.wd, None)
+                continue
+
+            dirpath = self._paths.get(event.wd)
+            if dirpath is None or not event.filename:
+                continue
+            path = _os.path.join(dirpath, _os.fsdecode(event.filename))
+            is_dir = bool(event.mask & _in.IN_ISDIR)
+
+            for action, (in_mask, _) in _ACTIONS.items():
+                if event.mask & in_mask & self._report:
+                    events.append(FileEvent(action, path, is_dir))
+
+            if not is_dir:
+                continue
+            if event.mask & _in.IN_MOVED_FROM:
+                moves[event.cookie] = path
+            elif event.mask & _in.IN_MOVED_TO and event.cookie in moves:
+                # renamed within the tree, the watches moved with it
+                self._renamed(moves.pop(event.cookie), path)
+            elif event.mask & (_in.IN_CREATE|_in.IN_MOVED_TO):
+                # anything created in the new directory before the watch was
+                # added would otherwise never be seen
+                found = [] if self._report & _in.IN_CREATE else None
+                self._watch_tree(path, found)
+                events.extend(found or ())
+
+        # the kernel queues both halves of a rename together, a move with no
+        # IN_MOVED_TO left the tree
+        for path in moves.values():
+            self._removed(path)
+
+        return events
+
+    def close(self):
+        self._inotify.close()
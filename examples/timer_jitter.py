@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""Measure how accurately a Timer wakes us up, with and without CPU load
+
+Runs a repeating timer for a while and reports the p50/p99/p999 of how late
+each wakeup was, how many expirations were missed and how long the handler
+took. Load is generated by busy looping processes, one per CPU by default
+
+    python examples/timer_jitter.py --interval 0.001 --duration 5 --load 4
+"""
+from __future__ import print_function
+
+from butter.timerfd import Timer
+from multiprocessing import Process, cpu_count
+from time import time
+import argparse
+
+
+def burn():
+    while True:
+        pass
+
+
+def measure(interval, duration):
+    timer = Timer()
+    stats = timer.enable_stats()
+    interval_ns = int(interval * 1000000000)
+    seconds, nano_seconds = divmod(interval_ns, 1000000000)
+    timer.every(seconds, nano_seconds).after(seconds, nano_seconds).update()
+
+    end = time() + duration
+    while time() < end:
+        timer.wait()
+
+    timer.close()
+    return stats
+
+
+def report(name, stats):
+    to_us = lambda ns: "{:9.1f}us".format(ns / 1000.0) if ns is not None else "      n/a"
+    summary = stats.summary()
+    print("{}: {} expirations, {} missed".format(name, summary['expirations'], summary['missed']))
+    for percent in (50, 99, 99.9):
+        print("  p{:<5} jitter {}  handler {}".format(percent,
+                                                       to_us(summary['jitter_p{}'.format(percent)]),
+                                                       to_us(summary['runtime_p{}'.format(percent)])))
+    print("  max    jitter {}".format(to_us(summary['jitter_max'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--interval', type=float, default=0.001, help='timer interval in seconds')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to measure for')
+    parser.add_argument('--load', type=int, default=cpu_count(), help='busy processes to run')
+    args = parser.parse_args()
+
+    report('idle', measure(args.interval, args.duration))
+
+    burners = [Process(target=burn) for i in range(args.load)]
+    for proc in burners:
+        proc.daemon = True
+        proc.start()
+    try:
+        report('{} busy processes'.format(args.load), measure(args.interval, args.duration))
+    finally:
+        for proc in burners:
+            proc.terminate()
+
+
+if __name__ == '__main__':
+    main()
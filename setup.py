@@ -6,7 +6,8 @@ from setuptools import setup
 import platform
 
 from butter import clone, _eventfd, _fanotify, _inotify
-from butter import _signalfd, splice, system, _timerfd, utils
+from butter import _signalfd, splice, system, _timerfd, utils, _pidfd
+from butter import prefetch
 
 name = 'butter'
 path = 'butter'
@@ -21,7 +22,9 @@ ext_modules = [
     splice._ffi.verifier.get_extension(),
     system._ffi.verifier.get_extension(),
     _timerfd.ffi.verifier.get_extension(),
+    _pidfd.ffi.verifier.get_extension(),
     utils._ffi.verifier.get_extension(),
+    prefetch._ffi.verifier.get_extension(),
     ]
 
 if platform.linux_distribution()[0] == 'debian' and \
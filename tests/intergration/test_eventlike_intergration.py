@@ -4,6 +4,7 @@ from butter.fanotify import Fanotify, FAN_CLASS_NOTIF
 from butter.inotify import Inotify, IN_ALL_EVENTS
 from butter.signalfd import Signalfd, pthread_sigmask
 from butter.timerfd import Timer
+from butter.utils import TimeoutError
 
 from tempfile import TemporaryDirectory
 from time import time, sleep
@@ -52,6 +53,60 @@ def test_fanotify_intergration():
         
         notifier.close()
 
+@pytest.mark.skipif(os.getuid() != 0, reason="fanotify can only be used by root")
+@pytest.mark.intergration
+@pytest.mark.fanotify
+def test_fanotify_fid_intergration():
+    """Directory entry events reported by file handle rather than fd"""
+    from butter.fanotify import FAN_REPORT_DFID_NAME, FAN_CREATE, FAN_NOFD
+
+    with TemporaryDirectory() as tmpdir:
+        notifier = Fanotify(FAN_CLASS_NOTIF|FAN_REPORT_DFID_NAME)
+        notifier.watch(tmpdir, FAN_CREATE|FAN_EVENT_ON_CHILD)
+
+        path = os.path.join(tmpdir, 'created')
+        open(path, 'w').close()
+
+        event = notifier.wait(1)
+        assert event.create_event
+        assert event.fd == FAN_NOFD, "FID events should not carry an fd"
+        assert notifier.resolve_fid(event) == path
+
+        # names that are not valid utf-8 round trip through os.fsdecode
+        path = os.path.join(os.fsencode(tmpdir), b'\xff')
+        open(path, 'w').close()
+        event = notifier.wait(1)
+        assert os.fsencode(notifier.resolve_fid(event)) == path
+
+        with pytest.raises(OSError):
+            notifier.watch(os.path.join(tmpdir, 'missing'), FAN_CREATE)
+        assert len(notifier._mount_fds) == 1, 'Failed watch leaked a mount fd'
+
+        notifier.close()
+
+@pytest.mark.skipif(os.getuid() != 0, reason="fanotify can only be used by root")
+@pytest.mark.intergration
+@pytest.mark.fanotify
+def test_watcher_fanotify_intergration():
+    """A filesystem wide mark only reports events beneath the watched path"""
+    from butter.watcher import FileWatcher, FileEvent, CREATE
+
+    with TemporaryDirectory() as tmpdir, TemporaryDirectory() as otherdir:
+        watcher = FileWatcher(tmpdir, backend='fanotify')
+
+        open(os.path.join(otherdir, 'ignored'), 'w').close()
+        path = os.path.join(tmpdir, 'created')
+        open(path, 'w').close()
+
+        assert watcher.wait(1) == FileEvent(CREATE, path, False)
+
+        # only events outside the tree, wait() must still honour its timeout
+        open(os.path.join(otherdir, 'ignored_too'), 'w').close()
+        with pytest.raises(TimeoutError):
+            watcher.wait(0.1)
+
+        watcher.close()
+
 @pytest.mark.intergration
 @pytest.mark.inotify
 def test_inotify_intergration():
@@ -128,3 +183,79 @@ def test_timerfd_intergration():
     assert LOWER_BOUND < next_event < UPPER_BOUND, "current timer does not match what we expect after a (known) time delay"
 
     t.close()
+
+@pytest.mark.skipif(os.getuid() != 0, reason="fanotify can only be used by root")
+@pytest.mark.intergration
+@pytest.mark.fanotify
+def test_prefetch_record_intergration():
+    from butter.prefetch import PrefetchRecorder
+
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'used')
+        with open(path, 'w') as f:
+            f.write('data')
+
+        recorder = PrefetchRecorder(tmpdir, FAN_OPEN|FAN_EVENT_ON_CHILD, mark_flags=0)
+        proc = subprocess.Popen(['cat', path], stdout=subprocess.DEVNULL)
+        recorder.follow(proc.pid)
+        # the zombie keeps /proc/<pid> around until it is reaped
+        recorder.record(0.2)
+        proc.wait()
+        recorder.close()
+
+        assert recorder.files == [path]
+        assert recorder.manifest() == [(path, 0, 4)]
+
+@pytest.mark.skipif(os.getuid() != 0, reason="fanotify can only be used by root")
+@pytest.mark.intergration
+@pytest.mark.fanotify
+def test_fanotify_lifecycle_intergration():
+    with TemporaryDirectory() as tmpdir:
+        notifier = Fanotify(FAN_CLASS_NOTIF, read_events_max=2)
+        notifier.watch(tmpdir, FAN_OPEN|FAN_EVENT_ON_CHILD)
+
+        paths = [os.path.join(tmpdir, str(i)) for i in range(3)]
+        for path in paths:
+            open(path, 'w').close()
+
+        events = notifier.read_events()
+        assert len(events) == 2, 'read_events_max should bound a single read'
+        assert notifier.stats['live_fds'] == 2
+        for event in events:
+            event.close()
+        with notifier.read_event() as event:
+            assert event.filename == paths[2]
+        assert notifier.stats == {'reads': 2, 'events': 3, 'live_fds': 0, 'closed_fds': 3}
+        notifier.close()
+
+        notifier = Fanotify(FAN_CLASS_NOTIF, auto_close=True)
+        notifier.watch(tmpdir, FAN_OPEN|FAN_EVENT_ON_CHILD)
+        open(paths[0]).close()
+        event = notifier.wait(1)
+        assert event.fd is None
+        assert event.filename == paths[0]
+        assert notifier.live_fds == 0
+        notifier.close()
+
+@pytest.mark.skipif(os.getuid() != 0, reason="fanotify can only be used by root")
+@pytest.mark.intergration
+@pytest.mark.fanotify
+def test_fanotify_read_batch_timeout_intergration():
+    """Reading after a wait() timed out returns nothing rather than blocking"""
+    def hung(signum, frame):
+        raise AssertionError('read_batch() blocked')
+
+    with TemporaryDirectory() as tmpdir:
+        notifier = Fanotify(FAN_CLASS_NOTIF)
+        notifier.watch(tmpdir, FAN_OPEN|FAN_EVENT_ON_CHILD)
+
+        old = signal.signal(signal.SIGALRM, hung)
+        signal.alarm(5)
+        try:
+            with pytest.raises(TimeoutError):
+                notifier.wait(0.05)
+            assert len(notifier.read_batch()) == 0
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, old)
+        notifier.close()
@@ -0,0 +1,16 @@
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def loop(request):
+    """A fresh event loop, also installed as the current loop for the test"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def close():
+        asyncio.set_event_loop(None)
+        loop.close()
+    request.addfinalizer(close)
+
+    return loop
@@ -0,0 +1,32 @@
+from butter.asyncio.batch import BatchFlusher_async
+from butter.asyncio.utils import coroutine
+from butter.batch import SIZE, DEADLINE
+from threading import Thread
+import asyncio
+import pytest
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+def test_batch_flusher_async(loop):
+    flusher = BatchFlusher_async(size=3, latency=0.02, loop=loop)
+
+    @coroutine
+    def main():
+        # filled from another thread, the eventfd wakes the loop
+        producer = Thread(target=flusher.extend, args=([0, 1, 2],))
+        producer.start()
+        full = yield from asyncio.wait_for(flusher.get(), 5)
+        producer.join()
+
+        # a lone record is flushed once it is old enough
+        flusher.add(3)
+        late = yield from asyncio.wait_for(flusher.get(), 5)
+        return full, late
+
+    assert loop.run_until_complete(main()) == ([0, 1, 2], [3])
+    assert flusher.stats.reasons[SIZE] == 1
+    assert flusher.stats.reasons[DEADLINE] == 1
+    assert len(flusher) == 0
+
+    flusher.close()
@@ -0,0 +1,38 @@
+from butter.asyncio.channel import Channel_async
+from butter.asyncio.utils import coroutine
+from threading import Thread
+import asyncio
+import pytest
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+def test_channel_async(loop):
+    channel = Channel_async(loop=loop)
+    count = 10000
+
+    def produce():
+        for i in range(count):
+            channel.put(i)
+
+    @coroutine
+    def main():
+        producer = Thread(target=produce)
+        producer.start()
+        received = []
+        while len(received) < count:
+            received.extend((yield from asyncio.wait_for(channel.get_batch(), 5)))
+        producer.join()
+
+        # single items come out one at a time, in order
+        channel.put_many(['a', 'b'])
+        first = yield from asyncio.wait_for(channel.get(), 5)
+        second = yield from asyncio.wait_for(channel.get(), 5)
+        return received, [first, second]
+
+    received, singles = loop.run_until_complete(main())
+    assert received == list(range(count)), 'Items were lost or reordered'
+    assert singles == ['a', 'b']
+    assert len(channel) == 0
+
+    channel.close()
@@ -0,0 +1,33 @@
+from butter.asyncio.eventfd import EventfdSemaphore_async
+from butter.asyncio.utils import coroutine
+import asyncio
+import pytest
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.eventfd
+def test_semaphore_async(loop):
+    sem = EventfdSemaphore_async(1, loop=loop)
+
+    @coroutine
+    def main():
+        yield from sem.acquire()
+        assert sem.value == 0
+
+        # empty, wait for the fd to become readable
+        loop.call_later(0.01, sem.release)
+        yield from asyncio.wait_for(sem.acquire(), 5)
+
+        # too few tokens, poll until enough are released
+        sem.release()
+        loop.call_later(0.01, sem.release)
+        yield from asyncio.wait_for(sem.acquire(2), 5)
+        assert sem.value == 0
+
+        with pytest.raises(asyncio.TimeoutError):
+            yield from asyncio.wait_for(sem.acquire(), 0.01)
+
+    loop.run_until_complete(main())
+    assert not sem._waiters, 'Cancelled waiter was left behind'
+    sem.close()
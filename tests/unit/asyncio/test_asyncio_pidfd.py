@@ -0,0 +1,30 @@
+from butter.asyncio.pidfd import Pidfd_async
+from butter.asyncio.utils import coroutine
+import asyncio
+import pytest
+import signal
+import os
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+def test_pidfd_async(loop):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            while True:
+                signal.pause()
+        finally:
+            os._exit(0)
+
+    proc = Pidfd_async(pid, loop=loop)
+
+    @coroutine
+    def main():
+        loop.call_later(0.01, proc.terminate)
+        # several waiters share the one reader
+        return (yield from asyncio.wait_for(asyncio.gather(proc.wait(), proc.wait()), 5))
+
+    assert loop.run_until_complete(main()) == [-signal.SIGTERM] * 2
+    assert proc.returncode == -signal.SIGTERM
+    proc.close()
@@ -0,0 +1,157 @@
+from butter.asyncio.signalfd import Signalfd_async
+from butter.asyncio.utils import coroutine
+import threading
+import asyncio
+import pytest
+import signal
+
+
+@pytest.fixture
+def sigmask():
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    yield
+    signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+
+def send(signum):
+    # thread directed so no other thread can take it
+    signal.pthread_kill(threading.get_ident(), signum)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.signalfd
+def test_signalfd_async_dispatch(loop, sigmask):
+    sfd = Signalfd_async(loop=loop)
+    called = asyncio.Future(loop=loop)
+    sfd.add_handler(signal.SIGUSR1, called.set_result)
+
+    send(signal.SIGUSR1)
+    info = loop.run_until_complete(asyncio.wait_for(called, 5))
+    assert info.signal == signal.SIGUSR1
+
+    # without a handler the signal goes to wait()
+    sfd.remove_handler(signal.SIGUSR1)
+    send(signal.SIGUSR1)
+    info = loop.run_until_complete(asyncio.wait_for(sfd.wait(), 5))
+    assert info.signal == signal.SIGUSR1
+    assert not sfd._reading, 'Reader left registered with nothing to deliver to'
+
+    sfd.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.signalfd
+def test_signalfd_async_coalesce(loop, sigmask):
+    sfd = Signalfd_async(loop=loop)
+    release = asyncio.Event()
+    runs = []
+
+    @coroutine
+    def handler(info):
+        runs.append(info.signal)
+        yield from release.wait()
+
+    sfd.add_handler(signal.SIGUSR1, handler)
+
+    @coroutine
+    def main():
+        # standard signals merge while pending, let the loop read each one
+        for i in range(4):
+            send(signal.SIGUSR1)
+            yield from asyncio.sleep(0.01)
+        assert runs == [signal.SIGUSR1], 'Busy handler was run again'
+
+        release.set()
+        for i in range(10):
+            yield from asyncio.sleep(0.01)
+            if len(runs) == 2:
+                break
+
+    loop.run_until_complete(asyncio.wait_for(main(), 5))
+    assert len(runs) == 2, 'Signals received while busy should rerun the handler once'
+    assert sfd.coalesced == 2
+
+    sfd.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.signalfd
+def test_signalfd_async_handler_exception(loop, sigmask):
+    sfd = Signalfd_async(loop=loop)
+    contexts = []
+    loop.set_exception_handler(lambda loop, context: contexts.append(context))
+
+    def plain(info):
+        raise KeyError(info.signal)
+
+    @coroutine
+    def coro(info):
+        yield from asyncio.sleep(0)
+        raise ValueError(info.signal)
+
+    sfd.add_handler(signal.SIGUSR1, plain)
+    sfd.add_handler(signal.SIGUSR2, coro)
+
+    @coroutine
+    def main():
+        send(signal.SIGUSR1)
+        send(signal.SIGUSR2)
+        for i in range(100):
+            yield from asyncio.sleep(0.01)
+            if len(contexts) == 2:
+                break
+
+    loop.run_until_complete(main())
+    errors = {(type(context['exception']), context['handler']) for context in contexts}
+    assert errors == {(KeyError, plain), (ValueError, coro)}
+
+    sfd.close()
+
+
+from butter.asyncio.signalfd import RtSignalChannel_async
+from butter.signalfd import SIGRTMIN
+import os
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.signalfd
+def test_rt_signal_channel_async(loop, sigmask):
+    channel = RtSignalChannel_async(3, loop=loop)
+    assert channel.signal == SIGRTMIN + 3
+    values = [1, 2**40, 3]
+
+    def send(values):
+        for value in values:
+            channel.send(os.getpid(), value, channel=3)
+
+    @coroutine
+    def main():
+        loop.call_soon(send, values)
+        first = asyncio.ensure_future(channel.receive(), loop=loop)
+        second = asyncio.ensure_future(channel.receive(), loop=loop)
+        # real time signals queue, everything sent is received in order by
+        # the first receiver while the second waits for the next read
+        first = yield from asyncio.wait_for(first, 5)
+        assert not second.done(), 'Concurrent receivers were handed the same read'
+
+        send([4])
+        second = yield from asyncio.wait_for(second, 5)
+        return first, second
+
+    first, second = loop.run_until_complete(main())
+    assert [message.value for message in first] == values
+    assert first[0].pid == os.getpid()
+    assert [message.value for message in second] == [4]
+
+    # a receiver that gives up does not swallow the next read
+    pending = asyncio.ensure_future(channel.receive(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0))
+    pending.cancel()
+    send([5])
+    messages = loop.run_until_complete(asyncio.wait_for(channel.receive(), 5))
+    assert [message.value for message in messages] == [5]
+
+    channel.close()
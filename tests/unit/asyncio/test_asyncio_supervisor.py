@@ -0,0 +1,43 @@
+from butter.asyncio.supervisor import Supervisor_async
+from butter.asyncio.utils import coroutine
+import asyncio
+import pytest
+import signal
+import sys
+import os
+
+
+@pytest.fixture
+def sigmask():
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    yield
+    signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.signalfd
+def test_supervisor_async(loop, sigmask):
+    supervisor = Supervisor_async(loop=loop)
+
+    @coroutine
+    def main():
+        proc, exited = supervisor.spawn([sys.executable, '-c', 'import sys; sys.exit(3)'])
+        sleeper, killed = supervisor.spawn(['sleep', '60'])
+        sleeper.kill()
+
+        pid = os.fork()
+        if pid == 0:
+            os._exit(5)
+
+        children = yield from asyncio.wait_for(asyncio.gather(exited, killed, supervisor.wait(pid)), 5)
+        return proc, children
+
+    proc, (child, sleeper, forked) = loop.run_until_complete(main())
+    assert (child.pid, child.returncode) == (proc.pid, 3)
+    assert proc.returncode == 3, 'Popen should see the reaped status'
+    assert sleeper.returncode == -signal.SIGKILL
+    assert forked.returncode == 5
+    assert len(supervisor) == 0
+
+    supervisor.close()
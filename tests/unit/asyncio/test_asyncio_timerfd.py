@@ -0,0 +1,173 @@
+from butter.asyncio.timerfd import RateLimiter_async
+from butter.asyncio.utils import coroutine
+import asyncio
+import pytest
+import time
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_rate_limiter_async(loop):
+    limiter = RateLimiter_async(rate=100, capacity=1, period=0.01, loop=loop)
+    order = []
+
+    @coroutine
+    def take(name):
+        yield from limiter.acquire('key')
+        order.append(name)
+
+    @coroutine
+    def main():
+        start = time.monotonic()
+        yield from asyncio.wait_for(asyncio.gather(take(1), take(2), take(3)), 5)
+        return time.monotonic() - start
+
+    elapsed = loop.run_until_complete(main())
+    assert order == [1, 2, 3], 'Waiters were not served in order'
+    assert elapsed >= 0.015, 'Bucket should only refill one token per tick'
+    assert not limiter._reading, 'Timer still watched with nobody waiting'
+
+    with pytest.raises(ValueError):
+        loop.run_until_complete(limiter.acquire('key', 2))
+
+    limiter.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_rate_limiter_async_cancel(loop):
+    limiter = RateLimiter_async(rate=10, capacity=1, loop=loop)
+    assert limiter.try_acquire('key')
+
+    @coroutine
+    def main():
+        with pytest.raises(asyncio.TimeoutError):
+            yield from asyncio.wait_for(limiter.acquire('key'), 0.01)
+
+    loop.run_until_complete(main())
+    assert 'key' not in limiter._waiters, 'Cancelled waiter was left queued'
+    assert not limiter._reading, 'Timer still watched with nobody waiting'
+
+    limiter.close()
+
+
+from butter.asyncio.timerfd import DeadlineScheduler_async
+from butter.timerfd import CLOCK_MONOTONIC
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_deadline_scheduler_async(loop):
+    scheduler = DeadlineScheduler_async(CLOCK_MONOTONIC, loop=loop)
+    fired = []
+
+    @coroutine
+    def main():
+        now = scheduler.time()
+        scheduler.at(now + 0.02, fired.append, 'job')
+        ticker = scheduler.every(0.01, fired.append, 'tick')
+        result = yield from asyncio.wait_for(scheduler.sleep_until(now + 0.035, 'woke'), 5)
+        scheduler.cancel(ticker)
+
+        # an abandoned sleep does not leave its job behind
+        with pytest.raises(asyncio.TimeoutError):
+            yield from asyncio.wait_for(scheduler.sleep_until(now + 60), 0.01)
+        return result
+
+    assert loop.run_until_complete(main()) == 'woke'
+    assert fired.count('job') == 1
+    assert fired.count('tick') >= 2
+    assert fired.index('job') > 0, 'Jobs did not run in deadline order'
+    assert len(scheduler) == 0
+
+    scheduler.close()
+
+
+from butter.asyncio.timerfd import Timerfd_async
+import sys
+
+def _clockid(timer):
+    with open('/proc/self/fdinfo/{}'.format(timer._timerfd.fileno())) as f:
+        for line in f:
+            if line.startswith('clockid:'):
+                return int(line.split()[1])
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_timerfd_async_default_clock(loop):
+    timer = Timerfd_async(loop=loop)
+    assert _clockid(timer) == CLOCK_MONOTONIC
+    timer.close()
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_timerfd_async_pending(loop):
+    timer = Timerfd_async(loop=loop)
+    timer.every(0, 20000000).after(0, 20000000).update()
+
+    @coroutine
+    def main():
+        # the waiter gives up, the expiration read for it is kept
+        with pytest.raises(asyncio.TimeoutError):
+            yield from asyncio.wait_for(timer.wait(), 0.001)
+        yield from asyncio.sleep(0.03)
+
+        start = time.monotonic()
+        kept = yield from timer.wait()
+        assert time.monotonic() - start < 0.01, 'Kept expiration was not returned immediately'
+
+        # only the first of several waiters receives the count
+        first, second = yield from asyncio.wait_for(asyncio.gather(timer.wait(), timer.wait()), 5)
+        return kept, first, second
+
+    kept, first, second = loop.run_until_complete(main())
+    assert kept == 1
+    assert first >= 1 and second >= 1, 'Second waiter shared the first waiter\'s count'
+    timer.close()
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_timerfd_async_ticks(loop):
+    timer = Timerfd_async(loop=loop)
+    ticks = timer.ticks(0.01)
+
+    @coroutine
+    def main():
+        counts = [(yield from asyncio.wait_for(ticks.next(), 5))]
+        # a stalled caller is told how many ticks it missed
+        time.sleep(0.035)
+        counts.append((yield from asyncio.wait_for(ticks.next(), 5)))
+
+        loop.call_later(0.001, timer.close)
+        counts.append((yield from asyncio.wait_for(ticks.next(), 5)))
+        counts.append((yield from ticks.next()))
+        return counts
+
+    counts = loop.run_until_complete(main())
+    assert counts[0] >= 1
+    assert counts[1] >= 3
+    assert counts[2:] == [None, None], 'Closing the timer did not end the ticks'
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 async iteration")
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.timerfd
+def test_timerfd_async_ticks_aiter(loop):
+    timer = Timerfd_async(loop=loop)
+    ticks = timer.ticks(0.01)
+    assert ticks.__aiter__() is ticks
+
+    @coroutine
+    def main():
+        count = yield from asyncio.wait_for(ticks.__anext__(), 5)
+        timer.close()
+        with pytest.raises(StopAsyncIteration):
+            yield from ticks.__anext__()
+        return count
+
+    assert loop.run_until_complete(main()) >= 1
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.batch import BatchFlusher, SIZE, DEADLINE, MANUAL
+
+from threading import Thread
+
+
+@pytest.mark.unit
+def test_batch_flusher_size():
+    flusher = BatchFlusher(size=100, latency=60)
+    producers = [Thread(target=lambda base=base: [flusher.add(base + i) for i in range(50)])
+                 for base in range(0, 200, 50)]
+    for thread in producers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+
+    # one wakeup for the whole batch, however many records were added
+    batch = flusher.wait(1)
+    assert sorted(batch) == list(range(200))
+    assert flusher.wait(0.01) == []
+    assert flusher.stats.reasons[SIZE] == 1
+    assert flusher.stats.records == 200
+    flusher.close()
+
+
+@pytest.mark.unit
+def test_batch_flusher_deadline():
+    flusher = BatchFlusher(size=100, latency=0.02)
+    assert flusher.wait(0.05) == [], 'an empty buffer never flushes'
+
+    flusher.extend(['a', 'b'])
+    assert flusher.take() == [], 'batch is neither full nor old enough'
+    assert flusher.wait(1) == ['a', 'b']
+    assert flusher.stats.reasons[DEADLINE] == 1
+    assert flusher.stats.latency.min >= 20000000
+
+    # the timer is rearmed for the next batch
+    flusher.add('c')
+    assert flusher.wait(1) == ['c']
+
+    flusher.add('d')
+    assert flusher.flush() == ['d']
+    assert flusher.stats.summary()[MANUAL] == 1
+    assert flusher.stats.flushes == 3
+    flusher.close()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.channel import Channel
+
+from threading import Thread
+
+
+@pytest.mark.unit
+def test_channel_threads():
+    channel = Channel()
+    count = 20000
+    producers = [Thread(target=lambda base=base: [channel.put(base + i) for i in range(count)])
+                 for base in range(0, 4 * count, count)]
+    for thread in producers:
+        thread.start()
+
+    received = []
+    while len(received) < 4 * count:
+        batch = channel.get_batch(5)
+        assert batch, 'items were lost'
+        received.extend(batch)
+
+    for thread in producers:
+        thread.join()
+
+    assert sorted(received) == list(range(4 * count))
+    # order is kept per producer
+    for base in range(0, 4 * count, count):
+        mine = [item for item in received if base <= item < base + count]
+        assert mine == list(range(base, base + count))
+    assert channel.wakeups < 4 * count
+    channel.close()
+
+
+@pytest.mark.unit
+def test_channel_wakeups():
+    channel = Channel()
+    assert channel.get_batch(0.01) == []
+
+    # puts while the consumer is busy share a single wakeup
+    for i in range(100):
+        channel.put(i)
+    channel.put_many([100, 101])
+    assert channel.wakeups == 1
+    assert len(channel) == 102
+    assert channel.get_batch(0) == list(range(102))
+
+    channel.put('next')
+    assert channel.wakeups == 2
+    assert list(zip(range(1), channel)) == [(0, 'next')]
+    channel.close()
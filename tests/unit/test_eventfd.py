@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.eventfd import EventfdSemaphore, Eventfd
+
+import socket
+import time
+import os
+
+
+@pytest.mark.unit
+@pytest.mark.eventfd
+def test_semaphore_tokens():
+    sem = EventfdSemaphore(3)
+    assert sem.value == 3
+    assert sem.try_acquire(2)
+    assert not sem.try_acquire(2), 'acquire is all or nothing'
+    assert sem.value == 1
+    assert sem.take(2) == 1, 'take() reports the tokens available'
+    assert sem.value == 1, 'Partially taken tokens were not given back'
+    assert sem.acquire(1, timeout=0)
+    assert not sem.acquire(timeout=0.01)
+
+    sem.release(3)
+    with sem:
+        assert sem.value == 2
+    assert sem.value == 3
+    sem.close()
+
+    with pytest.raises(ValueError):
+        EventfdSemaphore.from_fd(Eventfd(1))
+
+
+@pytest.mark.unit
+@pytest.mark.eventfd
+def test_semaphore_across_processes():
+    """Forked workers share a concurrency limit, a semaphore can also be sent over a socket"""
+    sem = EventfdSemaphore(2)
+    read_end, write_end = os.pipe()
+
+    children = []
+    for i in range(5):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                with sem:
+                    os.write(write_end, b'+')
+                    time.sleep(0.02)
+                    os.write(write_end, b'-')
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    for pid in children:
+        os.waitpid(pid, 0)
+    os.close(write_end)
+    log = os.read(read_end, 100)
+    os.close(read_end)
+
+    running = peak = 0
+    for change in log.decode():
+        running += 1 if change == '+' else -1
+        peak = max(peak, running)
+    assert len(log) == 10
+    assert peak == 2
+
+    parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    sem.send(parent)
+    copy = EventfdSemaphore.recv(child)
+    assert copy.fileno() != sem.fileno()
+    assert copy.try_acquire(2)
+    assert sem.value == 0
+    copy.close()
+    sem.close()
+    parent.close()
+    child.close()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+
+from butter import _fanotify
+from butter._fanotify import str_to_batch, METADATA_LEN
+from butter.fanotify import FAN_OPEN, FAN_ACCESS
+import struct
+import pytest
+
+
+def pack_event(mask, fd, pid, extra=b''):
+    return struct.pack('=IBBHQii', METADATA_LEN + len(extra), 3, 0, METADATA_LEN, mask, fd, pid) + extra
+
+EVENTS = [(FAN_OPEN, 5, 100), (FAN_ACCESS, 6, 100), (FAN_ACCESS, 7, 200)]
+
+@pytest.fixture(params=['numpy', 'array'])
+def batch_module(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(_fanotify, 'np', None)
+    return _fanotify
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_str_to_batch(batch_module):
+    buf = b''.join(pack_event(*event) for event in EVENTS)
+    batch = batch_module.str_to_batch(buf)
+
+    assert len(batch) == len(EVENTS)
+    assert list(batch['mask']) == [mask for mask, fd, pid in EVENTS]
+    assert list(batch['fd']) == [fd for mask, fd, pid in EVENTS]
+    assert list(batch['pid']) == [pid for mask, fd, pid in EVENTS]
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_str_to_batch_info_records(batch_module):
+    """Records carrying trailing info records are reduced to their metadata"""
+    buf = pack_event(FAN_OPEN, 5, 100, b'\0' * 12) + pack_event(FAN_ACCESS, 6, 200)
+    batch = batch_module.str_to_batch(buf, info_records=True)
+
+    assert list(batch['pid']) == [100, 200]
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_str_to_batch_empty(batch_module):
+    assert len(batch_module.str_to_batch(b'')) == 0
+    assert len(batch_module.str_to_batch(b'', info_records=True)) == 0
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_str_to_batch_zero_copy():
+    np = pytest.importorskip('numpy')
+    buf = bytearray(b''.join(pack_event(*event) for event in EVENTS))
+    batch = str_to_batch(buf)
+
+    assert np.shares_memory(batch, np.frombuffer(buf, dtype=np.uint8)), 'Buffer was copied'
+
+from butter.fanotify import PathResolver
+from tempfile import TemporaryDirectory
+import os
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_path_resolver():
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'file')
+        open(path, 'w').close()
+
+        resolver = PathResolver()
+        fds = [os.open(path, os.O_RDONLY) for i in range(3)]
+        try:
+            assert resolver.resolve_fds(fds) == [path] * 3
+            assert (resolver.misses, resolver.hits) == (1, 2), 'Inode was not cached'
+
+            resolver.invalidate_path(tmp_dir)
+            assert len(resolver) == 0, 'Path beneath a renamed dir was not invalidated'
+
+            os.unlink(path)
+            assert resolver.resolve_fd(fds[0]).endswith('(deleted)')
+            assert len(resolver) == 0, 'Unlinked file was cached'
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_path_resolver_failure_not_cached(monkeypatch):
+    import butter.fanotify
+    def fail(path):
+        raise OSError(24, 'Too many open files')
+
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'file')
+        open(path, 'w').close()
+
+        resolver = PathResolver()
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            with monkeypatch.context() as patch:
+                patch.setattr(butter.fanotify, '_readlink', fail)
+                assert resolver.resolve_fd(fd) == "<Unknown>"
+            assert len(resolver) == 0, 'Failed lookup was cached'
+            assert resolver.resolve_fd(fd) == path
+        finally:
+            os.close(fd)
+
+from butter.fanotify import PermissionResponder, FAN_OPEN_PERM, FAN_ALLOW, FAN_DENY
+from butter._fanotify import FanotifyEvent, RESPONSE_LEN
+from threading import Event
+
+class Pipe_fanotify(object):
+    """Stand in for a Fanotify object that records the responses written to it"""
+    def __init__(self):
+        self.rd, self.wr = os.pipe()
+
+    def fileno(self):
+        return self.wr
+
+    def responses(self):
+        data = os.read(self.rd, 4096)
+        return [struct.unpack_from('=iI', data, i) for i in range(0, len(data), RESPONSE_LEN)]
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_permission_responder():
+    fanotify = Pipe_fanotify()
+    release = Event()
+    def decide(event):
+        if event.pid == 3:
+            release.wait()
+        return event.pid == 1
+
+    responder = PermissionResponder(fanotify, decide, timeout=10)
+    events = [FanotifyEvent(3, FAN_OPEN_PERM, os.open(os.devnull, os.O_RDONLY), pid) for pid in (1, 2, 3)]
+    fds = [event.fd for event in events]
+    other = FanotifyEvent(3, FAN_OPEN, -1, 4)
+
+    assert responder.submit(events + [other], now=0) == [other], 'Non permission event was dispatched'
+    while len(responder._done) < 2:
+        responder._wakeup.wait(1)
+
+    assert responder.flush(now=1) == 2
+    assert sorted(fanotify.responses()) == sorted([(fds[0], FAN_ALLOW), (fds[1], FAN_DENY)])
+    assert events[0].fd is None and events[1].fd is None, 'Answered event fds were not closed'
+
+    # the slow decision times out and gets the default verdict, its fd stays
+    # open until the worker lets go of it
+    assert responder.flush(now=11) == 1
+    assert fanotify.responses() == [(fds[2], FAN_ALLOW)]
+    assert responder.timeouts == 1
+    assert events[2].fd is not None
+
+    release.set()
+    responder.close()
+    assert events[2].fd is None
+    assert responder.decisions == 3
+    assert responder.latency_max == 11
+
+from butter._fanotify import str_to_events, FanotifyFid
+from butter.fanotify import FAN_CREATE, FAN_ONDIR, FAN_NOFD, FAN_EVENT_INFO_TYPE_DFID_NAME, FAN_EVENT_INFO_TYPE_FID
+
+def pack_fid(info_type, handle, name=None):
+    record = struct.pack('=ii', 1, 2) + struct.pack('=Ii', len(handle), 1) + handle
+    if name is not None:
+        record += name + b'\0'
+    record += b'\0' * (-(len(record) + 4) % 4)
+    return struct.pack('=BBH', info_type, 0, len(record) + 4) + record
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_str_to_events_fid():
+    info = pack_fid(FAN_EVENT_INFO_TYPE_DFID_NAME, b'dirhandle', b'name') + pack_fid(FAN_EVENT_INFO_TYPE_FID, b'handle')
+    buf = pack_event(FAN_CREATE|FAN_ONDIR, FAN_NOFD, 100, info) + pack_event(FAN_OPEN, 5, 100)
+
+    fid_event, fd_event = str_to_events(buf)
+
+    assert fid_event.create_event and fid_event.on_dir_event
+    assert fid_event.fd == FAN_NOFD
+    dfid, fid = fid_event.fids
+    assert dfid == FanotifyFid(FAN_EVENT_INFO_TYPE_DFID_NAME, (1, 2), struct.pack('=Ii', 9, 1) + b'dirhandle', b'name')
+    assert fid == FanotifyFid(FAN_EVENT_INFO_TYPE_FID, (1, 2), struct.pack('=Ii', 6, 1) + b'handle', None)
+    assert fd_event.fids == () and fd_event.fd == 5
+
+
+from butter.fanotify import AdaptiveIgnore, FAN_MODIFY, FAN_MARK_IGNORED_SURV_MODIFY
+
+class Recording_fanotify(object):
+    def __init__(self):
+        self.ignored = {}
+
+    def add_ignore_mask(self, path, mask, flags=0):
+        self.ignored[os.stat(path).st_ino] = (mask, flags)
+
+    def remove_ignore_mask(self, path, mask, flags=0):
+        del self.ignored[os.stat(path).st_ino]
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_adaptive_ignore():
+    with TemporaryDirectory() as tmp_dir:
+        hot = os.path.join(tmp_dir, 'hot')
+        cold = os.path.join(tmp_dir, 'cold')
+        open(hot, 'w').close()
+        open(cold, 'w').close()
+        hot_ino = os.stat(hot).st_ino
+
+        fanotify = Recording_fanotify()
+        suppressor = AdaptiveIgnore(fanotify, threshold=10, window=1.0, expiry=5.0)
+
+        events = lambda path, n: [FanotifyEvent(3, FAN_MODIFY, os.open(path, os.O_RDONLY), 1) for i in range(n)]
+
+        # spread over two windows the cold file never goes over the threshold
+        assert len(suppressor.observe(events(cold, 8), now=0.0)) == 8
+        assert len(suppressor.observe(events(cold, 8), now=1.9)) == 8
+        assert fanotify.ignored == {}
+
+        assert len(suppressor.observe(events(hot, 11), now=2.0)) == 11
+        assert fanotify.ignored == {hot_ino: (FAN_MODIFY, FAN_MARK_IGNORED_SURV_MODIFY)}
+
+        # already queued events are dropped once a file is silenced
+        assert suppressor.observe(events(hot, 3), now=2.1) == []
+        assert suppressor.dropped == 3
+
+        assert suppressor.next_expiry(now=3.0) == 4.0
+        assert suppressor.expire(now=6.9) == 0
+        assert suppressor.expire(now=7.0) == 1
+        assert fanotify.ignored == {}
+        assert len(suppressor) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_adaptive_ignore_no_fd():
+    """Closed events and FAN_NOFD events are passed through uncounted"""
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'file')
+        open(path, 'w').close()
+
+        suppressor = AdaptiveIgnore(Recording_fanotify(), threshold=1)
+        closed = FanotifyEvent(3, FAN_MODIFY, os.open(path, os.O_RDONLY), 1)
+        closed.close()
+        events = [closed, FanotifyEvent(3, FAN_MODIFY, -1, 1)]
+
+        assert suppressor.observe(events * 2, now=0.0) == events * 2
+        assert len(suppressor) == 0
+
+from butter.fanotify import CountMinSketch, AccessAggregator, AccessCount
+from butter._fanotify import FanotifyBatch
+from array import array
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_count_min_sketch():
+    sketch = CountMinSketch(width=16, depth=4)
+    for i in range(100):
+        sketch.add(('hot',))
+    for i in range(50):
+        sketch.add(i)
+
+    assert sketch[('hot',)] >= 100, 'Count-min sketches never underestimate'
+    assert sketch[('hot',)] < 150
+    sketch.clear()
+    assert sketch[('hot',)] == 0
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_access_aggregator():
+    snapshots = []
+    with TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, name) for name in ('a', 'b', 'c')]
+        for path in paths:
+            open(path, 'w').close()
+
+        aggregator = AccessAggregator(None, snapshots.append, k=2, interval=10)
+
+        def batch(path, pid, n):
+            fds = array('i', [os.open(path, os.O_RDONLY) for i in range(n)])
+            return FanotifyBatch(None, None, None, None, array('Q', [FAN_OPEN] * n), fds, array('i', [pid] * n))
+
+        aggregator.observe_batch(batch(paths[0], 10, 5))
+        aggregator.observe_batch(batch(paths[1], 10, 1))
+        # c displaces b, the least accessed entry
+        aggregator.observe_batch(batch(paths[2], 20, 3))
+        aggregator.observe([FanotifyEvent(3, FAN_ACCESS, os.open(paths[0], os.O_RDONLY), 10)])
+
+        assert aggregator.events == 10
+        assert not aggregator.maybe_snapshot(now=0)
+        assert aggregator.maybe_snapshot(now=aggregator._next_snapshot)
+
+    assert snapshots == [[AccessCount(10, paths[0], FAN_OPEN, 5),
+                          AccessCount(20, paths[2], FAN_OPEN, 3),
+                          ]]
+    assert aggregator.snapshot() == [], 'Counts should reset after a snapshot'
+
+
+from butter.fanotify import ContentHasher, HashRecord, FAN_CLOSE_WRITE
+import hashlib
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_content_hasher():
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data')
+        with open(path, 'wb') as f:
+            f.write(b'butter' * 1000)
+        st = os.stat(path)
+        expected = HashRecord(path, hashlib.sha256(b'butter' * 1000).hexdigest(), st.st_size, st.st_mtime_ns)
+
+        event = lambda: FanotifyEvent(3, FAN_CLOSE_WRITE, os.open(path, os.O_RDONLY), 1)
+        hasher = ContentHasher(workers=1)
+
+        futures, others = hasher.submit([event(), event(), FanotifyEvent(3, FAN_OPEN, -1, 1)])
+        assert len(others) == 1
+        assert [future.result(10) for future in futures] == [expected, expected]
+        assert hasher.misses == 1, 'Identical files in flight should only be hashed once'
+
+        # unchanged files come straight from the cache
+        assert hasher.hash_event(event()).result(0) == expected
+        assert hasher.hits == 2
+
+        dir_event = FanotifyEvent(3, FAN_CLOSE_WRITE, os.open(tmp_dir, os.O_RDONLY), 1)
+        assert hasher.hash_event(dir_event).result(0) is None
+
+        hasher.close()
+
+def _crash(path, algorithm):
+    os._exit(1)
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_content_hasher_broken_pool(monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+    import butter.fanotify
+
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data')
+        with open(path, 'wb') as f:
+            f.write(b'butter')
+        event = lambda: FanotifyEvent(3, FAN_CLOSE_WRITE, os.open(path, os.O_RDONLY), 1)
+        hasher = ContentHasher(workers=1)
+
+        with monkeypatch.context() as patch:
+            # the worker dies mid job as if it took a SIGBUS
+            patch.setattr(butter.fanotify, '_hash_path', _crash)
+            future = hasher.hash_event(event())
+            pool = hasher._pool
+            with pytest.raises(BrokenProcessPool):
+                future.result(10)
+
+        assert hasher._pool is None, 'Broken pool was kept'
+        assert pool._shutdown_thread, 'Broken pool was not shut down'
+        assert hasher.hash_event(event()).result(10).digest == hashlib.sha256(b'butter').hexdigest()
+
+        hasher.close()
+
+
+from butter.fanotify import FdGauge, close_all
+
+@pytest.mark.unit
+@pytest.mark.fanotify
+def test_event_lifecycle():
+    gauge = FdGauge()
+    events = [FanotifyEvent(3, FAN_OPEN, os.open('/', os.O_RDONLY), 1, gauge=gauge) for i in range(3)]
+    events.append(FanotifyEvent(3, FAN_CREATE, FAN_NOFD, 1, gauge=gauge))
+    assert gauge.live == 3, 'FAN_NOFD events do not hold an fd'
+
+    with events[0] as event:
+        assert event.fd >= 0
+    assert events[0].fd is None
+    assert gauge.live == 2
+
+    fd = events[1].detach()
+    assert gauge.live == 1, 'Detached fds are no longer the event\'s responsibility'
+    os.close(fd)
+
+    close_all(events)
+    close_all(events)
+    assert gauge.live == 0
+    assert gauge.closed == 3
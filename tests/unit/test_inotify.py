@@ -18,3 +18,144 @@ def test_watch():
         event = watch(tmp_dir)
         
         proc.wait()
+
+from butter.inotify import MovePairer, InotifyEvent, InotifyMoveEvent
+from butter.inotify import IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_ISDIR, IN_MODIFY
+
+@pytest.mark.unit
+def test_move_pairing():
+    pairer = MovePairer(timeout=1)
+    events = [InotifyEvent(1, IN_MOVED_FROM|IN_ISDIR, 7, b'old'),
+              InotifyEvent(1, IN_MODIFY, 0, b'other'),
+              InotifyEvent(2, IN_MOVED_TO|IN_ISDIR, 7, b'new'),
+              ]
+
+    paired = pairer.pair(events, now=0)
+
+    assert len(paired) == 2, 'Move was not collapsed into a single event'
+    assert paired[0].mask == IN_MODIFY
+    move = paired[1]
+    assert isinstance(move, InotifyMoveEvent)
+    assert (move.old_path, move.new_path) == (b'old', b'new')
+    assert (move.old_wd, move.new_wd) == (1, 2)
+    assert move.is_dir_event
+    assert len(pairer) == 0
+
+@pytest.mark.unit
+def test_move_unpaired():
+    pairer = MovePairer(timeout=1)
+
+    assert pairer.pair([InotifyEvent(1, IN_MOVED_FROM, 3, b'gone')], now=0) == []
+    assert pairer.next_expiry(now=0.25) == 0.75
+    assert pairer.expire(now=0.5) == [], 'Half expired before its timeout'
+
+    expired = pairer.expire(now=1)
+    assert expired == [InotifyEvent(1, IN_DELETE, 3, b'gone')]
+    assert pairer.next_expiry() is None
+
+    created = pairer.pair([InotifyEvent(1, IN_MOVED_TO, 4, b'arrived')], now=2)
+    assert created == [InotifyEvent(1, IN_CREATE, 4, b'arrived')]
+
+class _Watches(object):
+    """Stands in for an Inotify object watching a single directory"""
+    def __init__(self, path):
+        self.path = path
+
+    def watched_path(self, wd):
+        return self.path
+
+@pytest.mark.unit
+def test_move_pairing_undecodable_path():
+    pairer = MovePairer(_Watches(os.fsdecode(b'/tmp/\xff')), timeout=1)
+
+    paired = pairer.pair([InotifyEvent(1, IN_MOVED_FROM, 5, b'old'),
+                          InotifyEvent(1, IN_MOVED_TO, 5, b'new'),
+                          ], now=0)
+
+    move = paired[0]
+    assert (move.old_path, move.new_path) == (b'/tmp/\xff/old', b'/tmp/\xff/new')
+
+from butter.inotify import Inotify, IN_Q_OVERFLOW, IN_ATTRIB, IN_NONBLOCK
+from select import select
+import shutil
+
+def _overflow(inotify, noise_dir, changes):
+    """Fill the queue with events from noise_dir so the ones caused by
+    changes() are lost, then read everything back"""
+    names = [os.path.join(noise_dir, name) for name in ('a', 'b')]
+    for name in names:
+        open(name, 'w').close()
+    inotify.watch(noise_dir, IN_ATTRIB)
+
+    with open('/proc/sys/fs/inotify/max_queued_events') as f:
+        limit = int(f.read())
+    # alternate between two files so the kernel can not merge the events
+    for i in range(limit + 1):
+        os.utime(names[i % 2], None)
+    changes()
+
+    events = []
+    while select([inotify], [], [], 0)[0]:
+        events.extend(inotify.read_events())
+    return events
+
+def _recovered(events):
+    masks = [event.mask for event in events]
+    assert IN_Q_OVERFLOW in masks, 'Queue did not overflow'
+    return set(events[masks.index(IN_Q_OVERFLOW) + 1:])
+
+@pytest.mark.unit
+def test_overflow_recovery():
+    with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as noise_dir:
+        with open(os.path.join(tmp_dir, 'modified'), 'w') as f:
+            f.write('a')
+        open(os.path.join(tmp_dir, 'deleted'), 'w').close()
+
+        inotify = Inotify(IN_NONBLOCK, recover_overflow=True)
+        wd = inotify.watch(tmp_dir, IN_CREATE|IN_DELETE|IN_MODIFY)
+
+        def changes():
+            os.mkdir(os.path.join(tmp_dir, 'created'))
+            os.unlink(os.path.join(tmp_dir, 'deleted'))
+            with open(os.path.join(tmp_dir, 'modified'), 'w') as f:
+                f.write('abc')
+
+        events = _overflow(inotify, noise_dir, changes)
+        inotify.close()
+
+    assert _recovered(events) == {InotifyEvent(wd, IN_CREATE|IN_ISDIR, 0, b'created'),
+                                  InotifyEvent(wd, IN_DELETE, 0, b'deleted'),
+                                  InotifyEvent(wd, IN_MODIFY, 0, b'modified'),
+                                  }
+
+@pytest.mark.unit
+def test_overflow_recovery_vanished():
+    with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as noise_dir:
+        subdir = os.path.join(tmp_dir, 'sub')
+        os.makedirs(os.path.join(subdir, 'nested'))
+        open(os.path.join(subdir, 'file'), 'w').close()
+
+        inotify = Inotify(IN_NONBLOCK, recover_overflow=True)
+        wd = inotify.watch(tmp_dir, IN_CREATE|IN_DELETE)
+        sub_wd = inotify.watch(subdir, IN_CREATE|IN_DELETE)
+
+        events = _overflow(inotify, noise_dir, lambda: shutil.rmtree(subdir))
+        inotify.close()
+
+    recovered = _recovered(events)
+    assert InotifyEvent(wd, IN_DELETE|IN_ISDIR, 0, b'sub') in recovered
+    assert InotifyEvent(sub_wd, IN_DELETE|IN_ISDIR, 0, b'nested') in recovered
+    assert InotifyEvent(sub_wd, IN_DELETE, 0, b'file') in recovered
+
+@pytest.mark.unit
+def test_snapshot_undecodable_path():
+    from butter.inotify import _DirSnapshot
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, os.fsdecode(b'\xff'))
+        os.mkdir(path)
+        open(os.path.join(path, 'file'), 'w').close()
+
+        snapshot = _DirSnapshot(path, IN_CREATE)
+        assert snapshot.path == os.fsencode(tmp_dir) + b'/\xff'
+        assert snapshot.scan()
+        assert list(snapshot.entries) == [b'file']
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.pidfd import Pidfd, PIDFD_NONBLOCK
+from butter.utils import TimeoutError
+
+import resource
+import signal
+import os
+
+
+def fork_child(returncode=None):
+    """Fork a child that exits with 'returncode', or waits to be killed if None
+
+    The child is reaped by the Pidfd under test, so plain fork() is used
+    rather than subprocess.Popen which would also try to wait() on it
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            while returncode is None:
+                signal.pause()
+        finally:
+            os._exit(returncode or 0)
+    return pid
+
+
+@pytest.mark.unit
+def test_pidfd_child():
+    pidfd = Pidfd(fork_child(), PIDFD_NONBLOCK)
+    assert not pidfd.exited()
+    with pytest.raises(TimeoutError):
+        pidfd.wait(0.01)
+    with pytest.raises(OSError):
+        pidfd.read_event()
+
+    pidfd.terminate()
+    assert pidfd.wait(5) == -signal.SIGTERM
+    assert pidfd.returncode == -signal.SIGTERM
+    with pytest.raises(ValueError):
+        pidfd.send_signal(signal.SIGTERM)
+    pidfd.close()
+
+
+@pytest.mark.unit
+def test_pidfd_exit_code():
+    pidfd = Pidfd(fork_child(7))
+    assert pidfd.wait(5) == 7
+    pidfd.close()
+
+
+@pytest.mark.unit
+def test_pidfd_getfd():
+    read_end, write_end = os.pipe()
+    pidfd = Pidfd(fork_child())
+    os.close(write_end)
+
+    # write to the pipe through the child's copy of the fd
+    fd = pidfd.getfd(write_end)
+    os.write(fd, b'x')
+    os.close(fd)
+    assert os.read(read_end, 1) == b'x'
+
+    pidfd.kill()
+    assert pidfd.wait(5) == -signal.SIGKILL
+    pidfd.close()
+    os.close(read_end)
+
+
+@pytest.mark.unit
+def test_pidfd_high_fd():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    limit = 1100
+    if soft < limit:
+        if hard != resource.RLIM_INFINITY and hard < limit:
+            pytest.skip("RLIMIT_NOFILE is too low to open more than 1024 fds")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+    # push the pidfd above FD_SETSIZE where select() can not be used
+    fds = []
+    pidfd = None
+    try:
+        while not fds or fds[-1] < 1024:
+            fds.append(os.open(os.devnull, os.O_RDONLY))
+        pidfd = Pidfd(fork_child())
+        assert pidfd.fileno() >= 1024
+        assert not pidfd.exited()
+        with pytest.raises(TimeoutError):
+            pidfd.wait(0.01)
+    finally:
+        if pidfd is not None:
+            pidfd.kill()
+            assert pidfd.wait(5) == -signal.SIGKILL
+            pidfd.close()
+        for fd in fds:
+            os.close(fd)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+@pytest.mark.unit
+def test_pidfd_missing():
+    with pytest.raises(ValueError):
+        Pidfd(2**22 + 1)
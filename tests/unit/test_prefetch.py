@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.prefetch import readahead, resident_ranges, save_manifest, load_manifest, replay, PAGE_SIZE
+
+from tempfile import TemporaryDirectory
+import os
+
+
+@pytest.mark.unit
+def test_readahead_resident():
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'data')
+        size = PAGE_SIZE * 4 + 10
+        with open(path, 'wb') as f:
+            f.write(b'a' * size)
+
+        fd = os.open(path, os.O_RDONLY)
+        readahead(fd, 0, size)
+        # freshly written pages are in the page cache, the last partial page
+        # is trimmed to the end of the file
+        assert resident_ranges(fd, size) == [(0, size)]
+        assert resident_ranges(fd, 0) == []
+        os.close(fd)
+
+    r, w = os.pipe()
+    with pytest.raises(ValueError):
+        readahead(r, 0, 10)
+    os.close(r)
+    os.close(w)
+
+
+@pytest.mark.unit
+def test_manifest_replay():
+    with TemporaryDirectory() as tmp_dir:
+        first = os.path.join(tmp_dir, 'with space')
+        second = os.path.join(tmp_dir, 'second')
+        for path in (first, second):
+            with open(path, 'wb') as f:
+                f.write(b'a' * 100)
+
+        entries = [(second, 0, 50), (first, 0, 100), (second, 50, 50),
+                   (os.path.join(tmp_dir, 'missing'), 0, 100)]
+        manifest = os.path.join(tmp_dir, 'manifest')
+        save_manifest(manifest, entries)
+        assert load_manifest(manifest) == entries
+
+        assert replay(manifest) == 200, 'Missing files should be skipped'
+
+        with pytest.raises(ValueError):
+            load_manifest(first)
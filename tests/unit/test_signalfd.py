@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.signalfd import Signalfd, Signal, SFD_NONBLOCK
+
+import signal
+import os
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_signalfd_batched_read():
+    """Queued signals are read in as few syscalls as read_max allows"""
+    rt_signal = signal.SIGRTMIN + 1
+    signals = [rt_signal, signal.SIGUSR2]
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    try:
+        sfd = Signalfd(flags=SFD_NONBLOCK, read_max=4)
+        sfd.enable(signals)
+
+        # real time signals queue rather than merge
+        for i in range(5):
+            os.kill(os.getpid(), rt_signal)
+        os.kill(os.getpid(), signal.SIGUSR2)
+
+        first = sfd.read_events()
+        assert len(first) == 4
+        rest = sfd.read_events()
+        assert len(rest) == 2
+
+        received = first + rest
+        assert sorted(sig.signal for sig in received) == sorted([rt_signal] * 5 + [signal.SIGUSR2])
+        for sig in received:
+            assert isinstance(sig, Signal)
+            assert sig.pid == os.getpid()
+            assert sig.uid == os.getuid()
+            assert sig.signal_code == 0 # SI_USER
+        sfd.close()
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_signalfd_initial_mask():
+    sfd = Signalfd([signal.SIGUSR1, signal.SIGUSR2])
+    assert signal.SIGUSR1 in sfd
+    assert signal.SIGUSR2 in sfd
+    assert signal.SIGHUP not in sfd
+    sfd.close()
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_rt_signal_channel():
+    from butter.signalfd import RtSignalChannel, RtMessage, SIGRTMIN, sigqueue
+
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    try:
+        channel = RtSignalChannel(2, read_max=8)
+        assert channel.signal == SIGRTMIN + 2
+
+        values = [0, 1, 2**32 + 5, 2**64 - 1] + list(range(10, 20))
+        for value in values:
+            RtSignalChannel.send(os.getpid(), value, channel=2)
+
+        messages = channel.read_events()
+        assert len(messages) == 8, 'read_max bounds a single read'
+        messages += channel.read_events()
+        assert [msg.value for msg in messages] == values
+        assert messages[0] == RtMessage(os.getpid(), os.getuid(), 0)
+
+        # the low 32 bits are also available as a signed int
+        sigqueue(os.getpid(), channel.signal, -2)
+        info = channel._signalfd.read_event()
+        assert info.value == -2
+        assert info.signal_code == -1 # SI_QUEUE
+
+        channel.close()
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+    with pytest.raises(ValueError):
+        RtSignalChannel.channel_signal(100)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.supervisor import Supervisor, ChildExit
+
+import signal
+import sys
+import os
+
+
+@pytest.fixture
+def supervisor():
+    old_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    supervisor = Supervisor()
+    yield supervisor
+    supervisor.close()
+    signal.pthread_sigmask(signal.SIG_SETMASK, old_mask)
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_supervisor_reaps_all(supervisor):
+    exits = {}
+    procs = [supervisor.spawn([sys.executable, '-c', 'import sys; sys.exit({})'.format(i % 4)],
+                              lambda child: exits.__setitem__(child.pid, child))
+             for i in range(20)]
+    sleeper = supervisor.spawn(['sleep', '60'], lambda child: exits.__setitem__(child.pid, child))
+    assert len(supervisor) == 21
+
+    sleeper.kill()
+    supervisor.run()
+
+    assert len(exits) == 21
+    for i, proc in enumerate(procs):
+        assert exits[proc.pid].returncode == i % 4
+        assert proc.returncode == i % 4, 'Popen should see the reaped status'
+        assert exits[proc.pid].rusage.ru_utime >= 0
+    assert exits[sleeper.pid].returncode == -signal.SIGKILL
+    assert supervisor.reaped == 21
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_supervisor_child_unblocked(supervisor):
+    """Children do not inherit the blocked SIGCHLD"""
+    exits = []
+    code = "import signal, sys; sys.exit(signal.SIGCHLD in signal.pthread_sigmask(signal.SIG_BLOCK, []))"
+    supervisor.spawn([sys.executable, '-c', code], exits.append)
+    supervisor.run()
+    assert exits[0].returncode == 0
+
+
+@pytest.mark.unit
+@pytest.mark.signalfd
+def test_supervisor_watch_after_exit(supervisor):
+    """A child reaped before it was watched is reported on watch()"""
+    pid = os.fork()
+    if pid == 0:
+        os._exit(7)
+
+    assert supervisor.run_once(5) == [ChildExit(pid, 7 << 8, 7, supervisor._unclaimed[pid].rusage)]
+    exits = []
+    supervisor.watch(pid, exits.append)
+    assert exits[0].returncode == 7
+    assert len(supervisor) == 0
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.timerfd import TimerWheel, Timer, Histogram, TimerStats, DeadlineScheduler
+from butter.timerfd import CLOCK_MONOTONIC, CLOCK_REALTIME
+
+from time import sleep, time
+import random
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_wheel_exact():
+    """Timers on every level of the wheel fire on exactly their deadline tick"""
+    wheel = TimerWheel(tick=1)
+    wheel._now_ns = lambda: wheel._start_ns
+
+    rand = random.Random(1)
+    handles = []
+    for i in range(2000):
+        delay = rand.choice([rand.randint(1, 300), rand.randint(1, 70000), rand.randint(1, 2**25)])
+        handles.append(wheel.schedule(delay, lambda: None))
+    cancelled = handles[::7]
+    for handle in cancelled:
+        wheel.cancel(handle)
+    assert len(wheel) == len(handles) - len(cancelled)
+
+    fired = []
+    for deadline in sorted(set(handle.deadline for handle in handles)):
+        for handle in wheel.advance(deadline):
+            assert handle.deadline == deadline
+            fired.append(handle)
+
+    assert len(fired) == len(handles) - len(cancelled)
+    assert not any(handle in fired for handle in cancelled)
+    assert len(wheel) == 0
+    wheel.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_wheel_run():
+    wheel = TimerWheel(tick=0.001)
+    fired = []
+
+    first = wheel.schedule(0.002, fired.append, 'first')
+    second = wheel.schedule(0.001, fired.append, 'second')
+    cancelled = wheel.schedule(0.001, fired.append, 'cancelled')
+    wheel.cancel(cancelled)
+    wheel.reschedule(second, 0.01)
+    assert not cancelled.pending
+
+    while len(wheel):
+        wheel.run_once(1)
+
+    assert fired == ['first', 'second']
+    assert wheel.overruns >= 0
+    wheel.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_wheel_overrun():
+    """Servicing the wheel late is reported and the missed ticks caught up on"""
+    wheel = TimerWheel(tick=0.001)
+    fired = []
+    wheel.schedule(0.001, fired.append, 'early')
+    wheel.schedule(0.005, fired.append, 'late')
+
+    sleep(0.02)
+    wheel.run_once(1)
+
+    assert fired == ['early', 'late']
+    assert wheel.overruns >= 10
+    wheel.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_histogram():
+    hist = Histogram()
+    assert hist.percentile(50) is None
+
+    for value in range(1, 100001):
+        hist.record(value)
+
+    assert hist.count == 100000
+    assert (hist.min, hist.max) == (1, 100000)
+    for percent in (50, 99, 99.9):
+        exact = 100000 * percent / 100
+        assert abs(hist.percentile(percent) - exact) <= exact / 8, 'Outside the histogram\'s error bound'
+
+    hist.record(-5) # clamped
+    assert hist.min == 0
+    assert hist.percentile(0.0001) == 0
+
+    hist.clear()
+    assert len(hist) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_stats():
+    stats = TimerStats()
+    stats.armed(1000, 100)
+
+    stats.expired(1010, 1)
+    stats.handler_done(1030)
+    # two expirations folded into one read, the latest was due at 1200
+    stats.expired(1250, 2)
+
+    assert stats.expirations == 3
+    assert stats.missed == 1
+    assert stats.jitter.count == 2
+    assert (stats.jitter.min, stats.jitter.max) == (10, 50)
+    assert stats.runtime.max == 20
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_enable_stats():
+    timer = Timer()
+    stats = timer.enable_stats()
+    timer.every(0, 2000000).after(0, 2000000).update()
+
+    for i in range(3):
+        timer.wait()
+    timer.close()
+
+    assert stats.expirations >= 3
+    assert stats.jitter.count + stats.early == 3
+    assert stats.runtime.count == 2
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_timer_stats_absolute_realtime():
+    timer = Timer(CLOCK_REALTIME)
+    timer.enable_stats()
+    timer.after(int(time()) + 60, 0)
+
+    with pytest.raises(ValueError):
+        timer.update(absolute=True)
+    current = timer.get_current()
+    timer.close()
+
+    assert tuple(current.next_event) == (0, 0), \
+        'Timer was armed by a rejected update'
+
+
+from butter.timerfd import RateLimiter
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_rate_limiter():
+    limiter = RateLimiter(rate=1000, capacity=10, period=0.001)
+    limiter.configure('slow', rate=10, capacity=2)
+
+    assert limiter.try_acquire('fast', 10), 'Buckets start full'
+    assert not limiter.try_acquire('fast')
+    assert limiter.try_acquire('slow', 2)
+    assert not limiter.acquire('slow', timeout=0.01), 'Slow bucket should take 0.1s to refill'
+
+    with pytest.raises(ValueError):
+        limiter.try_acquire('slow', 3)
+
+    start = time()
+    for i in range(20):
+        limiter.acquire('fast')
+    assert time() - start < 0.5
+
+    # refills are exact even if nobody looked at the bucket for a while
+    sleep(0.05)
+    assert limiter.tokens('fast') == 10
+    assert len(limiter) == 2
+    limiter.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_deadline_scheduler():
+    scheduler = DeadlineScheduler(CLOCK_MONOTONIC)
+    fired = []
+
+    now = scheduler.time()
+    late = scheduler.at(now + 0.02, fired.append, 'late')
+    scheduler.at(now + 0.01, fired.append, 'early')
+    cancelled = scheduler.at(now + 0.01, fired.append, 'cancelled')
+    scheduler.cancel(cancelled)
+    assert len(scheduler) == 2
+    assert scheduler.next_deadline() == pytest.approx(now + 0.01)
+
+    while len(scheduler):
+        scheduler.run_once(1)
+    assert fired == ['early', 'late']
+    assert scheduler.time() >= late.when
+    assert scheduler.next_deadline() is None
+    scheduler.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_deadline_scheduler_every():
+    """Repeating jobs run on multiples of their interval, skip missed runs and realign on clock jumps"""
+    scheduler = DeadlineScheduler(CLOCK_MONOTONIC)
+    clock = [10 * 1000000000]
+    scheduler._now_ns = lambda: clock[0]
+    fired = []
+
+    job = scheduler.every(5, fired.append, 'tick')
+    assert job.deadline == 15 * 1000000000
+
+    clock[0] = 15 * 1000000000
+    assert scheduler.run_pending() == [job]
+    assert job.deadline == 20 * 1000000000
+
+    # stalled through two runs
+    clock[0] = 31 * 1000000000
+    scheduler.run_pending()
+    assert fired == ['tick', 'tick']
+    assert job.missed == 2
+    assert job.deadline == 35 * 1000000000
+
+    # the clock was set back an hour
+    clock[0] = 31 * 1000000000 - 3600 * 1000000000
+    scheduler._clock_changed()
+    assert scheduler.clock_jumps == 1
+    assert job.deadline == 35 * 1000000000 - 3600 * 1000000000
+
+    scheduler.cancel(job)
+    assert len(scheduler) == 0
+    assert scheduler.run_pending() == []
+    scheduler.close()
+
+
+@pytest.mark.unit
+@pytest.mark.timerfd
+def test_deadline_scheduler_many():
+    scheduler = DeadlineScheduler()
+    fired = []
+    now = scheduler.time()
+    rand = random.Random(1)
+    jobs = [scheduler.at(now + rand.random() * 0.05, fired.append, i) for i in range(50000)]
+    for job in jobs[::3]:
+        scheduler.cancel(job)
+
+    while len(scheduler):
+        scheduler.run_once(1)
+
+    expected = [i for i, job in sorted(enumerate(jobs), key=lambda item: item[1].deadline) if i % 3]
+    assert fired == expected
+    scheduler.close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import pytest
+from butter.watcher import FileWatcher, FileEvent, CREATE, DELETE
+from butter.utils import TimeoutError
+
+from tempfile import TemporaryDirectory
+import os
+
+
+@pytest.mark.unit
+def test_watcher_inotify_recursive():
+    with TemporaryDirectory() as tmp_dir:
+        os.mkdir(os.path.join(tmp_dir, 'existing'))
+        watcher = FileWatcher(tmp_dir, backend='inotify')
+        assert watcher.backend == 'inotify'
+
+        nested = os.path.join(tmp_dir, 'existing', 'nested')
+        open(nested, 'w').close()
+        os.unlink(nested)
+
+        events = watcher.read_events()
+        assert events == [FileEvent(CREATE, nested, False),
+                          FileEvent(DELETE, nested, False),
+                          ]
+
+        # a new directory is followed, including entries created before its
+        # watch was in place
+        new_dir = os.path.join(tmp_dir, 'new')
+        os.mkdir(new_dir)
+        with open(os.path.join(new_dir, 'early'), 'w') as f:
+            f.write('a')
+
+        events = []
+        try:
+            while True:
+                events.append(watcher.wait(0.1))
+        except TimeoutError:
+            pass
+        assert FileEvent(CREATE, new_dir, True) in events
+        assert FileEvent(CREATE, os.path.join(new_dir, 'early'), False) in events
+
+        watcher.close()
+
+
+@pytest.mark.unit
+def test_watcher_bad_action():
+    with pytest.raises(ValueError):
+        FileWatcher('/', actions=['bogus'], backend='inotify')
+
+
+def _drain(watcher, timeout=0.1):
+    events = []
+    try:
+        while True:
+            events.append(watcher.wait(timeout))
+    except TimeoutError:
+        pass
+    return events
+
+
+@pytest.mark.unit
+def test_watcher_filtered_timeout():
+    with TemporaryDirectory() as tmp_dir:
+        # the create is read from the kernel but not reported
+        watcher = FileWatcher(tmp_dir, actions=[DELETE], backend='inotify')
+        open(os.path.join(tmp_dir, 'created'), 'w').close()
+
+        with pytest.raises(TimeoutError):
+            watcher.wait(0.1)
+
+        # a read that matches nothing does not block
+        another = os.path.join(tmp_dir, 'another')
+        open(another, 'w').close()
+        assert watcher.read_events() == []
+        assert watcher.read_events() == []
+        os.unlink(another)
+        assert watcher.read_event() == FileEvent(DELETE, another, False)
+
+        # raw events that never produce a FileEvent (IN_IGNORED)
+        sub = os.path.join(tmp_dir, 'sub')
+        os.mkdir(sub)
+        _drain(watcher)
+        os.rmdir(sub)
+        assert watcher.wait(0.1) == FileEvent(DELETE, sub, True)
+        with pytest.raises(TimeoutError):
+            watcher.wait(0.1)
+
+        watcher.close()
+
+
+from butter.watcher import MOVED_FROM, MOVED_TO
+
+def _kernel_watches(watcher):
+    with open('/proc/self/fdinfo/{}'.format(watcher.fileno())) as f:
+        return sum(1 for line in f if line.startswith('inotify wd:'))
+
+
+@pytest.mark.unit
+def test_watcher_inotify_rename():
+    with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as outside:
+        old = os.path.join(tmp_dir, 'old')
+        os.makedirs(os.path.join(old, 'nested'))
+        watcher = FileWatcher(tmp_dir, backend='inotify')
+
+        new = os.path.join(tmp_dir, 'new')
+        os.rename(old, new)
+        assert _drain(watcher) == [FileEvent(MOVED_FROM, old, True),
+                                   FileEvent(MOVED_TO, new, True),
+                                   ]
+
+        # the watches followed the directory
+        path = os.path.join(new, 'nested', 'file')
+        open(path, 'w').close()
+        assert _drain(watcher) == [FileEvent(CREATE, path, False)]
+
+        # moved out of the tree, its watches are removed
+        os.rename(new, os.path.join(outside, 'gone'))
+        assert _drain(watcher) == [FileEvent(MOVED_FROM, new, True)]
+        assert _kernel_watches(watcher) == 1
+        assert len(watcher._backend._paths) == 1, 'Watches of a moved out directory were kept'
+
+        # deleted, the kernel drops the watch and so do we
+        sub = os.path.join(tmp_dir, 'sub')
+        os.mkdir(sub)
+        _drain(watcher)
+        assert len(watcher._backend._paths) == 2
+        os.rmdir(sub)
+        assert _drain(watcher) == [FileEvent(DELETE, sub, True)]
+        assert len(watcher._backend._paths) == 1, 'Watch of a deleted directory was kept'
+
+        watcher.close()
+
+
+@pytest.mark.unit
+def test_watcher_inotify_undecodable_name():
+    with TemporaryDirectory() as tmp_dir:
+        watcher = FileWatcher(tmp_dir, backend='inotify')
+        path = os.path.join(os.fsencode(tmp_dir), b'\xff')
+        open(path, 'w').close()
+
+        event = watcher.wait(1)
+        assert os.fsencode(event.path) == path
+
+        watcher.close()